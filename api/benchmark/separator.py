@@ -0,0 +1,350 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import resource
+import struct
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from io import BytesIO
+from multiprocessing import get_context
+from typing import Dict, List
+
+import numpy as np
+
+from api.separator import Separator, SpleeterSeparator
+from api.separator.chunk import OverlapAdd, StreamingOverlapAdd, chunk_spans
+from api.utils.codec import DEFAULT_STEM_CODEC, StemEncoder
+from api.utils.ffmpeg import decode_frames
+
+STAGES = ("decode", "inference", "merge", "encode")
+THREAD_VARIABLES = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS",
+    "TF_NUM_INTEROP_THREADS",
+)
+
+
+@dataclass
+class BenchmarkCase:
+    separator: str
+    stems: int
+    duration: float
+    chunk_size: float
+    threads: int
+    sample_rate: int = 44_100
+    frame_seconds: int = 10
+
+
+class StubSeparator(Separator):
+    """Tiny separator masking the spectrum of every frame with a fixed
+    mask per stem. It chunks and merges like `SpleeterSeparator` and
+    needs no model, hence the benchmark can run offline.
+    """
+
+    def __init__(self, stems: int, chunk_size=2, overlap=1, frame_length=4096):
+        self.stems = stems
+        self.chunk_size = chunk_size * 60
+        self.overlap = overlap
+        self.frame_length = frame_length
+        masks = np.random.default_rng(0).random((stems, frame_length // 2 + 1))
+        # soft masks summing up to one, as spleeter's
+        self.masks = (masks / masks.sum(axis=0)).astype(np.float32)
+
+    def _predict(self, chunk: np.ndarray) -> Dict[str, np.ndarray]:
+        length, channels = chunk.shape
+        padded = -(-length // self.frame_length) * self.frame_length
+        frames = np.zeros((padded, channels), dtype=np.float32)
+        frames[:length] = chunk
+        spectrum = np.fft.rfft(
+            frames.reshape(-1, self.frame_length, channels), axis=1
+        )
+        return {
+            f"stem{i}": np.fft.irfft(
+                spectrum * mask[None, :, None], n=self.frame_length, axis=1
+            )
+            .reshape(-1, channels)[:length]
+            .astype(np.float32)
+            for i, mask in enumerate(self.masks)
+        }
+
+    def _predict_batch(self, chunks: List[np.ndarray]) -> List[Dict]:
+        return [self._predict(chunk) for chunk in chunks]
+
+    def separate(
+        self, waveform: np.ndarray, sample_rate=44_100
+    ) -> Dict[str, np.ndarray]:
+        overlap = int(self.overlap * sample_rate)
+        merger = OverlapAdd(len(waveform), overlap)
+        chunk_length = int(self.chunk_size * sample_rate)
+        for start, end in chunk_spans(len(waveform), chunk_length, overlap):
+            merger.add(start, end, self._predict(waveform[start:end]))
+        return merger.buffers
+
+    def stream(self, sample_rate=44_100) -> StreamingOverlapAdd:
+        return StreamingOverlapAdd(
+            int(self.chunk_size * sample_rate),
+            int(self.overlap * sample_rate),
+            self._predict_batch,
+        )
+
+
+def wav_header(
+    frames: int, channels: int, sample_rate: int, sample_width: int = 4
+) -> bytes:
+    """RIFF header of a WAV file holding `frames` frames, samples are
+        32 bit float for a sample width of 4 bytes, integer PCM otherwise.
+    """
+    audio_format = 3 if sample_width == 4 else 1
+    block_align = channels * sample_width
+    data_size = frames * block_align
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        audio_format,
+        channels,
+        sample_rate,
+        sample_rate * block_align,
+        block_align,
+        8 * sample_width,
+        b"data",
+        data_size,
+    )
+
+
+def synthetic_signal(
+    duration: float, sample_rate: int, channels: int = 2
+) -> np.ndarray:
+    """Sum of a few tones and noise, deterministic for a duration."""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(duration * sample_rate)) / sample_rate
+    signal = 0.05 * rng.standard_normal((len(t), channels))
+    for frequency in (110, 440, 1760):
+        signal += 0.2 * np.sin(2 * np.pi * frequency * t)[:, None]
+    return signal.astype(np.float32)
+
+
+def load_separator(case: BenchmarkCase) -> Separator:
+    if case.separator == "stub":
+        if case.chunk_size <= 0:
+            raise ValueError("The stub separator needs a positive chunk size")
+        return StubSeparator(case.stems, chunk_size=case.chunk_size)
+    if case.separator == "spleeter":
+        # a chunk size of 0 derives it from the memory budget
+        return SpleeterSeparator(
+            case.stems, chunk_size=case.chunk_size or None
+        )
+    raise ValueError(f"Unknown separator {case.separator}")
+
+
+class StageTimer:
+    def __init__(self):
+        self.seconds: Dict[str, float] = defaultdict(float)
+
+    @contextmanager
+    def __call__(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - start
+
+    def wrap(self, stage: str, function):
+        def timed(*args, **kwargs):
+            with self(stage):
+                return function(*args, **kwargs)
+
+        return timed
+
+
+def _peak_rss() -> int:
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def _file_chunks(stream: bytes, chunk_size=255 * 1024):
+    # as read from GridFS
+    for start in range(0, len(stream), chunk_size):
+        yield stream[start : start + chunk_size]
+
+
+def run_case(case: BenchmarkCase, trace_allocations=False) -> dict:
+    """Run a single case in the current process.
+        Returns:
+            result (dict): case, real time factor, seconds per stage,
+                peak RSS and traced allocations.
+    """
+    baseline_rss = _peak_rss()
+    signal = synthetic_signal(case.duration, case.sample_rate)
+    channels = signal.shape[1]
+    audio_seconds = len(signal) / case.sample_rate
+    encoded = wav_header(len(signal), channels, case.sample_rate)
+    encoded += signal.tobytes()
+    del signal
+
+    timer = StageTimer()
+    with timer("load"):
+        separator = load_separator(case)
+        separator.warm_up()
+    if trace_allocations:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    # time spent in the model, merging is the remainder of the stream
+    for attribute in ("_predict", "separate_batch"):
+        if hasattr(separator, attribute):
+            function = getattr(separator, attribute)
+            setattr(separator, attribute, timer.wrap("inference", function))
+    stream = separator.stream(case.sample_rate)
+    sinks = defaultdict(BytesIO)
+    encoders = {}
+
+    def _save(separated: Dict[str, np.ndarray]):
+        for name, stem in separated.items():
+            with timer("encode"):
+                if name not in encoders:
+                    encoders[name] = StemEncoder(
+                        case.sample_rate, channels, DEFAULT_STEM_CODEC
+                    )
+                encoders[name].write(stem)
+                # written to memory, no GridFS nor network cost
+                sinks[name].write(encoders[name].take())
+
+    async def _separate():
+        # decoded while read as in the worker
+        frames = decode_frames(
+            _file_chunks(encoded),
+            case.sample_rate,
+            channels,
+            case.frame_seconds * case.sample_rate,
+        ).__aiter__()
+        while True:
+            with timer("decode"):
+                try:
+                    block = await frames.__anext__()
+                except StopAsyncIteration:
+                    break
+            with timer("merge"):
+                separated = stream.push(block)
+            _save(separated)
+        with timer("merge"):
+            separated = stream.close()
+        _save(separated)
+        for name, encoder in encoders.items():
+            with timer("encode"):
+                patches = encoder.close()
+                sinks[name].write(encoder.take())
+                for offset, patch in patches:
+                    sinks[name].seek(offset)
+                    sinks[name].write(patch)
+                sinks[name].seek(0, 2)
+
+    asyncio.get_event_loop().run_until_complete(_separate())
+    wall = time.perf_counter() - start
+    timer.seconds["merge"] -= timer.seconds["inference"]
+
+    result = {
+        **asdict(case),
+        "audio_seconds": audio_seconds,
+        "wall_seconds": wall,
+        "real_time_factor": wall / audio_seconds,
+        "load_seconds": timer.seconds["load"],
+        "stages": {stage: timer.seconds[stage] for stage in STAGES},
+        "baseline_rss_bytes": baseline_rss,
+        "peak_rss_bytes": _peak_rss(),
+        "stem_bytes": {name: sink.tell() for name, sink in sinks.items()},
+    }
+    if trace_allocations:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["allocations"] = {"current_bytes": current, "peak_bytes": peak}
+    return result
+
+
+def run_isolated(case: BenchmarkCase, trace_allocations=False) -> dict:
+    """Run a case in a fresh process, peak RSS is per case and thread
+    settings apply before numpy and tensorflow are loaded.
+    """
+    environ = dict(os.environ)
+    os.environ.update({name: str(case.threads) for name in THREAD_VARIABLES})
+    try:
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+            return pool.submit(run_case, case, trace_allocations).result()
+    finally:
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def run_benchmark(cases: List[BenchmarkCase], trace_allocations=False) -> dict:
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": [run_isolated(case, trace_allocations) for case in cases],
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark separators on synthetic audio"
+    )
+    parser.add_argument(
+        "--separator", choices=("stub", "spleeter"), default="stub"
+    )
+    parser.add_argument("--stems", type=int, nargs="+", default=[2])
+    parser.add_argument(
+        "--durations", type=float, nargs="+", default=[30], help="seconds"
+    )
+    parser.add_argument(
+        "--chunk-sizes",
+        type=float,
+        nargs="+",
+        default=[2],
+        help="minutes, 0 derives spleeter chunks from the memory budget",
+    )
+    parser.add_argument("--threads", type=int, nargs="+", default=[1])
+    parser.add_argument("--sample-rate", type=int, default=44_100)
+    parser.add_argument("--trace-allocations", action="store_true")
+    parser.add_argument("--output", default="-", help="JSON file path")
+    args = parser.parse_args(args)
+    if args.separator == "stub" and min(args.chunk_sizes) <= 0:
+        parser.error("the stub separator needs positive chunk sizes")
+
+    cases = [
+        BenchmarkCase(
+            args.separator,
+            stems,
+            duration,
+            chunk_size,
+            threads,
+            args.sample_rate,
+        )
+        for stems, duration, chunk_size, threads in itertools.product(
+            args.stems, args.durations, args.chunk_sizes, args.threads
+        )
+    ]
+    report = run_benchmark(cases, args.trace_allocations)
+    output = json.dumps(report, indent=2)
+    if args.output == "-":
+        print(output)
+    else:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -39,7 +39,46 @@ signal_collection_name = "signal"
 stem_collection_name = "stem"
 signal_state_collection_name = "signal_state"
 grid_bucket_name = "fs"
+# separations keyed by content hash of the signal file and stems
+content_collection_name = "content"
+# claims of separations that did not complete in time are taken over
+CONTENT_CLAIM_TIMEOUT_MINUTES = int(
+    os.getenv("CONTENT_CLAIM_TIMEOUT_MINUTES", 120)
+)
+# compressed renditions of stem files cached in GridFS
+rendition_collection_name = "rendition"
+# waveform peaks of stem files at several zoom levels
+peaks_collection_name = "peaks"
 
 augment_collection_name = "augment"
 
 user_collection_name = "user"
+
+# codec of stored stems: wav_float32, wav_int16 or flac
+STEM_CODEC = os.getenv("STEM_CODEC", "flac")
+# Cache-Control of stem downloads and peaks, revalidated with their ETag
+# as a stem name may be patched with another file, augmented stems are
+# always revalidated
+STEM_CACHE_CONTROL = os.getenv("STEM_CACHE_CONTROL", "private, no-cache")
+# comma separated format:kbit/s renditions made after separation
+RENDITION_PRESETS = os.getenv("RENDITION_PRESETS", "opus:96,mp3:192")
+# size of the cached renditions, the least recently served are evicted
+RENDITION_CACHE_SIZE_MB = int(os.getenv("RENDITION_CACHE_SIZE_MB", 10240))
+# Cache-Control of signal listings, revalidated with their ETag
+SIGNAL_CACHE_CONTROL = os.getenv("SIGNAL_CACHE_CONTROL", "private, no-cache")
+
+# separator models kept loaded per worker process
+SEPARATOR_CACHE_SIZE_MB = int(os.getenv("SEPARATOR_CACHE_SIZE_MB", 4096))
+# comma separated signal_type:stems pairs loaded at worker start
+SEPARATOR_PRELOAD = os.getenv("SEPARATOR_PRELOAD", "Music:2")
+# chunks of concurrent jobs batched into one forward pass (1 disables)
+SEPARATOR_BATCH_SIZE = int(os.getenv("SEPARATOR_BATCH_SIZE", 1))
+SEPARATOR_BATCH_WAIT_MS = int(os.getenv("SEPARATOR_BATCH_WAIT_MS", 50))
+# memory a worker may use for inference, bounds intra-file batching
+SEPARATOR_MEMORY_BUDGET_MB = int(os.getenv("SEPARATOR_MEMORY_BUDGET_MB", 4096))
+# duration of the chunks separated at once (0 derives it from the budget)
+SEPARATOR_CHUNK_MINUTES = float(os.getenv("SEPARATOR_CHUNK_MINUTES", 0))
+# chunks of one signal per forward pass (0 derives it from the budget)
+SEPARATOR_FILE_BATCH_SIZE = int(os.getenv("SEPARATOR_FILE_BATCH_SIZE", 1))
+# processes separating the chunks of one signal (0 separates in process)
+SEPARATOR_PROCESSES = int(os.getenv("SEPARATOR_PROCESSES", 0))
@@ -1,2 +1,3 @@
 from .database import db, get_database
+from .indexes import create_indexes, schedule_indexes
 from .utils import connect_to_mongo, close_mongo_connection
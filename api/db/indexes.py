@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from typing import Coroutine, Dict, List
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, IndexModel
+
+from api.config import (
+    signal_collection_name,
+    stem_collection_name,
+    signal_state_collection_name,
+    user_collection_name,
+    grid_bucket_name,
+    rendition_collection_name,
+    peaks_collection_name,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _index(*fields: str, **kwargs) -> IndexModel:
+    return IndexModel([(field, ASCENDING) for field in fields], **kwargs)
+
+
+# indexes of the queries of the services, by collection
+INDEXES: Dict[str, List[IndexModel]] = {
+    # a signal of a user, pages of the signals of a user by filter
+    signal_collection_name: [
+        _index("username", "signal_id"),
+        _index("username", "_id"),
+        _index("username", "signal_metadata.projectname", "_id"),
+        _index("username", "signal_state", "_id"),
+    ],
+    # stems of a signal by name, a stem file of a signal
+    stem_collection_name: [
+        _index("parent_id", "stem_name"),
+        _index("signal_id", "parent_id"),
+    ],
+    signal_state_collection_name: [_index("signal_id", "username")],
+    user_collection_name: [_index("username")],
+    # GridFS creates these on the first upload of an empty bucket only
+    f"{grid_bucket_name}.files": [_index("filename", "uploadDate")],
+    f"{grid_bucket_name}.chunks": [_index("files_id", "n", unique=True)],
+    # renditions of a stem file, least recently served renditions
+    rendition_collection_name: [
+        _index("stem_file_id"),
+        _index("accessed_at"),
+    ],
+    peaks_collection_name: [_index("stem_file_id", "level", "block")],
+}
+
+
+async def create_indexes(
+    conn: AsyncIOMotorClient,
+) -> Coroutine[None, None, None]:
+    """Create the indexes of every collection, existing indexes are
+    left as they are.
+    """
+    database = conn.get_default_database()
+    await asyncio.gather(
+        *(
+            database.get_collection(name).create_indexes(indexes)
+            for name, indexes in INDEXES.items()
+        )
+    )
+
+
+def _log_failure(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Could not create indexes: %s", task.exception())
+
+
+def schedule_indexes(conn: AsyncIOMotorClient) -> asyncio.Future:
+    """Create the indexes in the background, serving requests does not
+    wait for indexes being built on large collections.
+    """
+    task = asyncio.ensure_future(create_indexes(conn))
+    task.add_done_callback(_log_failure)
+    return task
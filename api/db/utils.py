@@ -1,11 +1,13 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from api.db import db
+from api.db.indexes import schedule_indexes
 from api.config import MONGODB_URL
 
 
 async def connect_to_mongo():
     db.client = AsyncIOMotorClient(MONGODB_URL)
+    schedule_indexes(db.client)
 
 
 async def close_mongo_connection():
@@ -1,10 +1,12 @@
 from fastapi import FastAPI
+from fastapi.openapi.utils import get_openapi
 
 # from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware import Middleware
 
 from api.routers import augment, signal, auth
+from api.routers.signal import SIGNAL_FILE_BODY
 from api.db import connect_to_mongo, close_mongo_connection
 
 
@@ -55,6 +57,29 @@ api.include_router(auth)
 api.include_router(signal)
 
 
+def openapi() -> dict:
+    """OpenAPI schema of the app, with the request bodies that are
+    read as streams rather than declared.
+    """
+    if api.openapi_schema is None:
+        schema = get_openapi(
+            title=api.title,
+            version=api.version,
+            openapi_version=api.openapi_version,
+            description=api.description,
+            routes=api.routes,
+            tags=api.openapi_tags,
+            servers=api.servers,
+        )
+        post_signal = schema["paths"]["/signal/{signal_type}"]["post"]
+        post_signal["requestBody"] = SIGNAL_FILE_BODY
+        api.openapi_schema = schema
+    return api.openapi_schema
+
+
+api.openapi = openapi
+
+
 @api.get("/")
 async def root():
     return {"message": "Hello Bigger Applications!"}
@@ -1,7 +1,6 @@
-from api.utils.signal import read_audio
 from api.services.signal import (
     read_one_signal,
-    read_signal_file,
+    read_signal_file_by_id,
     save_stem_file,
     update_stem,
 )
@@ -14,7 +13,7 @@ from api.dependencies import get_current_user
 from api.db import get_database
 from api.schemas import Augmentation, User, Copy, Volume, Reverb
 from api.utils.augment import augment_signal
-from api.services import get_stem_id
+from api.services import find_stem_file_id, get_stem_id
 
 
 router = APIRouter(prefix="/augment", tags=["augment"])
@@ -51,10 +50,12 @@ async def augment(
         signals[augment.signal_stem] = stem_augments
     for stem, augmentations in signals.items():
         stem_id = get_stem_id(stem, signal_id)
-        stem_signal = await read_signal_file(
-            db, get_stem_id(stem, signal_id), stream=False
+        stem_file_id = find_stem_file_id(signal, stem)
+        if stem_file_id is None:
+            raise HTTPException(status_code=400, detail="Stem not found")
+        stem_signal = await read_signal_file_by_id(
+            db, stem_file_id, decode=True
         )
-        stem_signal = read_audio(stem_signal)
         result = augment_signal(
             stem_signal, augmentations, signal.signal_metadata.sample_rate
         )
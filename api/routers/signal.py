@@ -1,9 +1,14 @@
+import orjson
 from bson import ObjectId
-from typing import List, Coroutine
-from fastapi.responses import StreamingResponse
+from bson.errors import InvalidId
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterator, List, Coroutine
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from fastapi import (
-    # Request,
+    Request,
     Path,
+    Query,
     APIRouter,
     HTTPException,
     UploadFile,
@@ -13,40 +18,80 @@ from fastapi import (
     # WebSocket,
 )
 from motor.motor_asyncio import AsyncIOMotorClient
+from gridfs.errors import NoFile
 
 # from sse_starlette.sse import EventSourceResponse
 
 from api.schemas import (
     Signal,
     SignalInResponse,
+    SignalInListing,
     SignalInCreate,
     SignalState,
+    SignalInDB,
     SeparatedSignal,
+    SignalMetadata,
+    StemPeaks,
     User,
 )
 from api.services import (
     create_signal,
-    read_signal,
+    find_signal,
     remove_signal,
-    save_signal_file,
-    read_signal_file,
+    save_signal_stream,
+    read_signal_file_by_id,
+    open_signal_file,
+    chunk_range,
     get_stem_id,
     read_one_signal,
     delete_signal_file,
     get_signal_state,
     # watch_collection_field,
-    update_signal_state,
-    validate_user_signal,
     create_stem,
-    update_signal,
+    add_signal_stem,
+    remove_signal_stem,
+    rename_signal_stem,
     save_stem_file,
-    rename_file,
-    copy_file,
+    update_stem,
+    retain_file,
+    release_file,
+    release_files,
+    find_stem_file_id,
+    claim_content,
+    release_content,
+    link_content,
+    read_rendition,
+    stream_rendition,
+    delete_renditions,
+    save_peaks,
+    read_peaks,
+    delete_peaks,
+    delete_signals,
 )
 from api.separator import SignalType
 from api.db import get_database
+from api.config import SIGNAL_CACHE_CONTROL, STEM_CACHE_CONTROL
 from api.dependencies import get_current_user
-from api.utils.signal import process_signal
+from api.utils.signal import probe_signal, process_signal
+from api.utils.codec import (
+    DEFAULT_RENDITION_BITRATES,
+    DEFAULT_STEM_CODEC,
+    RENDITION_BITRATES,
+    RenditionFormat,
+    StemCodec,
+)
+from api.utils.http import (
+    CODEC_MEDIA_TYPES,
+    RENDITION_MEDIA_TYPES,
+    RangeNotSatisfiable,
+    content_range,
+    etag_matches,
+    parse_range,
+    strong_etag,
+)
+from api.utils.peaks import PEAK_LEVELS, build_peaks
+from api.utils.probe import PROBE_HEAD_SIZE
+from api.utils.upload import MultipartFileStream
 from api.worker import separate, TaskState
 
 router = APIRouter(
@@ -55,22 +100,98 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# signals deleted by a single request
+DELETE_BATCH_SIZE = 100
+# states of signals whose stems are not all recorded yet
+SEPARATING_STATES = (
+    TaskState.Start,
+    TaskState.Separating,
+    TaskState.Separated,
+    TaskState.Saving,
+)
+
+
+async def _signal_listing(
+    rows: List[dict], fields: List[str]
+) -> AsyncIterator[bytes]:
+    """JSON array of the signals, serialized while sent."""
+    defaults = {field: Signal.__fields__[field].default for field in fields}
+    separator = b"["
+    for row in rows:
+        signal = {
+            field: row.get(field, default)
+            for field, default in defaults.items()
+        }
+        item = {"signal": signal, "cursor": str(row["_id"])}
+        yield separator + orjson.dumps(item)
+        separator = b","
+    yield b"[]" if separator == b"[" else b"]"
+
 
 @router.get(
     "/",
-    response_model=List[SignalInResponse],
+    response_model=List[SignalInListing],
     status_code=status.HTTP_200_OK,
     name="get_signal",
 )
 async def get_signal(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100, description="Signals per page"),
+    after: str = Query(
+        None, description="Cursor of the last signal of the previous page"
+    ),
+    projectname: str = Query(None, description="Project of the signals"),
+    state: TaskState = Query(None, description="State of the signals"),
+    fields: str = Query(
+        None,
+        description="Comma separated fields, e.g. signal_id,signal_metadata",
+    ),
     db: AsyncIOMotorClient = Depends(get_database),
     user: User = Depends(get_current_user),
-) -> Coroutine[List[SignalInResponse], None, None]:
-    """Get all signals that were posted.
+) -> Coroutine[StreamingResponse, None, None]:
+    """Get a page of the signals that were posted, in posting order.
+    The next page follows the `cursor` of the last signal. The listing
+    is revalidated with its ETag, `If-None-Match` is answered by 304
+    Not Modified.
     """
-    signals = await read_signal(db, user.username)
-    signals = list(map(lambda x: SignalInResponse(signal=x), signals))
-    return signals
+    fields = [field.strip() for field in (fields or "").split(",")]
+    fields = [field for field in fields if field] or list(Signal.__fields__)
+    unknown = set(fields) - set(Signal.__fields__)
+    if unknown:
+        raise HTTPException(
+            status_code=422, detail=f"Unknown fields {sorted(unknown)}"
+        )
+    filters = {
+        "after": after,
+        "projectname": projectname,
+        "signal_state": state,
+    }
+    try:
+        # a single read, the ETag matches the listed rows
+        rows = await find_signal(
+            db,
+            user.username,
+            limit,
+            fields=["_id", "updated_at", *fields],
+            **filters,
+        ).to_list(length=limit)
+    except InvalidId:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    etag = strong_etag(
+        user.username,
+        request.url.query,
+        *(f"{row['_id']}:{row.get('updated_at')}" for row in rows),
+    )
+    headers = {"ETag": etag, "Cache-Control": SIGNAL_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+    return StreamingResponse(
+        _signal_listing(rows, fields),
+        media_type="application/json",
+        headers=headers,
+    )
 
 
 @router.get(
@@ -129,26 +250,267 @@ async def get_stem_state(
 #     return EventSourceResponse(_filter())
 
 
+async def _stream_rendition(
+    db: AsyncIOMotorClient,
+    stem_file_id: str,
+    rendition_format: RenditionFormat,
+    bitrate: int,
+    headers: dict,
+) -> Coroutine[StreamingResponse, None, None]:
+    chunks = await stream_rendition(
+        db, stem_file_id, rendition_format, bitrate
+    )
+    if chunks is None:
+        raise HTTPException(status_code=404, detail="Stem not found")
+    try:
+        # ffmpeg failing at once is still reported by the status
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+    except RuntimeError:
+        raise HTTPException(status_code=500, detail="Could not transcode stem")
+
+    async def _chunks():
+        try:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(
+        _chunks(),
+        media_type=RENDITION_MEDIA_TYPES[rendition_format],
+        headers=headers,
+    )
+
+
 @router.get("/stem/{signal_id}/{stem}", status_code=status.HTTP_200_OK)
 async def get_stem(
+    request: Request,
     signal_id: str = Path(..., title="Signal ID"),
     stem: str = Path(..., title="Stem name of separated signal"),
     db: AsyncIOMotorClient = Depends(get_database),
     augmented_stem: bool = False,
+    rendition_format: RenditionFormat = Query(
+        None, alias="format", description="Compressed rendition format"
+    ),
+    bitrate: int = Query(None, description="Rendition bitrate in kbit/s"),
     user: User = Depends(get_current_user),
 ) -> Coroutine[StreamingResponse, None, None]:
-    """Get an individual separated signal stem.
+    """Get an individual separated signal stem. A single byte range can
+    be requested with the `Range` header, e.g. by players seeking. Stems
+    have an ETag, `If-None-Match` is answered by 304 Not Modified.
+    A compressed rendition is served with `format`, it is transcoded on
+    the first request and cached.
     """
     exception = HTTPException(status_code=404, detail="Stem not found")
-    if not await validate_user_signal(db, signal_id, user.username):
+    signal = await read_one_signal(db, signal_id, user.username)
+    if not signal:
         raise exception
-    stem_file_id = get_stem_id(stem, signal_id)
-    stream = await read_signal_file(
-        db, stem_file_id, augmented_signal=augmented_stem
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": STEM_CACHE_CONTROL}
+    grid_out = None
+    if augmented_stem:
+        # every augmentation replaces the file behind this URL
+        headers["Cache-Control"] = "private, no-cache"
+        grid_out = await open_signal_file(
+            db, filename=f"{get_stem_id(stem, signal_id)}_augment"
+        )
+        stem_file_id = grid_out and str(grid_out._id)
+    else:
+        stem_file_id = find_stem_file_id(signal, stem)
+    if not stem_file_id:
+        raise exception
+    media_type = None
+    # stem files are immutable, augmenting writes a new file, hence
+    # stems are revalidated without reading their file. Renditions are
+    # encoded reproducibly, they are revalidated before being encoded.
+    etag_parts = [stem_file_id]
+    if rendition_format is not None:
+        bitrate = bitrate or DEFAULT_RENDITION_BITRATES[rendition_format]
+        if bitrate not in RENDITION_BITRATES:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Bitrate must be one of {RENDITION_BITRATES}",
+            )
+        etag_parts += [rendition_format.value, bitrate]
+    headers["ETag"] = strong_etag(*etag_parts)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+    if rendition_format is not None:
+        media_type = RENDITION_MEDIA_TYPES[rendition_format]
+        rendition = await read_rendition(
+            db, stem_file_id, rendition_format, bitrate
+        )
+        if rendition is None:
+            # sent while transcoded, its size is unknown until cached
+            return await _stream_rendition(
+                db, stem_file_id, rendition_format, bitrate, headers
+            )
+        grid_out = None
+        stem_file_id = rendition.file_id
+    grid_out = grid_out or await open_signal_file(db, file_id=stem_file_id)
+    if not grid_out:
+        raise exception
+
+    size = grid_out.length
+    if media_type is None:
+        metadata = grid_out.metadata or {}
+        codec = metadata.get("codec", StemCodec.Float32)
+        media_type = CODEC_MEDIA_TYPES[StemCodec(codec)]
+    status_code = status.HTTP_200_OK
+    first, last = 0, size - 1
+    range_header = request.headers.get("range", "")
+    if not etag_matches(
+        request.headers.get("if-range", headers["ETag"]),
+        headers["ETag"],
+        weak=False,
+    ):
+        # the client holds another version, send it all
+        range_header = ""
+    try:
+        byte_range = parse_range(range_header, size)
+    except RangeNotSatisfiable:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    if byte_range is not None:
+        first, last = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = content_range(first, last, size)
+    headers["Content-Length"] = str(last - first + 1)
+    return StreamingResponse(
+        chunk_range(grid_out, first, last + 1),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers,
     )
-    if not stream:
+
+
+@router.get(
+    "/peaks/{signal_id}/{stem}",
+    response_model=StemPeaks,
+    status_code=status.HTTP_200_OK,
+)
+async def get_stem_peaks(
+    request: Request,
+    response: Response,
+    signal_id: str = Path(..., title="Signal ID"),
+    stem: str = Path(..., title="Stem name of separated signal"),
+    level: int = Query(0, ge=0, lt=PEAK_LEVELS, description="Zoom level"),
+    start: float = Query(0, ge=0, description="Start in seconds"),
+    end: float = Query(None, ge=0, description="End in seconds"),
+    db: AsyncIOMotorClient = Depends(get_database),
+    user: User = Depends(get_current_user),
+) -> Coroutine[StemPeaks, None, None]:
+    """Get the waveform peaks of a stem at a zoom level, between `start`
+    and `end` seconds, to draw it without downloading the stem. Level 0
+    is the finest, every level is 4 times coarser than the one below.
+    """
+    exception = HTTPException(status_code=404, detail="Peaks not found")
+    signal = await read_one_signal(db, signal_id, user.username)
+    if not signal:
         raise exception
-    return StreamingResponse(stream, media_type="audio/mpeg")
+    stem_file_id = find_stem_file_id(signal, stem)
+    if not stem_file_id:
+        raise exception
+    # peaks of a stem file never change
+    etag = strong_etag(stem_file_id, "peaks")
+    headers = {"ETag": etag, "Cache-Control": STEM_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers
+        )
+    peaks = await read_peaks(db, stem_file_id, level, start, end)
+    if peaks is None:
+        raise exception
+    response.headers.update(headers)
+    return peaks
+
+
+async def schedule_separation(
+    db: AsyncIOMotorClient, signal: SignalInDB, user: User, stems: int
+) -> Coroutine[TaskState, None, None]:
+    """Separate the signal unless its file content was already separated
+    with as many stems, then the stems are copied. Identical signals
+    posted while being separated wait for that separation.
+    """
+    while True:
+        content = await claim_content(
+            db, signal.content_hash, stems, signal.signal_id, user.username
+        )
+        if content is None:
+            separate.delay(signal.dict(), user.dict(), stems)
+            return TaskState.Start
+        if not content.separated:
+            return TaskState.Start
+        linked = await link_content(
+            db,
+            content.stem_ids,
+            signal,
+            user.username,
+            content.codec,
+            signal_state=TaskState.Complete,
+        )
+        if linked:
+            return TaskState.Complete
+        # stems of the separated signal were deleted since
+        await release_content(db, signal.content_hash, stems)
+
+
+async def probe_upload(
+    db: AsyncIOMotorClient,
+    file_id: str,
+    head: bytes,
+    size: int,
+    filename: str,
+    signal_type: SignalType,
+    project_name: str,
+) -> Coroutine[SignalMetadata, None, None]:
+    """Probe the stored upload from its head, formats whose headers
+    are at the end of the file are probed from the stored file.
+    """
+    try:
+        return await run_in_threadpool(
+            probe_signal, head, size, filename, signal_type, project_name
+        )
+    except ValueError:
+        if size <= len(head):
+            raise
+    with SpooledTemporaryFile(max_size=PROBE_HEAD_SIZE) as signal_file:
+        async for chunk in await read_signal_file_by_id(db, file_id):
+            signal_file.write(chunk)
+        return await run_in_threadpool(
+            probe_signal,
+            head,
+            size,
+            filename,
+            signal_type,
+            project_name,
+            signal_file,
+        )
+
+
+# `post_signal` streams its body instead of declaring a `File`, the
+# body is documented by the OpenAPI schema of the app
+SIGNAL_FILE_BODY = {
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "signal_file": {"type": "string", "format": "binary"}
+                },
+                "required": ["signal_file"],
+            }
+        }
+    },
+    "required": True,
+}
 
 
 @router.post(
@@ -157,17 +519,17 @@ async def get_stem(
     status_code=status.HTTP_201_CREATED,
 )
 async def post_signal(
+    request: Request,
     signal_type: SignalType = Path(..., title="Type of Signal"),
     db: AsyncIOMotorClient = Depends(get_database),
-    signal_file: UploadFile = File(...),
     user: User = Depends(get_current_user),
     stems: int = 2,
     project_name: str = "",
 ) -> Coroutine[SignalInResponse, None, None]:
-    """Post a signal to separate. Signal Type is used to
-    determine the separation process. Posting triggers a
-    background process which can be tracked by `/signal/state`
-    or `/signal/status`.
+    """Post a signal to separate as the `signal_file` field of a
+    multipart form. Signal Type is used to determine the separation
+    process. Posting triggers a background process which can be
+    tracked by `/signal/state` or `/signal/status`.
     """
     # early validations for file extension / metadata based validation
     if not (stems == 2 or stems == 4 or stems == 5):
@@ -175,25 +537,44 @@ async def post_signal(
             status_code=400, detail="Only stems 2, 4, 5 are supported"
         )
 
-    print("PROJECT NAME", project_name)
+    # the body is stored while received, hashed and its head kept
+    # for the probe, it is never spooled to disk
+    signal_file = MultipartFileStream(request, "signal_file")
+    if not await signal_file.open():
+        raise HTTPException(status_code=422, detail="signal_file is required")
+    file_id, content_hash, head, size = await save_signal_stream(
+        db,
+        signal_file.filename,
+        signal_file.content_type,
+        signal_file,
+        head_size=PROBE_HEAD_SIZE,
+    )
     try:
-        signal_metadata = process_signal(
-            signal_file, signal_type, project_name=project_name
+        # headers only, the worker decodes and validates the signal
+        signal_metadata = await probe_upload(
+            db,
+            file_id,
+            head,
+            size,
+            signal_file.filename,
+            signal_type,
+            project_name,
         )
     except Exception:
+        await delete_signal_file(db, file_id)
         raise HTTPException(
             status_code=400, detail="Error while processing file"
         )
-    file_id = await save_signal_file(db, signal_file)
-    signal = SignalInCreate(signal_metadata=signal_metadata, signal_id=file_id)
+    signal = SignalInCreate(
+        signal_metadata=signal_metadata,
+        signal_id=file_id,
+        content_hash=content_hash,
+        signal_state=TaskState.Start,
+    )
+    # created in its state, the worker may move it on at once
     signal_in_db = await create_signal(db, signal, user.username)
-    separate.delay(signal_in_db.dict(), user.dict(), stems)
-    await update_signal_state(
-        db,
-        SignalState(
-            signal_id=signal_in_db.signal_id, signal_state=TaskState.Start
-        ),
-        user.username,
+    signal_in_db.signal_state = await schedule_separation(
+        db, signal_in_db, user, stems
     )
     return SignalInResponse(signal=signal_in_db)
 
@@ -208,28 +589,59 @@ async def copy_signal(
     db: AsyncIOMotorClient = Depends(get_database),
     user: User = Depends(get_current_user),
 ) -> Coroutine[SignalInResponse, None, None]:
+    """Copy a signal, the copy shares the signal and stem files of the
+    signal instead of duplicating them.
+    """
     exception = HTTPException(
         status_code=404, detail=f"Signal {signal_id} not found"
     )
     signal = await read_one_signal(db, signal_id, user.username)
     if not signal:
         raise exception
-    signal_copy = await create_signal(
-        db,
-        Signal(**{**signal.dict(), "signal_id": str(ObjectId())}),
-        user.username,
-    )
+    if signal.signal_state in SEPARATING_STATES:
+        # only the signal itself is completed by its separation
+        raise HTTPException(
+            status_code=409, detail=f"Signal {signal_id} is being separated"
+        )
+    file_id = signal.file_id or signal.signal_id
+    try:
+        await retain_file(db, file_id)
+    except NoFile:
+        # the stems are copied even if the signal file is gone
+        pass
+    copy_id = str(ObjectId())
+    separated_stems = []
     separated_stem_id = []
-    for stem_name in signal.separated_stems:
-        stem_id = get_stem_id(stem_name, signal.signal_id)
-        new_stem_id = get_stem_id(stem_name, signal_copy.signal_id)
-        file_id = await copy_file(db, stem_id, new_stem_id)
-        separated_stem_id.append(file_id)
+    for stem_name, stem_id in zip(
+        signal.separated_stems, signal.separated_stem_id
+    ):
+        try:
+            metadata = await retain_file(db, stem_id)
+        except NoFile:
+            continue
+        stem = SeparatedSignal(
+            signal_id=stem_id,
+            signal_metadata=signal.signal_metadata,
+            stem_name=stem_name,
+            parent_id=copy_id,
+            codec=metadata.get("codec", StemCodec.Float32),
+        )
+        await create_stem(db, stem, user.username)
+        separated_stems.append(stem_name)
+        separated_stem_id.append(stem_id)
 
-    signal_copy = await update_signal(
+    # the copy is listed once its stems exist
+    signal_copy = await create_signal(
         db,
-        signal_copy.signal_id,
-        username=user.username,
+        Signal(
+            **{
+                **signal.dict(),
+                "signal_id": copy_id,
+                "file_id": file_id,
+                "separated_stems": separated_stems,
+            }
+        ),
+        user.username,
         separated_stem_id=separated_stem_id,
     )
     return SignalInResponse(signal=Signal(**signal_copy.dict()))
@@ -257,11 +669,19 @@ async def patch_signal(
     parent_signal = await read_one_signal(db, signal_id, user.username)
     if not parent_signal:
         raise exception
+    conflict = HTTPException(
+        status_code=409, detail=f"Stem {stem_name} already exists"
+    )
+    if stem_name in parent_signal.separated_stems:
+        raise conflict
 
     try:
         # saving stem file requires array for consistency
-        signal_metadata, signal = process_signal(
-            signal_file, parent_signal.signal_metadata.signal_type, array=True
+        signal_metadata, signal = await run_in_threadpool(
+            process_signal,
+            signal_file,
+            parent_signal.signal_metadata.signal_type,
+            array=True,
         )
     except Exception:
         raise HTTPException(
@@ -270,24 +690,35 @@ async def patch_signal(
 
     stem_file_id = get_stem_id(stem_name, signal_id)
     stem_id = await save_stem_file(
-        db, stem_file_id, signal, signal_metadata.sample_rate
+        db,
+        stem_file_id,
+        signal,
+        signal_metadata.sample_rate,
+        codec=DEFAULT_STEM_CODEC,
     )
+    levels = await run_in_threadpool(build_peaks, signal)
+    await save_peaks(db, stem_id, signal_metadata.sample_rate, levels)
     stem = SeparatedSignal(
         signal_id=stem_id,
         signal_metadata=signal_metadata,
         stem_name=stem_name,
+        parent_id=signal_id,
+        codec=DEFAULT_STEM_CODEC,
     )
     await create_stem(db, stem, user.username)
 
     # add stem reference to original signal
-    signal = await read_one_signal(db, signal_id, user.username)
-    parent_signal = await update_signal(
-        db,
-        signal.signal_id,
-        user.username,
-        separated_stems=[*signal.separated_stems, stem_name],
-        separated_stem_id=[*signal.separated_stem_id, stem_id],
+    parent_signal = await add_signal_stem(
+        db, signal_id, user.username, stem_name, stem_id
     )
+    if parent_signal is None:
+        # patched or deleted concurrently
+        await remove_signal(
+            db, stem_id, user.username, stem=True, parent_id=signal_id
+        )
+        await release_file(db, stem_id)
+        await delete_peaks(db, stem_id)
+        raise conflict
     return SignalInResponse(signal=Signal(**parent_signal.dict()))
 
 
@@ -309,24 +740,21 @@ async def change_stem_name(
     if not signal:
         raise HTTPException(status_code=404, detail="Signal not found")
 
-    try:
-        stem_index = signal.separated_stems.index(stem_name)
-    except ValueError:
+    if stem_name not in signal.separated_stems:
         raise HTTPException(status_code=404, detail="Stem not found")
-    signal.separated_stems[stem_index] = new_stem_name
-
-    stem_id = signal.separated_stem_id[stem_index]
-    new_stem_id = get_stem_id(new_stem_name, signal.signal_id)
-    try:
-        await rename_file(db, stem_id, new_stem_id)
-    except Exception:
-        raise HTTPException(status_code=404, detail="File not found")
+    if new_stem_name == stem_name:
+        return SignalInResponse(signal=Signal(**signal.dict()))
 
-    updated_signal = await update_signal(
-        db,
-        signal.signal_id,
-        user.username,
-        separated_stems=signal.separated_stems,
+    updated_signal = await rename_signal_stem(
+        db, signal_id, user.username, stem_name, new_stem_name
+    )
+    if updated_signal is None:
+        raise HTTPException(
+            status_code=409, detail=f"Stem {new_stem_name} already exists"
+        )
+    # the stem file may be shared with copies, it keeps its name
+    await update_stem(
+        db, signal_id, stem_name, user.username, stem_name=new_stem_name
     )
     return SignalInResponse(signal=Signal(**updated_signal.dict()))
 
@@ -351,24 +779,41 @@ async def delete_stem(
     except ValueError:
         raise HTTPException(status_code=404, detail="Stem not found")
     stem_id = signal.separated_stem_id[stem_index]
-    try:
-        await delete_signal_file(db, stem_id)
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal error")
-    deleted = await remove_signal(db, stem_id, user.username, stem=True)
-    if deleted:
-        signal.separated_stem_id.pop(stem_index)
-        signal.separated_stems.pop(stem_index)
-        await update_signal(
-            db,
-            signal.signal_id,
-            user.username,
-            separated_stems=signal.separated_stems,
-            separated_stem_id=signal.separated_stem_id,
-        )
+    # the reference goes first, concurrent deletes release the file once
+    removed = await remove_signal_stem(
+        db, signal_id, user.username, stem_name, stem_id
+    )
+    if removed is None:
+        raise HTTPException(status_code=404, detail="Stem not found")
+    # a file already gone is skipped, the stem is deleted either way
+    if await release_files(db, [stem_id]):
+        await delete_renditions(db, stem_id)
+        await delete_peaks(db, stem_id)
+    deleted = await remove_signal(
+        db, stem_id, user.username, stem=True, parent_id=signal_id
+    )
     return {"stem_name": stem_name, "deleted": deleted}
 
 
+@router.delete("/", status_code=status.HTTP_202_ACCEPTED)
+async def bulk_delete_signals(
+    signal_ids: List[str] = Query(..., description="IDs of the signals"),
+    db: AsyncIOMotorClient = Depends(get_database),
+    user: User = Depends(get_current_user),
+) -> Coroutine[dict, None, None]:
+    """Delete many signals at once, signals not found are skipped.
+    """
+    if len(signal_ids) > DELETE_BATCH_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"At most {DELETE_BATCH_SIZE} signals are deleted at once",
+        )
+    deleted = await delete_signals(
+        db, signal_ids, user.username, TaskState.Deleted
+    )
+    return {"signal_ids": deleted}
+
+
 @router.delete("/{signal_id}", status_code=status.HTTP_202_ACCEPTED)
 async def delete_signal(
     signal_id: str = Path(..., title="Signal ID"),
@@ -377,31 +822,9 @@ async def delete_signal(
 ) -> Coroutine[dict, None, None]:
     """Delete a signal.
     """
-    signal = await read_one_signal(db, signal_id, user.username)
-    if not signal:
+    deleted = await delete_signals(
+        db, [signal_id], user.username, TaskState.Deleted
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Signal not found")
-
-    stem_ids = signal.separated_stem_id
-
-    # Delete stem files and from collection
-    for stem_id in stem_ids:
-        try:
-            await delete_signal_file(db, stem_id)
-        except Exception:
-            raise HTTPException(status_code=500, detail="Internal error")
-        deleted = await remove_signal(db, stem_id, user.username, stem=True)
-
-    # Delete signal file and from collection
-    try:
-        await delete_signal_file(db, signal_id)
-    except Exception as e:
-        raise HTTPException(status_code=404, detail=str(e))
-
-    deleted = await remove_signal(db, signal_id, user.username)
-    if deleted:
-        await update_signal_state(
-            db,
-            SignalState(signal_id=signal_id, signal_state=TaskState.Deleted),
-            user.username,
-        )
-    return {"signal_id": signal_id, "deleted": deleted}
+    return {"signal_id": signal_id, "deleted": True}
@@ -4,11 +4,16 @@ from .signal import (
     Signal,
     SignalInCreate,
     SignalInResponse,
+    SignalInListing,
     SignalInDB,
     SeparatedSignal,
     SeparatedSignalInDB,
     SignalState,
     SignalStateInDB,
+    SignalContent,
+    SignalContentFollower,
+    Rendition,
+    StemPeaks,
 )
 from .authentication import Token, TokenData
 from .user import (
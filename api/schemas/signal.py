@@ -1,9 +1,11 @@
 import orjson
-from typing import List
+from datetime import datetime
+from typing import Dict, List
 from pydantic import BaseModel, Field
 
 from api.schemas import DBModelMixin
 from api.separator import SignalType
+from api.utils.codec import RenditionFormat, StemCodec
 
 
 class SignalMetadata(BaseModel):
@@ -36,6 +38,11 @@ class SignalBase(BaseModel):
 
 class Signal(SignalBase):
     separated_stems: List[str] = Field([], description="Name of stems")
+    content_hash: str = Field(None, description="SHA-256 of signal file")
+    file_id: str = Field(
+        None, description="File ID of signal file if not the Signal ID"
+    )
+    signal_state: str = Field(None, description="Signal State")
 
     class Config:
         json_loads = orjson.loads
@@ -54,13 +61,27 @@ class SignalInResponse(BaseModel):
     signal: Signal
 
 
+class SignalInListing(SignalInResponse):
+    cursor: str = Field(
+        ..., description="Pass as `after` to list the following signals"
+    )
+
+
 class SeparatedSignal(SignalBase):
     stem_name: str = Field(
         ..., example="Vocals", description="Name of separated stem"
     )
+    parent_id: str = Field(
+        None, description="Signal ID of the signal the stem belongs to"
+    )
     augmented: bool = Field(
         False, example=False, description="Augmented status of stem"
     )
+    codec: StemCodec = Field(
+        StemCodec.Float32,
+        example=StemCodec.Flac,
+        description="Storage codec of stem file",
+    )
 
 
 class SeparatedSignalInDB(DBModelMixin, SeparatedSignal):
@@ -74,3 +95,50 @@ class SignalState(BaseModel):
 
 class SignalStateInDB(DBModelMixin, SignalState):
     username: str = Field(..., description="Username who owns the signal")
+
+
+class SignalContentFollower(BaseModel):
+    signal_id: str = Field(..., description="Signal ID")
+    username: str = Field(..., description="Username who owns the signal")
+
+
+class SignalContent(BaseModel):
+    content_hash: str = Field(..., description="SHA-256 of signal file")
+    stems: int = Field(..., description="Number of separated stems")
+    signal_id: str = Field(..., description="Signal ID being separated")
+    username: str = Field(..., description="Username who owns the signal")
+    separated: bool = Field(False, description="Separation completed")
+    claimed_at: datetime = Field(None, description="Separation claim time")
+    stem_ids: Dict[str, str] = Field({}, description="File ID of each stem")
+    codec: StemCodec = Field(StemCodec.Float32, description="Codec of stems")
+    followers: List[SignalContentFollower] = Field(
+        [], description="Signals waiting for the separation"
+    )
+
+
+class Rendition(BaseModel):
+    stem_file_id: str = Field(..., description="File ID of the stem")
+    rendition_format: RenditionFormat = Field(
+        ..., example=RenditionFormat.Opus, description="Format of rendition"
+    )
+    bitrate: int = Field(..., example=96, description="Bitrate in kbit/s")
+    file_id: str = Field(..., description="File ID of the rendition")
+    size: int = Field(..., description="Size of the rendition in bytes")
+    accessed_at: datetime = Field(
+        None, description="Last time the rendition was served"
+    )
+
+
+class StemPeaks(BaseModel):
+    level: int = Field(..., example=0, description="Zoom level, 0 finest")
+    sample_rate: int = Field(
+        ..., example=44_100, description="Sample rate of stem"
+    )
+    frames_per_peak: int = Field(
+        ..., example=256, description="Frames summarised by a peak"
+    )
+    start: int = Field(..., description="Index of the first peak")
+    length: int = Field(..., description="Number of peaks of the level")
+    peaks: List[int] = Field(
+        ..., description="Min, max and RMS of every peak in [-127, 127]"
+    )
@@ -1,9 +1,24 @@
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List
 from abc import ABC, abstractmethod
 
 import numpy as np
 
 
+class FrameStream:
+    """Separates every pushed frame on its own, used by separators
+    without chunked streaming support.
+    """
+
+    def __init__(self, separate: Callable[[np.ndarray], Dict]):
+        self._separate = separate
+
+    def push(self, frames: np.ndarray) -> Dict[str, np.ndarray]:
+        return self._separate(frames)
+
+    def close(self) -> Dict[str, np.ndarray]:
+        return {}
+
+
 class Separator(ABC):
     """ABC is the abstract base class for music
     separation.
@@ -11,6 +26,8 @@ class Separator(ABC):
 
     # custom separator
     _separator: Any
+    # estimated resident memory (in bytes) of a loaded separator
+    memory_footprint: int = 0
 
     def __init__(self):
         pass
@@ -18,3 +35,25 @@ class Separator(ABC):
     @abstractmethod
     def separate(self, audio_file: np.ndarray) -> Dict[str, np.ndarray]:
         """ abstract method to separate signal."""
+
+    def separate_batch(
+        self, waveforms: List[np.ndarray]
+    ) -> List[Dict[str, np.ndarray]]:
+        """Separate several signals, separators able to run a batched
+        forward pass should override it.
+        """
+        return [self.separate(waveform) for waveform in waveforms]
+
+    def stream(self, sample_rate=44_100):
+        """Open a stream separating a signal pushed frame by frame.
+            Returns:
+                stream: `push(frames)` and `close()` return the
+                    separated samples which are final.
+        """
+        return FrameStream(self.separate)
+
+    def warm_up(self) -> None:
+        """Load lazily initialized resources ahead of the first job."""
+
+    def close(self) -> None:
+        """Release resources held by the separator."""
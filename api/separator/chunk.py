@@ -0,0 +1,249 @@
+from enum import Enum
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+
+# empirical bytes per sample and channel held during inference: input
+# waveform and its STFT plus, for every stem, mask, STFT and waveform
+INPUT_BYTES_PER_SAMPLE = 20
+STEM_BYTES_PER_SAMPLE = 28
+INFERENCE_OVERHEAD = 2
+
+
+class Window(str, Enum):
+    Linear: str = "linear"
+    Hann: str = "hann"
+
+
+def chunk_spans(
+    length: int, chunk_length: int, overlap: int = 0
+) -> List[Tuple[int, int]]:
+    """Split ``length`` samples into spans of ``chunk_length`` samples.
+        Consecutive spans share ``overlap`` samples and the last span
+        always ends at ``length``, so no trailing samples are dropped.
+
+        Args:
+            length (int): total number of samples.
+            chunk_length (int): maximum number of samples per span.
+            overlap (int): samples shared by consecutive spans.
+        Returns:
+            spans (list[tuple[int, int]]): (start, end) sample indices.
+    """
+    if chunk_length <= overlap:
+        raise ValueError("Chunk length must be larger than overlap")
+    spans = []
+    start = 0
+    while start < length:
+        end = min(start + chunk_length, length)
+        spans.append((start, end))
+        if end == length:
+            break
+        start = end - overlap
+    return spans
+
+
+def estimate_chunk_bytes(samples: int, channels: int, stems: int) -> int:
+    """Estimated peak memory (in bytes) to separate a chunk."""
+    per_sample = INPUT_BYTES_PER_SAMPLE + stems * STEM_BYTES_PER_SAMPLE
+    return samples * channels * per_sample * INFERENCE_OVERHEAD
+
+
+def budget_chunk_length(memory_budget: int, channels: int, stems: int) -> int:
+    """Largest chunk (in samples) expected to fit in ``memory_budget``."""
+    return memory_budget // estimate_chunk_bytes(1, channels, stems)
+
+
+def fade_curves(length: int, window: Window) -> Tuple[np.ndarray, np.ndarray]:
+    """Complementary fade in / fade out curves, they sum up to one
+        for every sample so crossfaded regions keep their amplitude.
+    """
+    t = (np.arange(length, dtype=np.float32) + 0.5) / max(length, 1)
+    if window == Window.Hann:
+        fade_in = np.sin(0.5 * np.pi * t) ** 2
+    else:
+        fade_in = t
+    return fade_in, 1 - fade_in
+
+
+class OverlapAdd:
+    """Merge chunk predictions into preallocated per-stem buffers.
+        Samples shared by consecutive chunks are crossfaded with
+        the given window.
+
+        Example use:
+        >>>merger = OverlapAdd(len(waveform), overlap)
+        >>>for start, end in chunk_spans(len(waveform), size, overlap):
+        >>>    merger.add(start, end, separate(waveform[start:end]))
+        >>>stems = merger.buffers
+    """
+
+    def __init__(
+        self, length: int, overlap: int, window: Window = Window.Hann
+    ):
+        self.length = length
+        self.overlap = overlap
+        self.fade_in, self.fade_out = fade_curves(overlap, window)
+        self.buffers: Dict[str, np.ndarray] = {}
+
+    def _buffer(self, name: str, channels: int) -> np.ndarray:
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            buffer = np.zeros((self.length, channels), dtype=np.float32)
+            self.buffers[name] = buffer
+        return buffer
+
+    def add(
+        self, start: int, end: int, prediction: Dict[str, np.ndarray]
+    ) -> None:
+        """Add prediction of the chunk spanning ``[start, end)``."""
+        head = self.overlap if start > 0 else 0
+        tail = self.overlap if end < self.length else 0
+        for name, chunk in prediction.items():
+            chunk = chunk[: end - start]
+            buffer = self._buffer(name, chunk.shape[1])
+            size = len(chunk)
+            if head:
+                buffer[start : start + head] += (
+                    chunk[:head] * self.fade_in[:, None]
+                )
+            if tail:
+                buffer[start + size - tail : start + size] += (
+                    chunk[size - tail :] * self.fade_out[:, None]
+                )
+            buffer[start + head : start + size - tail] += chunk[
+                head : size - tail
+            ]
+
+
+def predict_split(
+    predict: Callable[[np.ndarray], Dict[str, np.ndarray]],
+    chunk: np.ndarray,
+    overlap: int,
+    window: Window = Window.Hann,
+) -> Dict[str, np.ndarray]:
+    """Predict a chunk as two halves sharing ``overlap`` samples,
+        crossfaded into the prediction of the whole chunk.
+
+        Args:
+            predict (callable): separates a single chunk.
+            chunk (np.ndarray): chunk too large to predict at once.
+            overlap (int): samples shared by the halves.
+            window (Window): crossfade window used on the overlap.
+        Returns:
+            prediction (dict): separated chunk.
+    """
+    half = (len(chunk) + overlap + 1) // 2
+    merger = OverlapAdd(len(chunk), overlap, window)
+    for start, end in chunk_spans(len(chunk), half, overlap):
+        merger.add(start, end, predict(chunk[start:end]))
+    return merger.buffers
+
+
+class StreamingOverlapAdd:
+    """Overlap-add over a signal pushed frame by frame. Frames are
+    buffered into chunks of `chunk_length` samples which are separated
+    `batch_size` at a time, the separated samples are returned as soon
+    as no later chunk overlaps them. Memory is bounded by the chunk and
+    batch size instead of the signal length.
+
+        Example use:
+        >>>stream = StreamingOverlapAdd(size, overlap, predict_batch)
+        >>>for frames in decoded_frames:
+        >>>    write(stream.push(frames))
+        >>>write(stream.close())
+    """
+
+    def __init__(
+        self,
+        chunk_length: int,
+        overlap: int,
+        predict_batch: Callable[
+            [List[np.ndarray]], List[Dict[str, np.ndarray]]
+        ],
+        window: Window = Window.Hann,
+        batch_size: int = 1,
+    ):
+        if chunk_length <= 2 * overlap:
+            raise ValueError("Overlap must be less than half the chunk size")
+        self.chunk_length = chunk_length
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self._predict_batch = predict_batch
+        self.fade_in, self.fade_out = fade_curves(overlap, window)
+        self._pending: List[np.ndarray] = []
+        self._pending_length = 0
+        # last `overlap` samples of the previous prediction, not faded
+        self._tail: Dict[str, np.ndarray] = {}
+
+    def _take_chunks(self, final: bool) -> List[np.ndarray]:
+        pending = np.concatenate(self._pending) if self._pending else None
+        chunks = []
+        start = 0
+        hop = self.chunk_length - self.overlap
+        while self._pending_length - start >= self.chunk_length:
+            chunks.append(pending[start : start + self.chunk_length])
+            start += hop
+        # remaining samples only form a chunk of their own when the
+        # stream is closed and they are not all shared with the last one
+        remaining = self._pending_length - start
+        if final and remaining > (self.overlap if self._tail or chunks else 0):
+            chunks.append(pending[start:])
+            start = self._pending_length
+        self._pending = [pending[start:]] if pending is not None else []
+        self._pending_length -= start
+        return chunks
+
+    def _merge(
+        self, prediction: Dict[str, np.ndarray], length: int, last: bool
+    ) -> Dict[str, np.ndarray]:
+        merged = {}
+        for name, stem in prediction.items():
+            stem = stem[:length]
+            tail = self._tail.get(name)
+            parts = []
+            head = 0
+            if tail is not None:
+                head = self.overlap
+                parts.append(
+                    tail * self.fade_out[:, None]
+                    + stem[:head] * self.fade_in[:, None]
+                )
+            end = len(stem) if last else len(stem) - self.overlap
+            parts.append(stem[head:end])
+            if not last:
+                self._tail[name] = np.array(stem[end:], dtype=np.float32)
+            merged[name] = np.concatenate(parts).astype(np.float32)
+        return merged
+
+    def _separate(
+        self, chunks: List[np.ndarray], final: bool
+    ) -> Dict[str, List[np.ndarray]]:
+        separated: Dict[str, List[np.ndarray]] = {}
+        for i in range(0, len(chunks), self.batch_size):
+            batch = chunks[i : i + self.batch_size]
+            predictions = self._predict_batch(batch)
+            for j, (chunk, prediction) in enumerate(zip(batch, predictions)):
+                last = final and i + j == len(chunks) - 1
+                merged = self._merge(prediction, len(chunk), last)
+                for name, stem in merged.items():
+                    separated.setdefault(name, []).append(stem)
+        return separated
+
+    def push(self, frames: np.ndarray) -> Dict[str, np.ndarray]:
+        """Add frames, returns the separated samples that are final."""
+        self._pending.append(frames)
+        self._pending_length += len(frames)
+        if self._pending_length < self.chunk_length * self.batch_size:
+            return {}
+        separated = self._separate(self._take_chunks(final=False), False)
+        return {k: np.concatenate(v) for k, v in separated.items()}
+
+    def close(self) -> Dict[str, np.ndarray]:
+        """Separate the remaining frames, returns the last samples."""
+        separated = self._separate(self._take_chunks(final=True), True)
+        if not separated:
+            # the last chunk ended with the stream, its tail is final
+            separated = {name: [tail] for name, tail in self._tail.items()}
+        self._tail = {}
+        return {k: np.concatenate(v) for k, v in separated.items()}
@@ -0,0 +1,208 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from api.separator.chunk import OverlapAdd
+
+# tmpfs backed files are shared memory, avoids pickling PCM
+SHARED_MEMORY_DIR = "/dev/shm"
+
+# separator of the current pool process
+_separator = None
+
+
+def _init_process(stems: int, options: dict) -> None:
+    global _separator
+    from api.separator.separate import SpleeterSeparator
+
+    # separates in process, within the share of the budget of the pool
+    _separator = SpleeterSeparator(stems, **options)
+    _separator.warm_up()
+
+
+def _shared_memory_dir() -> str:
+    if os.path.isdir(SHARED_MEMORY_DIR):
+        return SHARED_MEMORY_DIR
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _chunk_path(directory: str, index: int, name: str) -> str:
+    return os.path.join(directory, f"{index}.{name}")
+
+
+def _separate_chunk(
+    path: str,
+    shape: Tuple[int, int],
+    start: int,
+    end: int,
+    directory: str,
+    index: int,
+) -> Dict[str, Tuple[int, int]]:
+    waveform = np.memmap(path, dtype=np.float32, mode="r", shape=shape)
+    prediction = _separator._predict(np.asarray(waveform[start:end]))
+    shapes = {}
+    for name, stem in prediction.items():
+        output = np.memmap(
+            _chunk_path(directory, index, name),
+            dtype=np.float32,
+            mode="w+",
+            shape=stem.shape,
+        )
+        output[:] = stem
+        output.flush()
+        shapes[name] = stem.shape
+    return shapes
+
+
+class ChunkPool:
+    """Pool of processes each holding a warm spleeter model. The
+    waveform and the chunk predictions are exchanged through memory
+    mapped files on tmpfs, only chunk indices and shapes are pickled.
+    Predictions are merged in chunk order as they complete.
+
+        NOTE: processes are spawned, hence the pool can not be used
+            from a daemonic process (celery prefork pool), run the
+            worker with the solo or threads pool instead.
+    """
+
+    def __init__(self, processes: int, stems: int, **options):
+        """
+            Args:
+                options: arguments of the `SpleeterSeparator` of every
+                    process, e.g. its `memory_budget`.
+        """
+        self.processes = processes
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=get_context("spawn"),
+            initializer=_init_process,
+            initargs=(stems, options),
+        )
+
+    def start(self) -> None:
+        """Spawn every process and wait until its model is loaded."""
+        futures = [self._executor.submit(_ping) for _ in range(self.processes)]
+        for future in futures:
+            future.result()
+
+    def separate(
+        self,
+        waveform: np.ndarray,
+        spans: List[Tuple[int, int]],
+        merger: OverlapAdd,
+    ) -> None:
+        with tempfile.TemporaryDirectory(
+            dir=_shared_memory_dir()
+        ) as directory:
+            path = os.path.join(directory, "waveform")
+            shared = np.memmap(
+                path, dtype=np.float32, mode="w+", shape=waveform.shape
+            )
+            shared[:] = waveform
+            shared.flush()
+            del shared
+
+            futures = [
+                self._executor.submit(
+                    _separate_chunk,
+                    path,
+                    waveform.shape,
+                    start,
+                    end,
+                    directory,
+                    index,
+                )
+                for index, (start, end) in enumerate(spans)
+            ]
+            try:
+                for index, ((start, end), future) in enumerate(
+                    zip(spans, futures)
+                ):
+                    shapes = future.result()
+                    self._merge(directory, index, start, end, shapes, merger)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def separate_chunks(
+        self, chunks: List[np.ndarray]
+    ) -> List[Dict[str, np.ndarray]]:
+        """Separate chunks concurrently, one per process."""
+        with tempfile.TemporaryDirectory(
+            dir=_shared_memory_dir()
+        ) as directory:
+            futures = []
+            for index, chunk in enumerate(chunks):
+                path = _chunk_path(directory, index, "input")
+                shared = np.memmap(
+                    path, dtype=np.float32, mode="w+", shape=chunk.shape
+                )
+                shared[:] = chunk
+                shared.flush()
+                del shared
+                futures.append(
+                    self._executor.submit(
+                        _separate_chunk,
+                        path,
+                        chunk.shape,
+                        0,
+                        len(chunk),
+                        directory,
+                        index,
+                    )
+                )
+            try:
+                return [
+                    self._load(directory, index, future.result())
+                    for index, future in enumerate(futures)
+                ]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _load(
+        self, directory: str, index: int, shapes: Dict[str, Tuple[int, int]]
+    ) -> Dict[str, np.ndarray]:
+        prediction = {}
+        for name, shape in shapes.items():
+            path = _chunk_path(directory, index, name)
+            prediction[name] = np.array(
+                np.memmap(path, dtype=np.float32, mode="r", shape=shape)
+            )
+            os.remove(path)
+        return prediction
+
+    def _merge(
+        self,
+        directory: str,
+        index: int,
+        start: int,
+        end: int,
+        shapes: Dict[str, Tuple[int, int]],
+        merger: OverlapAdd,
+    ) -> None:
+        prediction = {
+            name: np.memmap(
+                _chunk_path(directory, index, name),
+                dtype=np.float32,
+                mode="r",
+                shape=shape,
+            )
+            for name, shape in shapes.items()
+        }
+        merger.add(start, end, prediction)
+        del prediction
+        for name in shapes:
+            os.remove(_chunk_path(directory, index, name))
+
+    def close(self) -> None:
+        self._executor.shutdown()
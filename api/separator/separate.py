@@ -1,8 +1,27 @@
+import threading
 import numpy as np
-from typing import Dict
+from typing import Callable, Dict, List
 from spleeter.separator import Separator
+from tensorflow.errors import ResourceExhaustedError
 
 from api.separator import Separator as ABCSeparator
+from api.separator.chunk import (
+    OverlapAdd,
+    StreamingOverlapAdd,
+    Window,
+    budget_chunk_length,
+    chunk_spans,
+    estimate_chunk_bytes,
+    predict_split,
+)
+from api.separator.pool import ChunkPool
+
+
+def _predict_each(predict: Callable[[np.ndarray], Dict[str, np.ndarray]]):
+    def predict_batch(chunks: List[np.ndarray]) -> List[Dict]:
+        return [predict(chunk) for chunk in chunks]
+
+    return predict_batch
 
 
 class SpleeterSeparator(ABCSeparator):
@@ -10,12 +29,45 @@ class SpleeterSeparator(ABCSeparator):
     to separate music sources.
     """
 
-    def __init__(self, stems: int, chunk_size=2):
+    # rough resident size of one U-Net estimator (checkpoint and graph)
+    model_bytes_per_stem = 200 * 1024 ** 2
+    # samples in one model segment (T=512 frames with a hop of 1024)
+    segment_samples = 512 * 1024
+    # samples shared by the halves of a chunk split after running out
+    # of memory, one second at the model sample rate
+    split_overlap = 44_100
+    # longest chunk derived from the budget when the batch size is too,
+    # the rest of the budget goes to batching chunks
+    batch_chunk_seconds = 30
+
+    def __init__(
+        self,
+        stems: int,
+        chunk_size: float = None,
+        overlap: float = 1,
+        window: Window = Window.Hann,
+        batch_size: int = 1,
+        memory_budget: int = 4 * 1024 ** 3,
+        processes: int = 0,
+    ):
         """
             Args:
                 stems (int): total files to generate (2/3/5).
-                chunk_size (int): chunk size (in seconds) indicates
+                chunk_size (float): chunk size (in minutes) indicates
                     duration size of individual chunk before splitting.
+                    None derives it from `memory_budget`, the channels
+                    and the sample rate of the signal.
+                overlap (float): duration (in seconds) shared by
+                    consecutive chunks, crossfaded to avoid seams.
+                window (Window): crossfade window used on the overlap.
+                batch_size (int): chunks of a signal separated in one
+                    forward pass, None derives it from `memory_budget`.
+                memory_budget (int): memory (in bytes) available for
+                    inference, shared by the processes. Chunks running
+                    out of memory anyway are split in halves and
+                    separated again.
+                processes (int): separate chunks in a pool of processes,
+                    each with its own model. 0 separates in process.
                 NOTE: Longer audio file takes more memory. Hence, splitting
                     the audio is a workaround.
         """
@@ -24,27 +76,207 @@ class SpleeterSeparator(ABCSeparator):
         # hence, it should be specified which model
         # to load.
         self.stems = stems
-        # in minutes
-        self.chunk_size = int(chunk_size * 60)
+        # in seconds
+        self.chunk_size = chunk_size * 60 if chunk_size else None
+        self.overlap = overlap
+        self.window = Window(window)
+        self.batch_size = batch_size
+        self.memory_budget = memory_budget
+        self.processes = processes
+        self._pool = None
+        # chunks at least as long ran out of memory, they are split
+        self._max_chunk_length = None
+        if self.chunk_size and 2 * self.overlap >= self.chunk_size:
+            raise ValueError("Overlap must be less than half the chunk size")
 
         self._separator = Separator(
             f"spleeter:{self.stems}stems", multiprocess=False
         )
+        # a loaded separator is shared by the jobs of a worker process,
+        # spleeter's predictor must not be driven by two jobs at once
+        self._lock = threading.Lock()
 
         # spleeter specific config
         # self._audio_adapter = get_default_audio_adapter()
 
+    @property
+    def memory_footprint(self) -> int:
+        models = max(self.processes, 1)
+        return models * self.stems * self.model_bytes_per_stem
+
+    def warm_up(self, sample_rate=44_100) -> None:
+        """Build the tensorflow graph and load the checkpoint by
+        separating one second of silence.
+        """
+        if self.processes:
+            self._chunk_pool().start()
+            return
+        self.separate(np.zeros((sample_rate, 2), dtype=np.float32))
+
+    def _chunk_pool(self) -> ChunkPool:
+        if self._pool is None:
+            self._pool = ChunkPool(
+                self.processes,
+                self.stems,
+                memory_budget=self._process_budget,
+                overlap=self.overlap,
+                window=self.window,
+            )
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def _predict(self, chunk: np.ndarray) -> Dict[str, np.ndarray]:
+        """Separate a chunk, split in halves if it runs out of memory."""
+        if self._max_chunk_length and len(chunk) > self._max_chunk_length:
+            return self._predict_split(chunk)
+        try:
+            with self._lock:
+                return self._separator.separate(chunk)
+        except (ResourceExhaustedError, MemoryError):
+            if len(chunk) <= self.segment_samples:
+                raise
+        self._max_chunk_length = len(chunk) - 1
+        return self._predict_split(chunk)
+
+    def _predict_split(self, chunk: np.ndarray) -> Dict[str, np.ndarray]:
+        overlap = min(self.split_overlap, len(chunk) // 4)
+        return predict_split(self._predict, chunk, overlap, self.window)
+
+    def separate_batch(
+        self, waveforms: List[np.ndarray]
+    ) -> List[Dict[str, np.ndarray]]:
+        """Separate several waveforms with a single forward pass.
+            Waveforms are zero padded to whole model segments and
+            concatenated, hence no segment mixes two waveforms.
+            Args:
+                waveforms (list[array]): signals to separate.
+            Returns:
+                predictions (list[dict]): separated signals in order.
+        """
+        spans = []
+        offset = 0
+        for waveform in waveforms:
+            spans.append((offset, offset + len(waveform)))
+            segments = -(-len(waveform) // self.segment_samples)
+            offset += max(segments, 1) * self.segment_samples
+
+        channels = max(waveform.shape[1] for waveform in waveforms)
+        batch = np.zeros((offset, channels), dtype=np.float32)
+        for (start, end), waveform in zip(spans, waveforms):
+            # mono signals are broadcast to every channel
+            batch[start:end] = waveform
+
+        prediction = self._predict(batch)
+        return [
+            {name: stem[start:end] for name, stem in prediction.items()}
+            for start, end in spans
+        ]
+
+    @property
+    def _process_budget(self) -> int:
+        # every process of the pool separates its own chunks
+        return self.memory_budget // max(self.processes, 1)
+
+    def _budget_chunk_length(self, sr: int, channels: int) -> int:
+        # spleeter separates mono signals as stereo
+        samples = budget_chunk_length(
+            self._process_budget // (self.batch_size or 1),
+            max(channels, 2),
+            self.stems,
+        )
+        if self.batch_size is None:
+            samples = min(samples, int(self.batch_chunk_seconds * sr))
+        # whole model segments, at least one
+        samples -= samples % self.segment_samples
+        return max(samples, self.segment_samples)
+
+    def _chunk_length(self, sr, channels=2) -> int:
+        if self.chunk_size is None:
+            return self._budget_chunk_length(sr, channels)
+        chunk_length = int(self.chunk_size * sr)
+        if self.batch_size == 1:
+            return chunk_length
+        # batched chunks spanning whole segments need no padding
+        rounded = chunk_length - chunk_length % self.segment_samples
+        if rounded > 2 * self.overlap * sr:
+            return rounded
+        return chunk_length
+
+    def _batch_size(self, chunk_length: int, channels: int) -> int:
+        if self.batch_size:
+            return self.batch_size
+        # spleeter separates mono signals as stereo
+        chunk_bytes = estimate_chunk_bytes(
+            chunk_length, max(channels, 2), self.stems
+        )
+        return max(1, self._process_budget // chunk_bytes)
+
     def _chunk(self, waveform, sr):
-        length = len(waveform) // sr
-        print(len(waveform), len(waveform) / sr)
-        for c in range(0, length, self.chunk_size):
-            print(c)
-            chunk = waveform[c * sr : (c + self.chunk_size) * sr]
-            print(len(chunk))
-            yield chunk
+        spans = chunk_spans(
+            len(waveform),
+            self._chunk_length(sr, waveform.shape[1]),
+            int(self.overlap * sr),
+        )
+        for start, end in spans:
+            yield start, end, waveform[start:end]
+
+    def _chunk_batches(self, waveform, sr):
+        chunk_length = self._chunk_length(sr, waveform.shape[1])
+        batch_size = self._batch_size(chunk_length, waveform.shape[1])
+        batch = []
+        for chunk in self._chunk(waveform, sr):
+            batch.append(chunk)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def stream(
+        self,
+        sample_rate=44_100,
+        predict: Callable[[np.ndarray], Dict[str, np.ndarray]] = None,
+    ) -> StreamingOverlapAdd:
+        """Open a stream separating a signal pushed frame by frame.
+            Chunks are separated as in `separate`, only a batch of
+            chunks is held in memory at a time.
+            Args:
+                sample_rate (int): sampling rate of the signal.
+                predict (callable): separates a single chunk.
+            Returns:
+                stream (StreamingOverlapAdd): separated samples are
+                    returned by `push` and `close` once final.
+        """
+        chunk_length = self._chunk_length(sample_rate)
+        batch_size = 1
+        if predict is not None:
+            predict_batch = _predict_each(predict)
+        elif self.processes:
+            predict_batch = self._chunk_pool().separate_chunks
+            batch_size = self.processes
+        elif self.batch_size != 1:
+            predict_batch = self.separate_batch
+            batch_size = self._batch_size(chunk_length, channels=2)
+        else:
+            predict_batch = _predict_each(self._predict)
+
+        return StreamingOverlapAdd(
+            chunk_length,
+            int(self.overlap * sample_rate),
+            predict_batch,
+            self.window,
+            batch_size,
+        )
 
     def separate(
-        self, waveform: np.ndarray, sample_rate=44_100
+        self,
+        waveform: np.ndarray,
+        sample_rate=44_100,
+        predict: Callable[[np.ndarray], Dict[str, np.ndarray]] = None,
     ) -> Dict[str, np.ndarray]:
         """Separate audio into specified stems.
             Note: Spleeter uses tensorflow backend. Hence, corresponding
@@ -54,25 +286,39 @@ class SpleeterSeparator(ABCSeparator):
                 audio_file (str, array): path to the original signal
                                             or the signal itself.
                 sample_rate (int): sampling rate of the file.
+                predict (callable): separates a single chunk, defaults
+                    to the spleeter model of this separator. Chunks are
+                    batched or sent to the process pool only when it is
+                    not given.
             Returns:
                 signal (Signal): separated signals.
             Raises:
-                tf.errors.ResourceExhaustedError: When memory gets exhausted.
+                tf.errors.ResourceExhaustedError: When memory gets exhausted
+                    even for a single model segment.
         """
-        print(waveform.shape)
-        # predict in chunks
-        prediction = {}
-        for chunk in self._chunk(waveform, sample_rate):
-            chunk_prediction = self._separator.separate(chunk)
-
-            for chunk_key, chunk_value in chunk_prediction.items():
-                if chunk_key not in prediction:
-                    prediction[chunk_key] = []
-                prediction.get(chunk_key).append(chunk_value)
-
-        # merge chunk prediction
-        prediction = {k: np.vstack(v) for k, v in prediction.items()}
-        print(list(v.shape for v in prediction.values()))
-        # signal = Signal(prediction.keys(), prediction.values())
-
-        return prediction
+        # predict in chunks, merged in place into preallocated stems
+        merger = OverlapAdd(
+            len(waveform), int(self.overlap * sample_rate), self.window
+        )
+        if predict is None and self.processes:
+            spans = chunk_spans(
+                len(waveform),
+                self._chunk_length(sample_rate, waveform.shape[1]),
+                int(self.overlap * sample_rate),
+            )
+            self._chunk_pool().separate(waveform, spans, merger)
+            return merger.buffers
+
+        if predict is None and self.batch_size != 1:
+            for batch in self._chunk_batches(waveform, sample_rate):
+                starts, ends, chunks = zip(*batch)
+                predictions = self.separate_batch(list(chunks))
+                for start, end, prediction in zip(starts, ends, predictions):
+                    merger.add(start, end, prediction)
+            return merger.buffers
+
+        predict = predict or self._predict
+        for start, end, chunk in self._chunk(waveform, sample_rate):
+            merger.add(start, end, predict(chunk))
+
+        return merger.buffers
@@ -1,13 +1,23 @@
 from .signal import (
     create_signal,
     read_signal,
+    find_signal,
     remove_signal,
     save_signal_file,
+    save_signal_stream,
     read_signal_file,
+    read_signal_file_by_id,
+    open_signal_file,
+    chunk_range,
     create_stem,
     save_stem_file,
     update_signal,
+    complete_signal,
+    add_signal_stem,
+    remove_signal_stem,
+    rename_signal_stem,
     get_stem_id,
+    find_stem_file_id,
     read_one_signal,
     delete_signal_file,
     get_signal_state,
@@ -16,6 +26,27 @@ from .signal import (
     validate_user_signal,
     rename_file,
     copy_file,
+    retain_file,
+    release_file,
+    release_files,
     update_stem,
+    StemWriter,
 )
+from .content import (
+    claim_content,
+    complete_content,
+    release_content,
+    link_content,
+)
+from .rendition import (
+    parse_renditions,
+    read_rendition,
+    create_rendition,
+    stream_rendition,
+    create_renditions,
+    delete_renditions,
+    evict_renditions,
+)
+from .peaks import save_peaks, read_peaks, delete_peaks
+from .deletion import delete_signals
 from .user import create_user, get_user
@@ -0,0 +1,193 @@
+from datetime import datetime, timedelta
+from typing import Coroutine, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from gridfs.errors import NoFile
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from api.schemas import (
+    SignalInDB,
+    SeparatedSignal,
+    SignalContent,
+    SignalContentFollower,
+)
+from api.utils.codec import StemCodec
+from api.config import content_collection_name, CONTENT_CLAIM_TIMEOUT_MINUTES
+from api.services.signal import (
+    complete_signal,
+    release_file,
+    retain_file,
+)
+
+
+# separations are claimed again once their worker is presumed lost
+CONTENT_CLAIM_TIMEOUT = timedelta(minutes=CONTENT_CLAIM_TIMEOUT_MINUTES)
+
+
+def _content_key(content_hash: str, stems: int) -> str:
+    # unique _id makes concurrent claims of the same content atomic
+    return f"{content_hash}:{stems}"
+
+
+def _collection(conn: AsyncIOMotorClient):
+    return conn.get_default_database().get_collection(content_collection_name)
+
+
+async def claim_content(
+    conn: AsyncIOMotorClient,
+    content_hash: str,
+    stems: int,
+    signal_id: str,
+    username: str,
+) -> Coroutine[Optional[SignalContent], None, None]:
+    """Claim the separation of a signal file content.
+        Returns:
+            content (SignalContent): None if the signal has to be
+                separated. Otherwise the content was separated
+                (`content.separated`) or is being separated, in which
+                case the signal was added to the followers and is
+                completed along with it. A separation claimed longer
+                than `CONTENT_CLAIM_TIMEOUT` ago, e.g. by a killed
+                worker, is taken over with its followers.
+    """
+    key = _content_key(content_hash, stems)
+    claimed_at = datetime.utcnow()
+    content = SignalContent(
+        content_hash=content_hash,
+        stems=stems,
+        signal_id=signal_id,
+        username=username,
+        claimed_at=claimed_at,
+    )
+    follower = SignalContentFollower(signal_id=signal_id, username=username)
+    while True:
+        try:
+            row = await _collection(conn).find_one_and_update(
+                {"_id": key}, {"$setOnInsert": content.dict()}, upsert=True
+            )
+        except DuplicateKeyError:
+            # concurrent claim inserted it first
+            continue
+        if row is None:
+            return None
+        row = await _collection(conn).find_one_and_update(
+            {
+                "_id": key,
+                "separated": False,
+                # claims without time predate the timeout
+                "claimed_at": {
+                    "$not": {"$gte": claimed_at - CONTENT_CLAIM_TIMEOUT}
+                },
+            },
+            {
+                "$set": {
+                    "signal_id": signal_id,
+                    "username": username,
+                    "claimed_at": claimed_at,
+                }
+            },
+        )
+        if row is not None:
+            return None
+        row = await _collection(conn).find_one_and_update(
+            {"_id": key, "separated": False},
+            {"$push": {"followers": follower.dict()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if row is None:
+            row = await _collection(conn).find_one({"_id": key})
+        if row is not None:
+            return SignalContent(**row)
+        # released meanwhile, claim it again
+
+
+async def complete_content(
+    conn: AsyncIOMotorClient,
+    content_hash: str,
+    stems: int,
+    stem_ids: Dict[str, str],
+    codec: StemCodec,
+) -> Coroutine[List[SignalContentFollower], None, None]:
+    """Mark the content as separated, returns the signals waiting
+    for its separation.
+    """
+    row = await _collection(conn).find_one_and_update(
+        {"_id": _content_key(content_hash, stems)},
+        {
+            "$set": {
+                "separated": True,
+                "stem_ids": stem_ids,
+                "codec": codec,
+                "followers": [],
+            }
+        },
+    )
+    if row is None:
+        return []
+    return SignalContent(**row).followers
+
+
+async def release_content(
+    conn: AsyncIOMotorClient,
+    content_hash: str,
+    stems: int,
+    signal_id: str = None,
+) -> Coroutine[List[SignalContentFollower], None, None]:
+    """Forget the content so that it is separated again next time,
+        returns the signals that were waiting for its separation.
+
+        Args:
+            signal_id (str): only release the claim of this signal, it
+                may have been taken over since.
+    """
+    filter_args = {"_id": _content_key(content_hash, stems)}
+    if signal_id is not None:
+        filter_args["signal_id"] = signal_id
+    row = await _collection(conn).find_one_and_delete(filter_args)
+    if row is None:
+        return []
+    return SignalContent(**row).followers
+
+
+async def link_content(
+    conn: AsyncIOMotorClient,
+    stem_ids: Dict[str, str],
+    signal: SignalInDB,
+    username: str,
+    codec: StemCodec,
+    signal_state: str = None,
+) -> Coroutine[bool, None, None]:
+    """Share the stems of the separated content with the signal.
+        Args:
+            stem_ids (dict): file id of every stem of the content.
+            codec (StemCodec): codec of the stem files.
+            signal_state (str): state the linked signal is set to.
+        Returns:
+            linked (bool): False if a stem file no longer exists.
+    """
+    retained = {}
+    try:
+        for stem_name, file_id in stem_ids.items():
+            await retain_file(conn, file_id)
+            retained[stem_name] = file_id
+    except NoFile:
+        for file_id in retained.values():
+            await release_file(conn, file_id)
+        return False
+
+    stems = [
+        SeparatedSignal(
+            signal_id=stem_id,
+            signal_metadata=signal.signal_metadata,
+            stem_name=stem_name,
+            parent_id=signal.signal_id,
+            augmented=False,
+            codec=codec,
+        )
+        for stem_name, stem_id in retained.items()
+    ]
+    await complete_signal(
+        conn, signal.signal_id, username, stems, signal_state
+    )
+    return True
@@ -0,0 +1,97 @@
+import asyncio
+from typing import Coroutine, List
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+from api.schemas import SignalInDB
+from api.config import (
+    signal_collection_name,
+    stem_collection_name,
+    signal_state_collection_name,
+)
+from api.services.signal import release_files
+from api.services.rendition import delete_renditions
+from api.services.peaks import delete_peaks
+
+
+async def _claim_signals(
+    conn: AsyncIOMotorClient, signal_ids: List[str], username: str
+) -> List[SignalInDB]:
+    # only the request deleting a signal releases its files
+    collection = conn.get_default_database().get_collection(
+        signal_collection_name
+    )
+    rows = await asyncio.gather(
+        *(
+            collection.find_one_and_delete(
+                {"signal_id": signal_id, "username": username}
+            )
+            for signal_id in dict.fromkeys(signal_ids)
+        )
+    )
+    return [SignalInDB(**row) for row in rows if row is not None]
+
+
+async def delete_signals(
+    conn: AsyncIOMotorClient,
+    signal_ids: List[str],
+    username: str,
+    signal_state: str = None,
+) -> Coroutine[List[str], None, None]:
+    """Delete signals of a user with their stems. The signals are
+        deleted concurrently, their stems and states are written in bulk.
+        Files shared by copies are released, the files deleted with their
+        last reference take their renditions and peaks with them.
+
+        Args:
+            signal_state (str): state kept for the deleted signals, if any.
+        Returns:
+            deleted (list): ids of the deleted signals, in order.
+    """
+    signals = await _claim_signals(conn, signal_ids, username)
+    if not signals:
+        return []
+    db = conn.get_default_database()
+    deleted = [signal.signal_id for signal in signals]
+    stem_ids = [
+        stem_id for signal in signals for stem_id in signal.separated_stem_id
+    ]
+    file_ids = [signal.file_id or signal.signal_id for signal in signals]
+
+    stems = db.get_collection(stem_collection_name).delete_many(
+        {
+            "username": username,
+            "$or": [
+                {"parent_id": {"$in": deleted}},
+                # stems without parent are legacy
+                {"parent_id": None, "signal_id": {"$in": stem_ids}},
+            ],
+        }
+    )
+    writes = [stems]
+    if signal_state is not None:
+        # states outlive their signal
+        writes.append(
+            db.get_collection(signal_state_collection_name).bulk_write(
+                [
+                    UpdateOne(
+                        {"signal_id": signal_id, "username": username},
+                        {"$set": {"signal_state": signal_state}},
+                        upsert=True,
+                    )
+                    for signal_id in deleted
+                ],
+                ordered=False,
+            )
+        )
+    deleted_files, *_ = await asyncio.gather(
+        release_files(conn, stem_ids + file_ids), *writes
+    )
+
+    deleted_stems = set(stem_ids).intersection(deleted_files)
+    await asyncio.gather(
+        *(delete_renditions(conn, stem_id) for stem_id in deleted_stems),
+        *(delete_peaks(conn, stem_id) for stem_id in deleted_stems),
+    )
+    return deleted
@@ -0,0 +1,112 @@
+from typing import Coroutine, List, Optional
+
+import numpy as np
+from bson.binary import Binary
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from api.schemas import StemPeaks
+from api.config import peaks_collection_name
+from api.utils.peaks import PEAK_FRAMES, PEAK_LEVEL_FACTOR, PEAK_VALUES
+
+# peaks stored per document, a range only reads the documents holding it
+PEAK_BLOCK_SIZE = 64 * 1024
+
+
+def _collection(conn: AsyncIOMotorClient):
+    return conn.get_default_database().get_collection(peaks_collection_name)
+
+
+def _peaks_key(stem_file_id: str, level: int, block: int) -> str:
+    return f"{stem_file_id}:{level}:{block}"
+
+
+async def save_peaks(
+    conn: AsyncIOMotorClient,
+    stem_file_id: str,
+    sample_rate: int,
+    levels: List[np.ndarray],
+) -> Coroutine[None, None, None]:
+    """Store the peaks of a stem file, e.g. built by `PeakBuilder`.
+        Stem files are immutable and shared by copies, so are peaks.
+
+        Args:
+            levels (list): (peaks, 3) int8 arrays, finest level first.
+    """
+    rows = []
+    for level, peaks in enumerate(levels):
+        frames_per_peak = PEAK_FRAMES * PEAK_LEVEL_FACTOR ** level
+        starts = range(0, max(len(peaks), 1), PEAK_BLOCK_SIZE)
+        for block, start in enumerate(starts):
+            data = peaks[start : start + PEAK_BLOCK_SIZE].tobytes()
+            rows.append(
+                {
+                    "_id": _peaks_key(stem_file_id, level, block),
+                    "stem_file_id": stem_file_id,
+                    "level": level,
+                    "block": block,
+                    "frames_per_peak": frames_per_peak,
+                    "sample_rate": sample_rate,
+                    "length": len(peaks),
+                    "data": Binary(data),
+                }
+            )
+    collection = _collection(conn)
+    # written again when a separation is retried
+    await collection.delete_many({"stem_file_id": stem_file_id})
+    await collection.insert_many(rows)
+
+
+async def read_peaks(
+    conn: AsyncIOMotorClient,
+    stem_file_id: str,
+    level: int,
+    start: float = 0,
+    end: float = None,
+) -> Coroutine[Optional[StemPeaks], None, None]:
+    """Peaks of a stem file at a level between `start` and `end` seconds.
+        Returns:
+            peaks (StemPeaks): None if the stem has no peaks at this level.
+    """
+    collection = _collection(conn)
+    row = await collection.find_one(
+        {"_id": _peaks_key(stem_file_id, level, 0)}, {"data": 0}
+    )
+    if row is None:
+        return None
+    frames_per_peak, length = row["frames_per_peak"], row["length"]
+    seconds_per_peak = frames_per_peak / row["sample_rate"]
+    first = min(int(max(start, 0) // seconds_per_peak), length)
+    last = length
+    if end is not None:
+        last = min(int(-(-end // seconds_per_peak)), length)
+    last = max(first, last)
+
+    first_block = first // PEAK_BLOCK_SIZE
+    cursor = collection.find(
+        {
+            "stem_file_id": stem_file_id,
+            "level": level,
+            "block": {
+                "$gte": first_block,
+                "$lt": -(-last // PEAK_BLOCK_SIZE),
+            },
+        }
+    ).sort("block", 1)
+    data = b"".join([block["data"] async for block in cursor])
+    offset = first_block * PEAK_BLOCK_SIZE
+    peaks = np.frombuffer(data, dtype=np.int8).reshape(-1, PEAK_VALUES)
+    return StemPeaks(
+        level=level,
+        sample_rate=row["sample_rate"],
+        frames_per_peak=frames_per_peak,
+        start=first,
+        length=length,
+        peaks=peaks[first - offset : last - offset].ravel().tolist(),
+    )
+
+
+async def delete_peaks(
+    conn: AsyncIOMotorClient, stem_file_id: str
+) -> Coroutine[None, None, None]:
+    """Delete the peaks of a deleted stem file."""
+    await _collection(conn).delete_many({"stem_file_id": stem_file_id})
@@ -0,0 +1,232 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Coroutine, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import ReturnDocument
+
+from api.schemas import Rendition
+from api.config import rendition_collection_name, grid_bucket_name
+from api.utils.codec import RenditionFormat
+from api.utils.ffmpeg import encode_rendition
+from api.utils.http import RENDITION_MEDIA_TYPES
+from api.services.signal import (
+    delete_signal_file,
+    read_signal_file_by_id,
+)
+
+# renditions served recently are never evicted, they may be downloading
+RENDITION_MIN_IDLE = timedelta(minutes=10)
+
+
+def parse_renditions(presets: str) -> List[Tuple[RenditionFormat, int]]:
+    """Parse comma separated format:bitrate pairs, e.g. "opus:96"."""
+    renditions = []
+    for preset in filter(None, map(str.strip, presets.split(","))):
+        rendition_format, bitrate = preset.split(":")
+        renditions.append((RenditionFormat(rendition_format), int(bitrate)))
+    return renditions
+
+
+def _rendition_key(
+    stem_file_id: str, rendition_format: RenditionFormat, bitrate: int
+) -> str:
+    # stem files are immutable and shared by copies, so are renditions
+    return f"{stem_file_id}:{rendition_format.value}:{bitrate}"
+
+
+def _collection(conn: AsyncIOMotorClient):
+    return conn.get_default_database().get_collection(
+        rendition_collection_name
+    )
+
+
+async def read_rendition(
+    conn: AsyncIOMotorClient,
+    stem_file_id: str,
+    rendition_format: RenditionFormat,
+    bitrate: int,
+) -> Coroutine[Optional[Rendition], None, None]:
+    """Cached rendition of a stem file, marked as served now.
+        Returns:
+            rendition (Rendition): None if it is not cached.
+    """
+    row = await _collection(conn).find_one_and_update(
+        {"_id": _rendition_key(stem_file_id, rendition_format, bitrate)},
+        {"$set": {"accessed_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if row is None:
+        return None
+    return Rendition(**row)
+
+
+async def _cache_rendition(
+    conn: AsyncIOMotorClient,
+    stem_file_id: str,
+    rendition_format: RenditionFormat,
+    bitrate: int,
+    chunks: AsyncIterator[bytes],
+) -> AsyncIterator[bytes]:
+    # the rendition is yielded while it is encoded and stored
+    key = _rendition_key(stem_file_id, rendition_format, bitrate)
+    fs = AsyncIOMotorGridFSBucket(
+        conn.get_default_database(), bucket_name=grid_bucket_name
+    )
+    grid_in = fs.open_upload_stream(
+        key, metadata={"contentType": RENDITION_MEDIA_TYPES[rendition_format]}
+    )
+    encoded = encode_rendition(chunks, rendition_format, bitrate)
+    size = 0
+    try:
+        async for chunk in encoded:
+            await grid_in.write(chunk)
+            size += len(chunk)
+            yield chunk
+        await grid_in.close()
+    except BaseException:
+        # e.g. the client went away, nothing is cached
+        await grid_in.abort()
+        raise
+    finally:
+        await encoded.aclose()
+    rendition = Rendition(
+        stem_file_id=stem_file_id,
+        rendition_format=rendition_format,
+        bitrate=bitrate,
+        file_id=str(grid_in._id),
+        size=size,
+        accessed_at=datetime.utcnow(),
+    )
+    result = await _collection(conn).update_one(
+        {"_id": key}, {"$setOnInsert": rendition.dict()}, upsert=True
+    )
+    if result.upserted_id is None:
+        # cached by a concurrent request meanwhile
+        await delete_signal_file(conn, rendition.file_id)
+
+
+async def stream_rendition(
+    conn: AsyncIOMotorClient,
+    stem_file_id: str,
+    rendition_format: RenditionFormat,
+    bitrate: int,
+) -> Coroutine[Optional[AsyncIterator[bytes]], None, None]:
+    """Transcode a stem file for a client and cache the rendition in
+        GridFS on the way. The stem is transcoded while it is read, the
+        rendition is cached once completely sent. Concurrent requests of
+        a rendition may transcode it twice, the first cached is kept.
+
+        Returns:
+            chunks (async iterator): rendition, None if the stem file
+                does not exist. Iterating raises RuntimeError when ffmpeg
+                fails to transcode the stem.
+    """
+    chunks = await read_signal_file_by_id(conn, stem_file_id)
+    if chunks is None:
+        return None
+    return _cache_rendition(
+        conn, stem_file_id, rendition_format, bitrate, chunks
+    )
+
+
+async def create_rendition(
+    conn: AsyncIOMotorClient,
+    stem_file_id: str,
+    rendition_format: RenditionFormat,
+    bitrate: int,
+) -> Coroutine[Optional[Rendition], None, None]:
+    """Transcode a stem file and cache the rendition in GridFS, unless
+        it is cached already, see `stream_rendition`.
+
+        Returns:
+            rendition (Rendition): None if the stem file does not exist.
+        Raises:
+            RuntimeError: When ffmpeg fails to transcode the stem.
+    """
+    key = _rendition_key(stem_file_id, rendition_format, bitrate)
+    row = await _collection(conn).find_one({"_id": key})
+    if row is not None:
+        return Rendition(**row)
+    chunks = await stream_rendition(
+        conn, stem_file_id, rendition_format, bitrate
+    )
+    if chunks is None:
+        return None
+    async for _ in chunks:
+        pass
+    return await read_rendition(conn, stem_file_id, rendition_format, bitrate)
+
+
+async def create_renditions(
+    conn: AsyncIOMotorClient,
+    stem_file_ids: Iterable[str],
+    presets: List[Tuple[RenditionFormat, int]],
+) -> Coroutine[None, None, None]:
+    """Cache the preset renditions of stem files, e.g. of a separated
+    signal before its stems are first played. The stems are transcoded
+    concurrently, a preset at a time.
+    """
+    for rendition_format, bitrate in presets:
+        await asyncio.gather(
+            *(
+                create_rendition(conn, stem_file_id, rendition_format, bitrate)
+                for stem_file_id in stem_file_ids
+            )
+        )
+
+
+async def _delete_rendition(
+    conn: AsyncIOMotorClient, row: dict, idle=False
+) -> Coroutine[bool, None, None]:
+    query = {"_id": row["_id"]}
+    if idle:
+        # unless it was served since it was found
+        query["accessed_at"] = row["accessed_at"]
+    # the row goes first, a rendition is never served without its file
+    result = await _collection(conn).delete_one(query)
+    if not result.deleted_count:
+        return False
+    try:
+        await delete_signal_file(conn, row["file_id"])
+    except Exception:
+        # deleted concurrently
+        pass
+    return True
+
+
+async def delete_renditions(
+    conn: AsyncIOMotorClient, stem_file_id: str
+) -> Coroutine[None, None, None]:
+    """Delete the cached renditions of a deleted stem file."""
+    async for row in _collection(conn).find({"stem_file_id": stem_file_id}):
+        await _delete_rendition(conn, row)
+
+
+async def evict_renditions(
+    conn: AsyncIOMotorClient, max_size: int
+) -> Coroutine[int, None, None]:
+    """Delete the least recently served renditions while the cached
+        renditions are larger than `max_size` bytes in total.
+
+        Returns:
+            evicted (int): number of renditions deleted.
+    """
+    collection = _collection(conn)
+    totals = await collection.aggregate(
+        [{"$group": {"_id": None, "size": {"$sum": "$size"}}}]
+    ).to_list(1)
+    size = totals[0]["size"] if totals else 0
+    evicted = 0
+    if size <= max_size:
+        return evicted
+    cursor = collection.find(
+        {"accessed_at": {"$lt": datetime.utcnow() - RENDITION_MIN_IDLE}}
+    ).sort("accessed_at", 1)
+    async for row in cursor:
+        if size <= max_size:
+            break
+        if await _delete_rendition(conn, row, idle=True):
+            size -= row["size"]
+            evicted += 1
+    return evicted
@@ -1,13 +1,24 @@
-from typing import Union, Generator, Coroutine, List
+import asyncio
+import hashlib
+import weakref
+from typing import (
+    AsyncIterator,
+    Union,
+    Generator,
+    Coroutine,
+    List,
+    Optional,
+    Tuple,
+)
 import numpy as np
-import librosa
+from collections import defaultdict
 from datetime import datetime
-from tempfile import NamedTemporaryFile
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
 from fastapi import UploadFile
 from gridfs.errors import NoFile
+from pymongo import ReturnDocument
 
 from api.schemas import (
     Signal,
@@ -22,24 +33,49 @@ from api.config import (
     grid_bucket_name,
     signal_state_collection_name,
 )
+from api.utils.signal import read_audio
+from api.utils.codec import StemCodec, StemEncoder, DEFAULT_STEM_CODEC
+
+# bytes read from uploaded files at once, the default GridFS chunk size
+UPLOAD_CHUNK_SIZE = 255 * 1024
+# received chunks buffered while GridFS is slower than the client
+UPLOAD_QUEUE_SIZE = 16
+# frames of a stem encoded at once
+STEM_WRITE_FRAMES = 10 * 44_100
 
 
 def get_stem_id(stem_name: str, signal_id: str) -> str:
     return f"{stem_name}__{signal_id}"
 
 
+def find_stem_file_id(signal: SignalInDB, stem_name: str) -> Optional[str]:
+    """File id of a stem of the signal, stem files are shared by copies
+    of the signal hence they are not found by name.
+    """
+    try:
+        stem_index = signal.separated_stems.index(stem_name)
+    except ValueError:
+        return None
+    return signal.separated_stem_id[stem_index]
+
+
 async def read_one_signal(
     conn: AsyncIOMotorClient, signal_id: str, username: str, stem: str = ""
 ) -> Coroutine[Union[SignalInDB, SeparatedSignalInDB], None, None]:
     collection_name = signal_collection_name
     filter_args = {"signal_id": signal_id, "username": username}
     if stem:
+        # stem files are shared by copies, stems are found by signal
         collection_name = stem_collection_name
-        filter_args = {**filter_args, "stem_name": stem}
+        filter_args = {
+            "parent_id": signal_id,
+            "username": username,
+            "stem_name": stem,
+        }
     row = (
         await conn.get_default_database()
         .get_collection(collection_name)
-        .find_one()
+        .find_one(filter_args)
     )
     if row:
         if stem:
@@ -49,23 +85,77 @@ async def read_one_signal(
     return row
 
 
+def _signal_filter(
+    username: str,
+    after: str = None,
+    projectname: str = None,
+    signal_state: str = None,
+) -> dict:
+    filter_args = {"username": username}
+    if after is not None:
+        # keyset pagination, signals are listed in insertion order
+        filter_args["_id"] = {"$gt": ObjectId(after)}
+    if projectname is not None:
+        filter_args["signal_metadata.projectname"] = projectname
+    if signal_state is not None:
+        filter_args["signal_state"] = signal_state
+    return filter_args
+
+
+def find_signal(
+    conn: AsyncIOMotorClient,
+    username: str,
+    length: int = 20,
+    after: str = None,
+    projectname: str = None,
+    signal_state: str = None,
+    fields: List[str] = None,
+):
+    """Cursor of a page of the signals of a user, rows are not parsed.
+        Args:
+            after (str): `_id` of the last signal of the previous page.
+            projectname (str): only the signals of a project.
+            signal_state (str): only the signals in this state.
+            fields (list): fields of the rows, all if None.
+        Raises:
+            InvalidId: When `after` is not a signal `_id`.
+    """
+    projection = None
+    if fields is not None:
+        projection = {field: 1 for field in fields}
+    return (
+        conn.get_default_database()
+        .get_collection(signal_collection_name)
+        .find(
+            _signal_filter(username, after, projectname, signal_state),
+            projection,
+        )
+        .sort("_id", 1)
+        .limit(length)
+    )
+
+
 async def read_signal(
-    conn: AsyncIOMotorClient, username: str, length: int = 20
+    conn: AsyncIOMotorClient, username: str, length: int = 20, **filters
 ) -> Coroutine[List[SignalInDB], None, None]:
-    rows = (
-        await conn.get_default_database()
-        .get_collection(signal_collection_name)
-        .find({"username": username})
-        .to_list(length=length)
+    rows = await find_signal(conn, username, length, **filters).to_list(
+        length=length
     )
     rows = list(map(lambda x: SignalInDB(**x), rows))
     return rows
 
 
 async def create_signal(
-    conn: AsyncIOMotorClient, signal: Signal, username: str
+    conn: AsyncIOMotorClient,
+    signal: Signal,
+    username: str,
+    separated_stem_id: List[str] = None,
 ) -> Coroutine[SignalInDB, None, None]:
-    signal_in_db = SignalInDB(**signal.dict(), username=username)
+    signal_in_db = SignalInDB(
+        **signal.dict(),
+        username=username,
+        separated_stem_id=separated_stem_id or [],
+    )
     row = (
         await conn.get_default_database()
         .get_collection(signal_collection_name)
@@ -79,30 +169,228 @@ async def create_signal(
     return signal_in_db
 
 
+async def _modify_signal(
+    conn: AsyncIOMotorClient,
+    signal_id: str,
+    username: str,
+    update: dict,
+    filter_args: dict = None,
+    **kwargs,
+) -> Coroutine[Optional[SignalInDB], None, None]:
+    # a single atomic write returning the updated signal
+    update.setdefault("$set", {})["updated_at"] = datetime.now()
+    row = (
+        await conn.get_default_database()
+        .get_collection(signal_collection_name)
+        .find_one_and_update(
+            {
+                "signal_id": signal_id,
+                "username": username,
+                **(filter_args or {}),
+            },
+            update,
+            return_document=ReturnDocument.AFTER,
+            **kwargs,
+        )
+    )
+    if row is None:
+        return None
+    return SignalInDB(**row)
+
+
+# whether a client's deployment supports transactions
+_transactions = weakref.WeakKeyDictionary()
+
+
+async def _supports_transactions(conn: AsyncIOMotorClient) -> bool:
+    if conn not in _transactions:
+        hello = await conn.admin.command("isMaster")
+        # replica set members and mongos, not standalone servers
+        _transactions[conn] = (
+            "setName" in hello or hello.get("msg") == "isdbgrid"
+        )
+    return _transactions[conn]
+
+
+async def complete_signal(
+    conn: AsyncIOMotorClient,
+    signal_id: str,
+    username: str,
+    stems: List[SeparatedSignal],
+    signal_state: str = None,
+) -> Coroutine[Optional[SignalInDB], None, None]:
+    """Record the stems of a separated signal, e.g. at the end of the
+        separation. The stems are inserted at once and the signal gets
+        their names, ids and its state in a single update. Both writes
+        are made in a transaction where the deployment supports them
+        (replica sets and sharded clusters). When the signal does not
+        exist, e.g. deleted while separating, no stem is recorded and
+        a reference to each stem file is dropped.
+
+        Args:
+            stems (list): stems of the signal, in order.
+            signal_state (str): state the signal is set to, if any.
+        Returns:
+            signal (SignalInDB): updated signal, None if it does not exist.
+    """
+    db = conn.get_default_database()
+    rows = [
+        SeparatedSignalInDB(**stem.dict(), username=username).dict()
+        for stem in stems
+    ]
+    update = {
+        "separated_stems": [stem.stem_name for stem in stems],
+        "separated_stem_id": [stem.signal_id for stem in stems],
+        "updated_at": datetime.now(),
+    }
+    if signal_state is not None:
+        update["signal_state"] = signal_state
+
+    async def _write(session=None):
+        if rows:
+            await db.get_collection(stem_collection_name).insert_many(
+                rows, session=session
+            )
+        row = await db.get_collection(
+            signal_collection_name
+        ).find_one_and_update(
+            {"signal_id": signal_id, "username": username},
+            {"$set": update},
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+        if row is None and rows:
+            # stems of a deleted signal would never be deleted
+            await db.get_collection(stem_collection_name).delete_many(
+                # ids set by insert_many
+                {"_id": {"$in": [stem_row["_id"] for stem_row in rows]}},
+                session=session,
+            )
+        return row
+
+    if await _supports_transactions(conn):
+        async with await conn.start_session() as session:
+            row = await session.with_transaction(_write)
+    else:
+        row = await _write()
+    if row is None:
+        await release_files(conn, [stem.signal_id for stem in stems])
+        return None
+    return SignalInDB(**row)
+
+
 async def update_signal(
     conn: AsyncIOMotorClient, signal_id: str, username: str, **update_kwargs
-) -> Coroutine[SignalInDB, None, None]:
-    signal = await read_one_signal(conn, signal_id, username)
+) -> Coroutine[Optional[SignalInDB], None, None]:
+    """Set fields of a signal, concurrent updates of other fields are
+        kept. The state of the signal can be set along with its fields,
+        e.g. its stems and `signal_state=TaskState.Complete`.
+
+        Returns:
+            signal (SignalInDB): updated signal, None if it does not exist.
+    """
+    return await _modify_signal(
+        conn, signal_id, username, {"$set": update_kwargs}
+    )
 
-    signal = signal.dict()
-    signal = SignalInDB(**{**signal, **update_kwargs})
-    signal.updated_at = datetime.now()
-    await conn.get_default_database().get_collection(
-        signal_collection_name
-    ).replace_one({"signal_id": signal_id}, signal.dict())
-    return signal
+
+async def add_signal_stem(
+    conn: AsyncIOMotorClient,
+    signal_id: str,
+    username: str,
+    stem_name: str,
+    stem_id: str,
+) -> Coroutine[Optional[SignalInDB], None, None]:
+    """Append a stem to a signal.
+        Returns:
+            signal (SignalInDB): updated signal, None if it does not
+                exist or already has a stem of this name.
+    """
+    return await _modify_signal(
+        conn,
+        signal_id,
+        username,
+        {
+            "$push": {
+                "separated_stems": stem_name,
+                "separated_stem_id": stem_id,
+            }
+        },
+        {"separated_stems": {"$ne": stem_name}},
+    )
+
+
+async def remove_signal_stem(
+    conn: AsyncIOMotorClient,
+    signal_id: str,
+    username: str,
+    stem_name: str,
+    stem_id: str,
+) -> Coroutine[Optional[SignalInDB], None, None]:
+    """Remove a stem from a signal.
+        Returns:
+            signal (SignalInDB): updated signal, None if it does not
+                exist or has no such stem.
+    """
+    return await _modify_signal(
+        conn,
+        signal_id,
+        username,
+        {
+            "$pull": {
+                "separated_stems": stem_name,
+                "separated_stem_id": stem_id,
+            }
+        },
+        {"separated_stems": stem_name, "separated_stem_id": stem_id},
+    )
+
+
+async def rename_signal_stem(
+    conn: AsyncIOMotorClient,
+    signal_id: str,
+    username: str,
+    stem_name: str,
+    new_stem_name: str,
+) -> Coroutine[Optional[SignalInDB], None, None]:
+    """Rename a stem of a signal.
+        Returns:
+            signal (SignalInDB): updated signal, None if it does not
+                exist, has no such stem or a stem of the new name.
+    """
+    return await _modify_signal(
+        conn,
+        signal_id,
+        username,
+        {"$set": {"separated_stems.$[stem]": new_stem_name}},
+        {
+            "$and": [
+                {"separated_stems": stem_name},
+                {"separated_stems": {"$ne": new_stem_name}},
+            ]
+        },
+        array_filters=[{"stem": stem_name}],
+    )
 
 
 async def remove_signal(
-    conn: AsyncIOMotorClient, signal_id: str, username: str, stem=False
+    conn: AsyncIOMotorClient,
+    signal_id: str,
+    username: str,
+    stem=False,
+    parent_id: str = None,
 ) -> Coroutine[bool, None, None]:
     collection_name = signal_collection_name
+    filter_args = {"signal_id": signal_id, "username": username}
     if stem:
         collection_name = stem_collection_name
+        if parent_id is not None:
+            # copies share the stem file, stems without parent are legacy
+            filter_args["parent_id"] = {"$in": [parent_id, None]}
     rows = (
         await conn.get_default_database()
         .get_collection(collection_name)
-        .delete_one({"signal_id": signal_id, "username": username})
+        .delete_one(filter_args)
     )
     return rows.deleted_count == 1
 
@@ -130,17 +418,28 @@ async def update_stem(
     stem_name: str,
     username: str,
     **update_kwargs,
-) -> Coroutine[SignalInDB, None, None]:
-    signal = await read_one_signal(conn, signal_id, username, stem=stem_name)
-    signal = SeparatedSignalInDB(**{**signal.dict(), **update_kwargs})
-    signal.updated_at = datetime.now()
-    print(signal)
-    await conn.get_default_database().get_collection(
-        stem_collection_name
-    ).replace_one(
-        {"signal_id": signal.signal_id, "stem_name": stem_name}, signal.dict()
+) -> Coroutine[Optional[SeparatedSignalInDB], None, None]:
+    """Set fields of the stem of a signal in a single atomic write.
+        Returns:
+            stem (SeparatedSignalInDB): updated stem, None if it does
+                not exist.
+    """
+    row = (
+        await conn.get_default_database()
+        .get_collection(stem_collection_name)
+        .find_one_and_update(
+            {
+                "parent_id": signal_id,
+                "username": username,
+                "stem_name": stem_name,
+            },
+            {"$set": {**update_kwargs, "updated_at": datetime.now()}},
+            return_document=ReturnDocument.AFTER,
+        )
     )
-    return signal
+    if row is None:
+        return None
+    return SeparatedSignalInDB(**row)
 
 
 async def validate_user_signal(
@@ -156,18 +455,101 @@ async def validate_user_signal(
     return False
 
 
-async def save_signal_file(
-    conn: AsyncIOMotorClient, signal_file: UploadFile
-) -> Coroutine[str, None, None]:
+async def _file_chunks(file) -> AsyncIterator[bytes]:
+    file.seek(0)
+    while True:
+        chunk = file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def save_signal_stream(
+    conn: AsyncIOMotorClient,
+    filename: str,
+    content_type: str,
+    chunks: AsyncIterator[bytes],
+    head_size: int = 0,
+) -> Coroutine[Tuple[str, str, bytes, int], None, None]:
+    """Upload a file to GridFS while it is received, in a single pass.
+        Chunks are received concurrently with the upload through a
+        bounded queue, a slow database pauses the client instead of
+        buffering the file. The SHA-256 is computed on the way and
+        stored in the file metadata, the head of the file is kept
+        to probe it.
+
+        Args:
+            chunks (async iterator): file content, e.g. a request body.
+            head_size (int): bytes kept from the start of the file.
+        Returns:
+            signal_id (str): file id.
+            content_hash (str): SHA-256 hex digest of the file.
+            head (bytes): first `head_size` bytes of the file.
+            size (int): size of the file in bytes.
+    """
     db = conn.get_default_database()
     fs = AsyncIOMotorGridFSBucket(db, bucket_name=grid_bucket_name)
-    signal_file.file.seek(0)
-    file_id = await fs.upload_from_stream(
+    queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+
+    async def _receive():
+        async for chunk in chunks:
+            if chunk:
+                await queue.put(chunk)
+        await queue.put(None)
+
+    receiver = asyncio.ensure_future(_receive())
+    sha256 = hashlib.sha256()
+    head = bytearray()
+    size = 0
+    grid_in = fs.open_upload_stream(filename)
+    try:
+        while True:
+            get = asyncio.ensure_future(queue.get())
+            await asyncio.wait(
+                (get, receiver), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not get.done() and receiver.exception() is not None:
+                # the client went away, nothing more will be queued
+                get.cancel()
+                raise receiver.exception()
+            chunk = await get
+            if chunk is None:
+                break
+            sha256.update(chunk)
+            if len(head) < head_size:
+                head += chunk[: head_size - len(head)]
+            size += len(chunk)
+            await grid_in.write(chunk)
+        content_hash = sha256.hexdigest()
+        await grid_in.set(
+            "metadata", {"contentType": content_type, "sha256": content_hash}
+        )
+        await grid_in.close()
+    except BaseException:
+        receiver.cancel()
+        await grid_in.abort()
+        raise
+    return str(grid_in._id), content_hash, bytes(head), size
+
+
+async def save_signal_file(
+    conn: AsyncIOMotorClient, signal_file: UploadFile, with_hash=False
+) -> Coroutine[Union[str, Tuple[str, str]], None, None]:
+    """Upload the file to GridFS, its SHA-256 is computed while
+        uploading and stored in the file metadata.
+
+        Returns:
+            signal_id (str): file id, and the SHA-256 hex digest of
+                the file if `with_hash`.
+    """
+    signal_id, content_hash, _, _ = await save_signal_stream(
+        conn,
         signal_file.filename,
-        signal_file.file,
-        metadata={"contentType": signal_file.content_type},
+        signal_file.content_type,
+        _file_chunks(signal_file.file),
     )
-    signal_id = str(file_id)
+    if with_hash:
+        return signal_id, content_hash
     return signal_id
 
 
@@ -177,19 +559,116 @@ async def save_stem_file(
     signal: np.ndarray,
     sample_rate: int,
     augmented_signal: bool = False,
+    codec: StemCodec = DEFAULT_STEM_CODEC,
 ) -> Coroutine[str, None, None]:
     if augmented_signal:
         stem_name = f"{stem_name}_augment"
-    db = conn.get_default_database()
-    fs = AsyncIOMotorGridFSBucket(db, bucket_name=grid_bucket_name)
-    with NamedTemporaryFile() as temp_file:
-        filename = temp_file.name
-        librosa.output.write_wav(
-            filename, np.asfortranarray(signal), sr=sample_rate
+    signal = signal.reshape(len(signal), -1)
+    writer = StemWriter(conn, stem_name, len(signal), sample_rate, codec)
+    for start in range(0, len(signal), STEM_WRITE_FRAMES):
+        await writer.write(signal[start : start + STEM_WRITE_FRAMES])
+    return await writer.close()
+
+
+class StemWriter:
+    """Writes a stem to GridFS while the signal is being separated.
+    Samples are encoded in a thread pool as they are written and
+    uploaded in GridFS chunks, neither the encoded file nor a temporary
+    file is kept. Bytes rewritten by the encoder on close, e.g. the
+    header holding the number of frames, are patched in the stored
+    chunks. When `frames` is None the stem has as many frames as
+    were written.
+
+        Example use:
+        >>>writer = StemWriter(conn, stem_file_id, frames, sample_rate)
+        >>>await writer.write(separated_frames)
+        >>>stem_id = await writer.close()
+
+    A writer left open must be aborted, its chunks would have no file
+    otherwise.
+    """
+
+    def __init__(
+        self,
+        conn: AsyncIOMotorClient,
+        stem_name: str,
+        frames: int,
+        sample_rate: int,
+        codec: StemCodec = DEFAULT_STEM_CODEC,
+    ):
+        self._db = conn.get_default_database()
+        # the md5 would not match a patched file
+        self._fs = AsyncIOMotorGridFSBucket(
+            self._db, bucket_name=grid_bucket_name, disable_md5=True
+        )
+        self.stem_name = stem_name
+        self.frames = frames
+        self.sample_rate = sample_rate
+        self.codec = codec
+        self._grid_in = None
+        self._encoder = None
+        # set once the file is stored, it is released rather than aborted
+        self.file_id = None
+
+    @property
+    def written(self) -> int:
+        return self._encoder.written if self._encoder else 0
+
+    def _open(self, channels: int) -> None:
+        self._grid_in = self._fs.open_upload_stream(
+            self.stem_name, metadata={"codec": self.codec}
+        )
+        self._encoder = StemEncoder(
+            self.sample_rate, channels, self.codec, self.frames
         )
-        file_id = await fs.upload_from_stream(stem_name, temp_file)
-    stem_id = str(file_id)
-    return stem_id
+
+    async def write(self, signal: np.ndarray) -> None:
+        if self._encoder is None:
+            self._open(signal.shape[1])
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._encoder.write, signal)
+        # whole chunks only, partial ones are buffered by GridFS anyway
+        data = self._encoder.take(self._grid_in.chunk_size)
+        if data:
+            await self._grid_in.write(data)
+
+    async def _patch(self, patches: List[Tuple[int, bytes]]) -> None:
+        chunk_size = self._grid_in.chunk_size
+        chunk_patches = defaultdict(list)
+        for offset, data in patches:
+            while data:
+                n, start = divmod(offset, chunk_size)
+                length = min(len(data), chunk_size - start)
+                chunk_patches[n].append((start, data[:length]))
+                offset += length
+                data = data[length:]
+        chunks = self._db.get_collection(f"{grid_bucket_name}.chunks")
+        for n, patches in chunk_patches.items():
+            chunk = await chunks.find_one(
+                {"files_id": self._grid_in._id, "n": n}
+            )
+            data = bytearray(chunk["data"])
+            for start, patch in patches:
+                data[start : start + len(patch)] = patch
+            await chunks.update_one(
+                {"_id": chunk["_id"]}, {"$set": {"data": bytes(data)}}
+            )
+
+    async def close(self) -> Coroutine[str, None, None]:
+        loop = asyncio.get_event_loop()
+        patches = await loop.run_in_executor(None, self._encoder.close)
+        await self._grid_in.write(self._encoder.take())
+        await self._grid_in.close()
+        self.file_id = str(self._grid_in._id)
+        await self._patch(patches)
+        return self.file_id
+
+    async def abort(self) -> None:
+        """Delete the chunks written so far, e.g. when the separation
+        fails before the writer is closed.
+        """
+        if self._grid_in is not None and self.file_id is None:
+            await self._grid_in.abort()
 
 
 async def read_signal_file(
@@ -197,7 +676,16 @@ async def read_signal_file(
     filename: str,
     stream=True,
     augmented_signal: bool = False,
-) -> Coroutine[Union[bytes, Generator[bytes, None, None]], None, None]:
+    decode=False,
+) -> Coroutine[
+    Union[bytes, np.ndarray, Generator[bytes, None, None]], None, None
+]:
+    """Read a file stored in GridFS.
+        Args:
+            stream (bool): return a generator of the file chunks.
+            decode (bool): return the decoded (frames, channels) signal,
+                stems are decoded whatever their codec.
+    """
     if augmented_signal:
         filename = f"{filename}_augment"
     db = conn.get_default_database()
@@ -206,12 +694,67 @@ async def read_signal_file(
         grid_out = await fs.open_download_stream_by_name(filename)
     except NoFile:
         return None
-    if stream:
+    if stream and not decode:
         return chunk_gen(grid_out)
     file_content = await grid_out.read()
+    if decode:
+        return read_audio(file_content)
     return file_content
 
 
+async def read_signal_file_by_id(
+    conn: AsyncIOMotorClient, file_id: str, decode=False
+) -> Coroutine[Union[np.ndarray, Generator[bytes, None, None]], None, None]:
+    """Chunks of a file stored in GridFS, None if it does not exist.
+        Args:
+            decode (bool): return the decoded (frames, channels) signal.
+    """
+    db = conn.get_default_database()
+    fs = AsyncIOMotorGridFSBucket(db, bucket_name=grid_bucket_name)
+    try:
+        grid_out = await fs.open_download_stream(ObjectId(file_id))
+    except (NoFile, InvalidId):
+        return None
+    if decode:
+        return read_audio(await grid_out.read())
+    return chunk_gen(grid_out)
+
+
+async def open_signal_file(
+    conn: AsyncIOMotorClient, file_id: str = None, filename: str = None
+):
+    """Open a file stored in GridFS by id, or its last version by name.
+        Returns:
+            grid_out (AsyncIOMotorGridOut): None if the file does not
+                exist, its size is `grid_out.length`.
+    """
+    db = conn.get_default_database()
+    fs = AsyncIOMotorGridFSBucket(db, bucket_name=grid_bucket_name)
+    try:
+        if file_id is not None:
+            return await fs.open_download_stream(ObjectId(file_id))
+        return await fs.open_download_stream_by_name(filename)
+    except (NoFile, InvalidId):
+        return None
+
+
+async def chunk_range(
+    grid_out, start: int, end: int
+) -> Coroutine[Generator[bytes, None, None], None, None]:
+    """Chunks of the bytes `start` to `end` (excluded) of a file, only
+    the GridFS chunks holding them are read.
+    """
+    grid_out.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            return
+        chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        yield chunk
+
+
 async def chunk_gen(
     grid_out,
 ) -> Coroutine[Generator[bytes, None, None], None, None]:
@@ -236,14 +779,119 @@ async def rename_file(
 async def copy_file(
     conn: AsyncIOMotorClient, filename: str, new_filename: str
 ):
-    stream = await read_signal_file(conn, filename, stream=False)
-    with NamedTemporaryFile() as temp_file:
-        temp_file.write(stream)
-        upload_file = UploadFile(filename=new_filename, file=temp_file)
-        file_id = await save_signal_file(conn, upload_file)
+    chunks = await read_signal_file(conn, filename)
+    if chunks is None:
+        raise Exception("No File found")
+    file_id, _, _, _ = await save_signal_stream(
+        conn, new_filename, None, chunks
+    )
     return file_id
 
 
+def _files(conn: AsyncIOMotorClient):
+    return conn.get_default_database().get_collection(
+        f"{grid_bucket_name}.files"
+    )
+
+
+async def retain_file(
+    conn: AsyncIOMotorClient, file_id: str
+) -> Coroutine[dict, None, None]:
+    """Share a stored file instead of copying it, the file counts the
+        copies referencing it besides its first owner (`metadata.copies`)
+        and is deleted by `release_file` once none references it.
+
+        Returns:
+            metadata (dict): metadata of the file.
+        Raises:
+            NoFile: When the file does not exist (anymore).
+    """
+    try:
+        file_id = ObjectId(file_id)
+    except InvalidId:
+        raise NoFile(f"No file with id {file_id}")
+    row = await _files(conn).find_one_and_update(
+        {"_id": file_id},
+        {"$inc": {"metadata.copies": 1}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if row is None:
+        raise NoFile(f"No file with id {file_id}")
+    return row["metadata"]
+
+
+def _chunks(conn: AsyncIOMotorClient):
+    return conn.get_default_database().get_collection(
+        f"{grid_bucket_name}.chunks"
+    )
+
+
+async def _release_file(files, file_id: ObjectId) -> Optional[bool]:
+    # True once the file is deleted, its chunks are left to the caller
+    while True:
+        row = await files.find_one_and_update(
+            {"_id": file_id, "metadata.copies": {"$gt": 0}},
+            {"$inc": {"metadata.copies": -1}},
+        )
+        if row is not None:
+            return False
+        # no copies left, unless retained meanwhile
+        result = await files.delete_one(
+            {"_id": file_id, "metadata.copies": {"$not": {"$gt": 0}}}
+        )
+        if result.deleted_count:
+            return True
+        if not await files.count_documents({"_id": file_id}, limit=1):
+            return None
+
+
+async def release_file(
+    conn: AsyncIOMotorClient, file_id: str
+) -> Coroutine[bool, None, None]:
+    """Drop a reference to a stored file, it is deleted with its last
+        reference.
+
+        Returns:
+            deleted (bool): True if the file was deleted.
+    """
+    try:
+        file_id = ObjectId(file_id)
+    except InvalidId:
+        raise Exception("Incorrect Id format")
+    deleted = await _release_file(_files(conn), file_id)
+    if deleted is None:
+        raise Exception("No File found")
+    if deleted:
+        await _chunks(conn).delete_many({"files_id": file_id})
+    return deleted
+
+
+async def release_files(
+    conn: AsyncIOMotorClient, file_ids: List[str]
+) -> Coroutine[List[str], None, None]:
+    """Drop a reference to each of the stored files concurrently, see
+        `release_file`. A file listed twice is released twice. The chunks
+        of the deleted files are deleted at once, missing files and
+        invalid ids are skipped.
+
+        Returns:
+            deleted (list): ids of the deleted files.
+    """
+    file_ids = [
+        ObjectId(file_id) for file_id in file_ids if ObjectId.is_valid(file_id)
+    ]
+    files = _files(conn)
+    released = await asyncio.gather(
+        *(_release_file(files, file_id) for file_id in file_ids)
+    )
+    deleted = [
+        file_id for file_id, deleted in zip(file_ids, released) if deleted
+    ]
+    if deleted:
+        await _chunks(conn).delete_many({"files_id": {"$in": deleted}})
+    return [str(file_id) for file_id in deleted]
+
+
 async def delete_signal_file(conn: AsyncIOMotorClient, file_id: str):
     db = conn.get_default_database()
     fs = AsyncIOMotorGridFSBucket(db, bucket_name=grid_bucket_name)
@@ -258,11 +906,16 @@ async def delete_signal_file(conn: AsyncIOMotorClient, file_id: str):
 async def get_signal_state(
     conn: AsyncIOMotorClient, signal_id: str, username: str
 ) -> Coroutine[SignalState, None, None]:
-    row = (
-        await conn.get_default_database()
-        .get_collection(signal_state_collection_name)
-        .find_one({"signal_id": signal_id, "username": username})
+    """State of a signal, kept on the signal while it exists."""
+    filter_args = {"signal_id": signal_id, "username": username}
+    db = conn.get_default_database()
+    row = await db.get_collection(signal_collection_name).find_one(
+        filter_args, {"signal_id": 1, "signal_state": 1}
     )
+    if not row or not row.get("signal_state"):
+        row = await db.get_collection(signal_state_collection_name).find_one(
+            filter_args
+        )
     if row:
         signal_state = SignalState(**row)
         return signal_state
@@ -271,15 +924,27 @@ async def get_signal_state(
 async def update_signal_state(
     conn: AsyncIOMotorClient, signal_state: SignalState, username: str
 ) -> Coroutine[SignalState, None, None]:
-    row = (
-        await conn.get_default_database()
-        .get_collection(signal_state_collection_name)
-        .update_one(
-            {"signal_id": signal_state.signal_id, "username": username},
+    """Set the state of a signal in a single write, on the signal while
+    it exists and in the state collection once it was deleted.
+    """
+    filter_args = {"signal_id": signal_state.signal_id, "username": username}
+    db = conn.get_default_database()
+    row = await db.get_collection(signal_collection_name).update_one(
+        filter_args,
+        {
+            "$set": {
+                "signal_state": signal_state.signal_state,
+                "updated_at": datetime.now(),
+            }
+        },
+    )
+    if not row.matched_count:
+        # states outlive their signal, e.g. Deleted
+        row = await db.get_collection(signal_state_collection_name).update_one(
+            filter_args,
             {"$set": {"signal_state": signal_state.signal_state}},
             upsert=True,
         )
-    )
     if row:
         return signal_state
 
@@ -288,7 +953,7 @@ async def watch_collection_field(
     conn: AsyncIOMotorClient, field: str, field_name: str = "signal_id"
 ) -> Coroutine[dict, None, None]:
     collection = conn.get_default_database().get_collection(
-        signal_state_collection_name
+        signal_collection_name
     )
 
     pipeline = [
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from api.services import (
+    claim_content,
+    complete_content,
+    release_content,
+    link_content,
+    read_one_signal,
+)
+from api.config import content_collection_name
+from api.utils.codec import DEFAULT_STEM_CODEC
+from api.test.constants import TEST_USERNAME, TEST_STEMS, TEST_SIGNAL_ID
+
+pytestmark = pytest.mark.asyncio
+
+CONTENT_HASH = "0" * 64
+
+
+async def test_claim_content(db_client, cleanup_db):
+    content = await claim_content(db_client, CONTENT_HASH, 2, "1", "user1")
+    assert content is None
+
+    # identical signal posted while separating
+    content = await claim_content(db_client, CONTENT_HASH, 2, "2", "user2")
+    assert not content.separated
+    assert content.signal_id == "1"
+    assert [f.signal_id for f in content.followers] == ["2"]
+
+    # different stems are separated independently
+    content = await claim_content(db_client, CONTENT_HASH, 4, "3", "user2")
+    assert content is None
+
+    followers = await complete_content(
+        db_client, CONTENT_HASH, 2, {"a": "b"}, DEFAULT_STEM_CODEC
+    )
+    assert [f.username for f in followers] == ["user2"]
+
+    content = await claim_content(db_client, CONTENT_HASH, 2, "4", "user3")
+    assert content.separated
+    assert content.stem_ids == {"a": "b"}
+    assert not content.followers
+
+    await release_content(db_client, CONTENT_HASH, 2)
+    content = await claim_content(db_client, CONTENT_HASH, 2, "5", "user3")
+    assert content is None
+
+
+async def test_claim_content_timeout(db_client, cleanup_db):
+    assert (
+        await claim_content(db_client, CONTENT_HASH, 2, "1", "user1") is None
+    )
+    await claim_content(db_client, CONTENT_HASH, 2, "2", "user2")
+    # the worker separating signal 1 was lost
+    await db_client.get_default_database().get_collection(
+        content_collection_name
+    ).update_many(
+        {}, {"$set": {"claimed_at": datetime.utcnow() - timedelta(days=1)}}
+    )
+
+    assert (
+        await claim_content(db_client, CONTENT_HASH, 2, "3", "user3") is None
+    )
+    # the lost worker no longer owns the claim
+    assert not await release_content(db_client, CONTENT_HASH, 2, "1")
+    followers = await release_content(db_client, CONTENT_HASH, 2, "3")
+    assert [f.signal_id for f in followers] == ["2"]
+
+
+async def test_link_content(db_client, generate_stem, cleanup_db):
+    signal = await read_one_signal(db_client, TEST_SIGNAL_ID, TEST_USERNAME)
+    stem_ids = dict(zip(signal.separated_stems, signal.separated_stem_id))
+
+    linked = await link_content(
+        db_client, stem_ids, signal, TEST_USERNAME, DEFAULT_STEM_CODEC
+    )
+    assert linked
+    signal_actual = await read_one_signal(
+        db_client, TEST_SIGNAL_ID, TEST_USERNAME
+    )
+    assert signal_actual.separated_stems == TEST_STEMS
+    # stem files are shared, not copied
+    assert signal_actual.separated_stem_id == list(stem_ids.values())
+
+    linked = await link_content(
+        db_client,
+        {"one": "5f0000000000000000000000"},
+        signal,
+        TEST_USERNAME,
+        DEFAULT_STEM_CODEC,
+    )
+    assert not linked
@@ -0,0 +1,45 @@
+import pytest
+
+from api.worker import TaskState
+from api.services import (
+    delete_signals,
+    get_signal_state,
+    read_one_signal,
+    read_peaks,
+    read_signal_file_by_id,
+    retain_file,
+)
+from api.test.constants import TEST_SIGNAL_ID, TEST_STEMS, TEST_USERNAME
+
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_delete_signals(generate_stem, db_client, cleanup_db):
+    signal = await read_one_signal(db_client, TEST_SIGNAL_ID, TEST_USERNAME)
+    shared, owned = signal.separated_stem_id
+    # e.g. referenced by a copy of the signal
+    await retain_file(db_client, shared)
+
+    assert not await delete_signals(db_client, [TEST_SIGNAL_ID], "invalid")
+    deleted = await delete_signals(
+        db_client,
+        [TEST_SIGNAL_ID, "invalid", TEST_SIGNAL_ID],
+        TEST_USERNAME,
+        TaskState.Deleted,
+    )
+    assert deleted == [TEST_SIGNAL_ID]
+    assert not await read_one_signal(db_client, TEST_SIGNAL_ID, TEST_USERNAME)
+    for stem_name in TEST_STEMS:
+        assert not await read_one_signal(
+            db_client, TEST_SIGNAL_ID, TEST_USERNAME, stem=stem_name
+        )
+    state = await get_signal_state(db_client, TEST_SIGNAL_ID, TEST_USERNAME)
+    assert state.signal_state == TaskState.Deleted
+
+    assert await read_signal_file_by_id(db_client, shared)
+    assert await read_peaks(db_client, shared, 0)
+    assert await read_signal_file_by_id(db_client, owned) is None
+    assert await read_peaks(db_client, owned, 0) is None
+
+    assert not await delete_signals(db_client, [TEST_SIGNAL_ID], TEST_USERNAME)
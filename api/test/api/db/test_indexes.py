@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from api.db import create_indexes
+from api.db.indexes import INDEXES
+from api.services import (
+    create_signal,
+    create_stem,
+    create_user,
+    delete_signals,
+    get_signal_state,
+    get_user,
+    read_one_signal,
+    read_peaks,
+    read_rendition,
+    read_signal,
+    read_signal_file,
+    release_file,
+    remove_signal,
+    retain_file,
+    save_peaks,
+    save_stem_file,
+    update_signal,
+    update_signal_state,
+    update_stem,
+)
+from api.schemas import SeparatedSignal, SignalState, UserInCreate
+from api.test.conftest import _get_signal
+from api.test.constants import TEST_SIGNAL_ID, TEST_USERNAME
+from api.utils.codec import RenditionFormat
+from api.utils.peaks import build_peaks
+
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def query_audit(db_client):
+    """Profile the queries of a test, yields the queries which scanned
+    a whole collection.
+    """
+    database = db_client.get_default_database()
+    await create_indexes(db_client)
+    await database.command("profile", 0)
+    await database.drop_collection("system.profile")
+    await database.command("profile", 2)
+    namespaces = [f"{database.name}.{name}" for name in INDEXES]
+
+    async def collection_scans():
+        return (
+            await database.get_collection("system.profile")
+            .find({"ns": {"$in": namespaces}, "planSummary": "COLLSCAN"})
+            .to_list(length=None)
+        )
+
+    yield collection_scans
+    await database.command("profile", 0)
+
+
+async def test_service_queries_use_indexes(
+    signal, db_client, cleanup_db, query_audit
+):
+    await read_one_signal(db_client, TEST_SIGNAL_ID, TEST_USERNAME)
+    await read_signal(db_client, TEST_USERNAME)
+    await read_signal(db_client, TEST_USERNAME, projectname="project")
+    await read_signal(db_client, TEST_USERNAME, signal_state="Complete")
+    await update_signal(db_client, TEST_SIGNAL_ID, TEST_USERNAME)
+    state = SignalState(signal_id=TEST_SIGNAL_ID, signal_state="Start")
+    await update_signal_state(db_client, state, TEST_USERNAME)
+    await get_signal_state(db_client, TEST_SIGNAL_ID, TEST_USERNAME)
+
+    file_id = await save_stem_file(
+        db_client, "stem_file", np.zeros((1_000, 2)), 44_100
+    )
+    stem = SeparatedSignal(
+        signal_id=file_id,
+        signal_metadata=_get_signal().signal_metadata,
+        stem_name="vocals",
+        parent_id=TEST_SIGNAL_ID,
+    )
+    await create_stem(db_client, stem, TEST_USERNAME)
+    await read_one_signal(
+        db_client, TEST_SIGNAL_ID, TEST_USERNAME, stem="vocals"
+    )
+    await update_stem(db_client, TEST_SIGNAL_ID, "vocals", TEST_USERNAME)
+    await read_signal_file(db_client, "stem_file", stream=False)
+    await retain_file(db_client, file_id)
+    await release_file(db_client, file_id)
+    await save_peaks(
+        db_client, file_id, 44_100, build_peaks(np.zeros((1_000, 2)))
+    )
+    await read_peaks(db_client, file_id, 0)
+    await read_rendition(db_client, file_id, RenditionFormat.Opus, 96)
+    await remove_signal(
+        db_client, file_id, TEST_USERNAME, stem=True, parent_id=TEST_SIGNAL_ID,
+    )
+    await release_file(db_client, file_id)
+
+    user = UserInCreate(
+        username="indexed", email="indexed@test.com", password="password"
+    )
+    await create_user(db_client, user, "hashed")
+    await get_user(db_client, "indexed")
+    await create_signal(db_client, _get_signal(), TEST_USERNAME)
+    await delete_signals(db_client, [TEST_SIGNAL_ID], TEST_USERNAME, "Deleted")
+
+    scans = await query_audit()
+    assert not scans, [(scan["ns"], scan.get("command")) for scan in scans]
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from api.services import delete_peaks, read_peaks, save_peaks
+
+
+pytestmark = pytest.mark.asyncio
+
+STEM_FILE_ID = "5f0000000000000000000000"
+
+
+async def test_read_peaks(db_client, cleanup_db, monkeypatch):
+    # peaks spread over several documents
+    monkeypatch.setattr("api.services.peaks.PEAK_BLOCK_SIZE", 10)
+    fine = np.arange(-50, 49, dtype=np.int8).repeat(3).reshape(-1, 3)
+    coarse = fine[::4]
+    await save_peaks(db_client, STEM_FILE_ID, 256, [fine, coarse])
+
+    peaks = await read_peaks(db_client, STEM_FILE_ID, 0)
+    assert peaks.length == len(fine)
+    assert peaks.frames_per_peak == 256
+    assert peaks.peaks == fine.ravel().tolist()
+
+    # a peak per second at level 0
+    peaks = await read_peaks(db_client, STEM_FILE_ID, 0, 15, 32.5)
+    assert peaks.start == 15
+    assert peaks.peaks == fine[15:33].ravel().tolist()
+
+    peaks = await read_peaks(db_client, STEM_FILE_ID, 1, 8, 1_000)
+    assert peaks.start == 2
+    assert peaks.peaks == coarse[2:].ravel().tolist()
+
+    assert not await read_peaks(db_client, STEM_FILE_ID, 2)
+    await delete_peaks(db_client, STEM_FILE_ID)
+    assert not await read_peaks(db_client, STEM_FILE_ID, 0)
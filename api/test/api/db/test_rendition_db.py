@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from api.config import rendition_collection_name
+from api.services import (
+    create_rendition,
+    delete_renditions,
+    evict_renditions,
+    parse_renditions,
+    read_rendition,
+    read_one_signal,
+    read_signal_file_by_id,
+)
+from api.test.constants import TEST_SIGNAL_ID, TEST_USERNAME
+from api.utils.codec import RenditionFormat
+
+
+async def _stem_file_id(db_client) -> str:
+    signal = await read_one_signal(db_client, TEST_SIGNAL_ID, TEST_USERNAME)
+    return signal.separated_stem_id[0]
+
+
+@pytest.mark.asyncio
+async def test_create_rendition(generate_stem, db_client, cleanup_db):
+    stem_file_id = await _stem_file_id(db_client)
+    assert not await read_rendition(
+        db_client, stem_file_id, RenditionFormat.Opus, 96
+    )
+
+    rendition = await create_rendition(
+        db_client, stem_file_id, RenditionFormat.Opus, 96
+    )
+    assert rendition.size > 0
+    chunks = await read_signal_file_by_id(db_client, rendition.file_id)
+    data = b"".join([chunk async for chunk in chunks])
+    assert len(data) == rendition.size
+    assert data[:4] == b"OggS"
+
+    # cached, not transcoded again
+    cached = await create_rendition(
+        db_client, stem_file_id, RenditionFormat.Opus, 96
+    )
+    assert cached.file_id == rendition.file_id
+    served = await read_rendition(
+        db_client, stem_file_id, RenditionFormat.Opus, 96
+    )
+    assert served.accessed_at >= rendition.accessed_at
+
+    assert not await create_rendition(
+        db_client, "5f0000000000000000000000", RenditionFormat.Opus, 96
+    )
+
+
+@pytest.mark.asyncio
+async def test_evict_renditions(generate_stem, db_client, cleanup_db):
+    stem_file_id = await _stem_file_id(db_client)
+    cold = await create_rendition(
+        db_client, stem_file_id, RenditionFormat.Mp3, 128
+    )
+    hot = await create_rendition(
+        db_client, stem_file_id, RenditionFormat.Opus, 96
+    )
+    collection = db_client.get_default_database().get_collection(
+        rendition_collection_name
+    )
+    await collection.update_one(
+        {"file_id": cold.file_id},
+        {"$set": {"accessed_at": datetime.utcnow() - timedelta(days=1)}},
+    )
+
+    assert await evict_renditions(db_client, cold.size + hot.size) == 0
+    # recently served renditions are kept
+    assert await evict_renditions(db_client, 0) == 1
+    assert not await read_rendition(
+        db_client, stem_file_id, RenditionFormat.Mp3, 128
+    )
+    assert not await read_signal_file_by_id(db_client, cold.file_id)
+
+    await delete_renditions(db_client, stem_file_id)
+    assert not await read_rendition(
+        db_client, stem_file_id, RenditionFormat.Opus, 96
+    )
+    assert not await read_signal_file_by_id(db_client, hot.file_id)
+
+
+def test_parse_renditions():
+    assert parse_renditions("opus:96, mp3:192,") == [
+        (RenditionFormat.Opus, 96),
+        (RenditionFormat.Mp3, 192),
+    ]
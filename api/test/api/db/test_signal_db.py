@@ -1,4 +1,9 @@
+import asyncio
+import hashlib
+
 import pytest
+from bson import ObjectId
+from gridfs.errors import NoFile
 import numpy as np
 
 # get test database (conftest.py)
@@ -9,18 +14,31 @@ from api.services import (
     read_one_signal,
     create_signal,
     update_signal,
+    complete_signal,
+    add_signal_stem,
+    remove_signal_stem,
+    rename_signal_stem,
     read_signal,
+    find_signal,
     remove_signal,
     get_signal_state,
     update_signal_state,
     save_signal_file,
+    save_signal_stream,
+    read_signal_file_by_id,
     read_signal_file,
     delete_signal_file,
     save_stem_file,
+    StemWriter,
+    retain_file,
+    release_file,
+    release_files,
 )
+from api.config import grid_bucket_name, stem_collection_name
 from api.test.conftest import _get_signal
 from api.test.constants import TEST_USERNAME
-from api.schemas import Signal, SignalState
+from api.schemas import SeparatedSignal, Signal, SignalState
+from api.utils.codec import StemCodec
 
 
 pytestmark = pytest.mark.asyncio
@@ -76,6 +94,100 @@ async def test_update_signal(signal, db_client, cleanup_db):
     assert not signal_actual
 
 
+async def test_update_signal_stems(signal, db_client, cleanup_db):
+    signal_id = signal.signal_id
+    updated = await add_signal_stem(
+        db_client, signal_id, TEST_USERNAME, "vocals", "1"
+    )
+    assert updated.separated_stems == ["vocals"]
+    # concurrent edits of the stems are all kept
+    await asyncio.gather(
+        add_signal_stem(db_client, signal_id, TEST_USERNAME, "drums", "2"),
+        add_signal_stem(db_client, signal_id, TEST_USERNAME, "bass", "3"),
+        update_signal(
+            db_client,
+            signal_id,
+            TEST_USERNAME,
+            signal_state=TaskState.Complete,
+        ),
+    )
+    signal_actual = await read_one_signal(db_client, signal_id, TEST_USERNAME)
+    assert sorted(signal_actual.separated_stems) == ["bass", "drums", "vocals"]
+    assert sorted(signal_actual.separated_stem_id) == ["1", "2", "3"]
+    assert signal_actual.signal_state == TaskState.Complete
+    state = await get_signal_state(db_client, signal_id, TEST_USERNAME)
+    assert state.signal_state == TaskState.Complete
+
+    assert not await add_signal_stem(
+        db_client, signal_id, TEST_USERNAME, "vocals", "4"
+    )
+    assert not await rename_signal_stem(
+        db_client, signal_id, TEST_USERNAME, "vocals", "drums"
+    )
+    updated = await rename_signal_stem(
+        db_client, signal_id, TEST_USERNAME, "vocals", "voice"
+    )
+    assert updated.separated_stems[0] == "voice"
+
+    updated = await remove_signal_stem(
+        db_client, signal_id, TEST_USERNAME, "voice", "1"
+    )
+    assert "voice" not in updated.separated_stems
+    assert "1" not in updated.separated_stem_id
+    assert not await remove_signal_stem(
+        db_client, signal_id, TEST_USERNAME, "voice", "1"
+    )
+    assert not await update_signal(db_client, "99", TEST_USERNAME)
+
+
+async def test_complete_signal(signal, db_client, cleanup_db):
+    stems = [
+        SeparatedSignal(
+            signal_id=stem_id,
+            signal_metadata=signal.signal_metadata,
+            stem_name=stem_name,
+            parent_id=signal.signal_id,
+        )
+        for stem_name, stem_id in (("vocals", "1"), ("accompaniment", "2"))
+    ]
+    completed = await complete_signal(
+        db_client, signal.signal_id, TEST_USERNAME, stems, TaskState.Complete,
+    )
+    assert completed.separated_stems == ["vocals", "accompaniment"]
+    assert completed.separated_stem_id == ["1", "2"]
+    state = await get_signal_state(db_client, signal.signal_id, TEST_USERNAME)
+    assert state.signal_state == TaskState.Complete
+    stem = await read_one_signal(
+        db_client, signal.signal_id, TEST_USERNAME, stem="accompaniment"
+    )
+    assert stem.signal_id == "2"
+
+    assert not await complete_signal(db_client, "99", TEST_USERNAME, [])
+
+
+async def test_complete_deleted_signal(signal, db_client, cleanup_db):
+    file_id = await save_stem_file(
+        db_client, "vocals", np.zeros((44_100, 2)), 44_100
+    )
+    stem = SeparatedSignal(
+        signal_id=file_id,
+        signal_metadata=signal.signal_metadata,
+        stem_name="vocals",
+        parent_id=signal.signal_id,
+    )
+    # deleted while separating
+    assert await remove_signal(db_client, signal.signal_id, TEST_USERNAME)
+
+    assert not await complete_signal(
+        db_client, signal.signal_id, TEST_USERNAME, [stem], TaskState.Complete
+    )
+    stems = db_client.get_default_database().get_collection(
+        stem_collection_name
+    )
+    assert not await stems.count_documents({"signal_id": file_id})
+    assert await read_signal_file_by_id(db_client, file_id) is None
+
+
 async def test_read_all_signals(db_client, cleanup_db):
     signal = Signal(**_get_signal().dict())
     await create_signal(db_client, signal, TEST_USERNAME)
@@ -90,6 +202,34 @@ async def test_read_all_signals(db_client, cleanup_db):
     assert not signals
 
 
+async def test_read_signal_page(db_client, cleanup_db):
+    signal = Signal(**_get_signal().dict())
+    for signal_id in range(5):
+        signal.signal_id = str(signal_id)
+        signal.signal_metadata.projectname = f"project{signal_id % 2}"
+        await create_signal(db_client, signal, TEST_USERNAME)
+    state = SignalState(signal_id="3", signal_state=TaskState.Complete)
+    await update_signal_state(db_client, state, TEST_USERNAME)
+
+    rows = await find_signal(db_client, TEST_USERNAME, 2).to_list(2)
+    assert [row["signal_id"] for row in rows] == ["0", "1"]
+    after = str(rows[-1]["_id"])
+    page = await read_signal(db_client, TEST_USERNAME, 2, after=after)
+    assert [s.signal_id for s in page] == ["2", "3"]
+    rows = await find_signal(
+        db_client, TEST_USERNAME, after=after, fields=["signal_id"]
+    ).to_list(None)
+    assert set(rows[0]) == {"_id", "signal_id"}
+    assert len(rows) == 3
+
+    page = await read_signal(db_client, TEST_USERNAME, projectname="project1")
+    assert [s.signal_id for s in page] == ["1", "3"]
+    page = await read_signal(
+        db_client, TEST_USERNAME, signal_state=TaskState.Complete
+    )
+    assert [s.signal_id for s in page] == ["3"]
+
+
 async def test_delete_signal(signal, db_client, cleanup_db):
     deleted_count = await remove_signal(db_client, signal.signal_id, "invalid")
     assert not deleted_count
@@ -133,9 +273,12 @@ async def test_update_signal_state(signal_state, db_client, cleanup_db):
 
 async def test_signal_file(db_client, signal_file, cleanup_db):
     name = signal_file.filename
-    file_id = await save_signal_file(db_client, signal_file)
+    file_id, content_hash = await save_signal_file(
+        db_client, signal_file, with_hash=True
+    )
     content = await read_signal_file(db_client, name, stream=False)
     assert content
+    assert content_hash == hashlib.sha256(content).hexdigest()
 
     content = await read_signal_file(db_client, "INVALID.wav", stream=False)
     assert not content
@@ -145,20 +288,91 @@ async def test_signal_file(db_client, signal_file, cleanup_db):
     assert not content
 
 
+async def test_signal_stream(db_client, signal_file, cleanup_db):
+    content = signal_file.file.read()
+
+    async def _chunks():
+        for start in range(0, len(content), 10_000):
+            yield content[start : start + 10_000]
+
+    file_id, content_hash, head, size = await save_signal_stream(
+        db_client, signal_file.filename, "audio/wav", _chunks(), head_size=64
+    )
+    assert content_hash == hashlib.sha256(content).hexdigest()
+    assert head == content[:64]
+    assert size == len(content)
+    chunks = await read_signal_file_by_id(db_client, file_id)
+    assert b"".join([chunk async for chunk in chunks]) == content
+
+
+@pytest.mark.parametrize("codec", list(StemCodec))
 @pytest.mark.parametrize(
     "sr, duration, channels",
     ((44_100, 10, 2), (22_050, 20, 1), (11_025, 5, 2)),
 )
-async def test_stem_file(db_client, cleanup_db, sr, duration, channels):
+async def test_stem_file(db_client, cleanup_db, sr, duration, channels, codec):
     def _create_signal(duration, sr, channels):
         return np.zeros((duration * sr, channels))
 
     stem_id = "test_stem"
     test_stem = _create_signal(duration, sr, channels)
-    file_id = await save_stem_file(db_client, stem_id, test_stem, sr)
+    file_id = await save_stem_file(
+        db_client, stem_id, test_stem, sr, codec=codec
+    )
     content = await read_signal_file(db_client, stem_id, stream=False)
     assert content
+    signal = await read_signal_file(db_client, stem_id, decode=True)
+    assert signal.shape == test_stem.shape
 
     await delete_signal_file(db_client, file_id)
     content = await read_signal_file(db_client, stem_id, stream=False)
     assert not content
+
+
+@pytest.mark.parametrize("frames", (None, 25_000))
+@pytest.mark.parametrize("codec", list(StemCodec))
+async def test_stem_writer(db_client, cleanup_db, codec, frames):
+    sr = 8_000
+    signal = np.random.uniform(-1, 1, (20_000, 2)).astype(np.float32)
+    writer = StemWriter(db_client, "test_stem", frames, sr, codec)
+    for start in range(0, len(signal), 3_000):
+        await writer.write(signal[start : start + 3_000])
+    await writer.close()
+
+    decoded = await read_signal_file(db_client, "test_stem", decode=True)
+    assert len(decoded) == (frames or len(signal))
+    np.testing.assert_allclose(decoded[: len(signal)], signal, atol=1e-4)
+
+
+async def test_shared_file(db_client, cleanup_db):
+    file_id = await save_stem_file(
+        db_client, "test_stem", np.zeros((100, 2)), 8_000
+    )
+    await retain_file(db_client, file_id)
+    assert not await release_file(db_client, file_id)
+    assert await read_signal_file_by_id(db_client, file_id)
+    assert await release_file(db_client, file_id)
+    assert await read_signal_file_by_id(db_client, file_id) is None
+    with pytest.raises(NoFile):
+        await retain_file(db_client, file_id)
+
+
+async def test_release_files(db_client, cleanup_db):
+    shared, owned = [
+        await save_stem_file(db_client, name, np.zeros((100, 2)), 8_000)
+        for name in ("shared_stem", "owned_stem")
+    ]
+    await retain_file(db_client, shared)
+    assert await release_files(db_client, [shared, owned, "invalid"]) == [
+        owned
+    ]
+    assert await read_signal_file_by_id(db_client, shared)
+    assert await read_signal_file_by_id(db_client, owned) is None
+    chunks = db_client.get_default_database().get_collection(
+        f"{grid_bucket_name}.chunks"
+    )
+    assert not await chunks.count_documents({"files_id": ObjectId(owned)})
+
+    # both references of a file released at once
+    await retain_file(db_client, shared)
+    assert await release_files(db_client, [shared, shared]) == [shared]
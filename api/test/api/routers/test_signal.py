@@ -1,10 +1,16 @@
 from tempfile import NamedTemporaryFile
 
-from api.schemas import Signal, SignalState
+import pytest
+
+from api.config import signal_collection_name
+from api.schemas import SeparatedSignal, Signal, SignalState
+from api.test.conftest import _get_signal
+from api.worker import TaskState
 from api.test.constants import (
     TEST_SIGNAL_ID,
     TEST_DURATION_SECONDS,
     TEST_STEMS,
+    TEST_USERNAME,
 )
 
 
@@ -18,6 +24,32 @@ def test_get_signal(signal, client, cleanup_db):
     signal_actual = data[0]
     assert signal_actual["signal"] == Signal(**signal.dict()).dict()
 
+    etag = response.headers["etag"]
+    response = client.get("/signal", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+
+def test_get_signal_page(signal, client, cleanup_db):
+    response = client.get("/signal", params={"fields": "signal_id"})
+    data = response.json()
+    assert response.status_code == 200
+    assert data[0]["signal"] == {"signal_id": signal.signal_id}
+
+    response = client.get("/signal", params={"after": data[0]["cursor"]})
+    assert response.status_code == 200
+    assert response.json() == []
+
+    response = client.get("/signal", params={"projectname": "invalid"})
+    assert response.json() == []
+    response = client.get("/signal", params={"state": "Complete"})
+    assert response.json() == []
+
+    response = client.get("/signal", params={"fields": "username"})
+    assert response.status_code == 422
+    response = client.get("/signal", params={"after": "invalid"})
+    assert response.status_code == 422
+
 
 def test_get_stem_state(signal_state, client, cleanup_db):
     response = client.get(f"/signal/state/{TEST_SIGNAL_ID}")
@@ -63,6 +95,15 @@ def test_post_signal(signal_file_name, client, celery_app, cleanup_db):
     assert response.status_code == 400
 
 
+def test_post_signal_openapi(client):
+    schema = client.get("/openapi.json").json()
+    request_body = schema["paths"]["/signal/{signal_type}"]["post"][
+        "requestBody"
+    ]
+    form = request_body["content"]["multipart/form-data"]["schema"]
+    assert form["properties"]["signal_file"]["format"] == "binary"
+
+
 def test_patch_signal(signal, signal_file_name, client, cleanup_db):
     stem_name = "new_stem"
     response = client.patch(
@@ -93,6 +134,18 @@ def test_patch_signal(signal, signal_file_name, client, cleanup_db):
     assert data["signal"]["signal_id"] == TEST_SIGNAL_ID
     assert data["signal"]["separated_stems"][-1] == stem_name
 
+    response = client.patch(
+        f"/signal/{TEST_SIGNAL_ID}/{stem_name}",
+        files={
+            "signal_file": (
+                "filename",
+                open(signal_file_name, "rb"),
+                "audio/mpeg",
+            )
+        },
+    )
+    assert response.status_code == 409
+
 
 def test_rename_stem(generate_stem, client, cleanup_db):
     new_stem_name = "new_name"
@@ -121,9 +174,30 @@ def test_rename_stem(generate_stem, client, cleanup_db):
     assert response.status_code == 200
     assert data
 
+    response = client.patch(
+        f"/signal/rename/{TEST_SIGNAL_ID}/{new_stem_name}",
+        params={"new_stem_name": TEST_STEMS[1]},
+    )
+    assert response.status_code == 409
+
+
+@pytest.fixture
+async def separating_signal(db_client):
+    signal = _get_signal()
+    signal.signal_state = TaskState.Separating
+    await db_client.get_default_database().get_collection(
+        signal_collection_name
+    ).insert_one(signal.dict())
+    return signal
+
+
+def test_copy_separating_signal(separating_signal, client, cleanup_db):
+    response = client.post(f"/signal/copy/{TEST_SIGNAL_ID}")
+    assert response.status_code == 409
+
 
 def test_copy_stem(generate_stem, client, cleanup_db):
-    response = client.post(f"/signal/copy/invalid")
+    response = client.post("/signal/copy/invalid")
     assert response.status_code == 404
 
     response = client.post(f"/signal/copy/{TEST_SIGNAL_ID}")
@@ -161,15 +235,60 @@ def test_delete_stem(generate_stem, client, cleanup_db):
     assert response.status_code == 200
 
 
-def test_delete_signal(signal, client, cleanup_db):
-    # TODO
+@pytest.fixture
+async def missing_stem_file(signal, db_client):
+    from api.services import add_signal_stem, create_stem
+
+    # the file of the stem is gone
+    stem_id = "5f0000000000000000000000"
+    stem = SeparatedSignal(
+        signal_id=stem_id,
+        signal_metadata=signal.signal_metadata,
+        stem_name="gone",
+        parent_id=signal.signal_id,
+    )
+    await create_stem(db_client, stem, TEST_USERNAME)
+    await add_signal_stem(
+        db_client, signal.signal_id, TEST_USERNAME, "gone", stem_id
+    )
+
+
+def test_delete_stem_missing_file(missing_stem_file, client, cleanup_db):
+    response = client.delete(f"/signal/{TEST_SIGNAL_ID}/gone")
+    assert response.status_code == 202
+    assert response.json() == {"stem_name": "gone", "deleted": True}
+
+
+def test_delete_signal(generate_stem, client, cleanup_db):
     response = client.delete("/signal/0")
     assert response.status_code == 404
 
+    response = client.delete(f"/signal/{TEST_SIGNAL_ID}")
+    assert response.status_code == 202
+    assert response.json() == {"signal_id": TEST_SIGNAL_ID, "deleted": True}
+
+    response = client.get(f"/signal/stem/{TEST_SIGNAL_ID}/{TEST_STEMS[0]}")
+    assert response.status_code == 404
+    response = client.get(f"/signal/state/{TEST_SIGNAL_ID}")
+    assert response.json()["signal_state"] == TaskState.Deleted
+
     response = client.delete(f"/signal/{TEST_SIGNAL_ID}")
     assert response.status_code == 404
 
 
+def test_delete_signals(generate_stem, client, cleanup_db):
+    response = client.delete(
+        "/signal", params={"signal_ids": [TEST_SIGNAL_ID, "0"]}
+    )
+    assert response.status_code == 202
+    assert response.json() == {"signal_ids": [TEST_SIGNAL_ID]}
+    assert client.get("/signal").json() == []
+
+    response = client.delete("/signal", params={"signal_ids": ["0"] * 101})
+    assert response.status_code == 422
+    assert client.delete("/signal").status_code == 422
+
+
 def test_get_stem(generate_stem, client):
     response = client.get(f"/signal/stem/{TEST_SIGNAL_ID}/invalid")
     assert response.status_code == 404
@@ -182,3 +301,101 @@ def test_get_stem(generate_stem, client):
     assert response.status_code == 200
     # even for 404 assert data will be true
     assert data
+    assert response.headers["accept-ranges"] == "bytes"
+    assert int(response.headers["content-length"]) == len(data)
+
+    size = len(data)
+    response = client.get(
+        f"/signal/stem/{TEST_SIGNAL_ID}/{TEST_STEMS[0]}",
+        headers={"Range": "bytes=100-"},
+    )
+    assert response.status_code == 206
+    assert response.content == data[100:]
+    assert response.headers["content-range"] == f"bytes 100-{size - 1}/{size}"
+
+    response = client.get(
+        f"/signal/stem/{TEST_SIGNAL_ID}/{TEST_STEMS[0]}",
+        headers={"Range": f"bytes={size}-"},
+    )
+    assert response.status_code == 416
+
+    etag = response.headers["etag"]
+    response = client.get(
+        f"/signal/stem/{TEST_SIGNAL_ID}/{TEST_STEMS[0]}",
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 304
+    assert not response.content
+    # the stem name may be patched with another file
+    assert "no-cache" in response.headers["cache-control"]
+
+    # another version is held, the whole stem is sent
+    response = client.get(
+        f"/signal/stem/{TEST_SIGNAL_ID}/{TEST_STEMS[0]}",
+        headers={"Range": "bytes=100-", "If-Range": '"other"'},
+    )
+    assert response.status_code == 200
+    assert response.content == data
+
+
+def test_get_stem_peaks(generate_stem, client, cleanup_db):
+    url = f"/signal/peaks/{TEST_SIGNAL_ID}/{TEST_STEMS[0]}"
+    response = client.get(url, params={"start": 1, "end": 2})
+    data = response.json()
+    assert response.status_code == 200
+    assert data["level"] == 0
+    # a peak every 256 frames of the silent stems
+    assert data["start"] == 44_100 // 256
+    assert len(data["peaks"]) == 3 * (-(-2 * 44_100 // 256) - data["start"])
+    assert not any(data["peaks"])
+
+    response = client.get(url, params={"level": 5})
+    assert response.status_code == 200
+    assert response.json()["length"] == 2
+
+    response = client.get(
+        url, headers={"If-None-Match": response.headers["etag"]}
+    )
+    assert response.status_code == 304
+
+    response = client.get(url, params={"level": 6})
+    assert response.status_code == 422
+    response = client.get(f"/signal/peaks/{TEST_SIGNAL_ID}/invalid")
+    assert response.status_code == 404
+
+
+def test_get_stem_rendition(generate_stem, client, cleanup_db):
+    url = f"/signal/stem/{TEST_SIGNAL_ID}/{TEST_STEMS[0]}"
+    response = client.get(url, params={"format": "opus"})
+    data = response.content
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/ogg"
+    assert data[:4] == b"OggS"
+
+    # served from the cache
+    etag = response.headers["etag"]
+    response = client.get(url, params={"format": "opus"})
+    assert response.headers["etag"] == etag
+    assert response.content == data
+
+    response = client.get(url, params={"format": "mp3", "bitrate": 128})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "audio/mpeg"
+    assert response.headers["etag"] != etag
+
+    # revalidated without transcoding
+    response = client.get(
+        url,
+        params={"format": "mp3", "bitrate": 192},
+        headers={"If-None-Match": response.headers["etag"]},
+    )
+    assert response.status_code == 200
+    response = client.get(
+        url, params={"format": "opus"}, headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 304
+
+    response = client.get(url, params={"format": "mp3", "bitrate": 100})
+    assert response.status_code == 422
+    response = client.get(url, params={"format": "wma"})
+    assert response.status_code == 422
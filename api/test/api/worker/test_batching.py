@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from api.separator import Separator as ABCSeparator
+from api.worker.batching import InferenceScheduler
+
+
+class BatchSeparator(ABCSeparator):
+    def __init__(self):
+        self.batch_sizes = []
+
+    def separate(self, audio: np.ndarray):
+        return {"one": audio * 2}
+
+    def separate_batch(self, waveforms):
+        self.batch_sizes.append(len(waveforms))
+        if any(not len(waveform) for waveform in waveforms):
+            raise ValueError("Empty waveform")
+        return super().separate_batch(waveforms)
+
+
+def test_scheduler_batches_concurrent_chunks():
+    separator = BatchSeparator()
+    scheduler = InferenceScheduler(separator, max_batch_size=4, max_wait=1)
+    chunks = [np.full((10, 2), i, dtype=np.float32) for i in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        predictions = list(executor.map(scheduler.predict, chunks))
+    scheduler.close()
+
+    for chunk, prediction in zip(chunks, predictions):
+        assert np.array_equal(prediction["one"], chunk * 2)
+    assert sum(separator.batch_sizes) == len(chunks)
+    assert max(separator.batch_sizes) <= 4
+    assert len(separator.batch_sizes) < len(chunks)
+
+
+def test_scheduler_errors():
+    separator = BatchSeparator()
+    scheduler = InferenceScheduler(separator, max_batch_size=2, max_wait=0)
+
+    with pytest.raises(ValueError):
+        scheduler.predict(np.zeros((0, 2)))
+    assert np.array_equal(
+        scheduler.predict(np.ones((1, 2)))["one"], np.ones((1, 2)) * 2
+    )
+
+    scheduler.close()
+    with pytest.raises(RuntimeError):
+        scheduler.predict(np.ones((1, 2)))
+
+
+def test_scheduler_close_while_submitting():
+    separator = BatchSeparator()
+    scheduler = InferenceScheduler(separator, max_batch_size=4, max_wait=0)
+
+    def submit(i):
+        try:
+            return scheduler.submit(np.full((1, 2), i, dtype=np.float32))
+        except RuntimeError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = executor.map(submit, range(64))
+        scheduler.close()
+        futures = list(futures)
+    # every queued chunk is separated, none waits forever
+    for future in filter(None, futures):
+        assert "one" in future.result(timeout=1)
@@ -0,0 +1,89 @@
+import numpy as np
+
+from api.separator import Separator as ABCSeparator, SignalType
+from api.worker.registry import SeparatorRegistry, parse_models
+
+
+class SizedSeparator(ABCSeparator):
+    def __init__(self, stems: int):
+        self.stems = stems
+        self.memory_footprint = stems
+        self.warm = False
+        self.closed = False
+
+    def separate(self, audio: np.ndarray):
+        return {f"{i}": audio.copy() for i in range(self.stems)}
+
+    def warm_up(self):
+        self.warm = True
+
+    def close(self):
+        self.closed = True
+
+
+def _registry(max_bytes):
+    return SeparatorRegistry(max_bytes, lambda _, stems: SizedSeparator(stems))
+
+
+def test_parse_models():
+    assert parse_models("Music:2, Music:4,") == [
+        (SignalType.Music, 2),
+        (SignalType.Music, 4),
+    ]
+    assert parse_models("") == []
+
+
+def test_registry_hits():
+    registry = _registry(max_bytes=100)
+    separator = registry.get(SignalType.Music, 2)
+    assert registry.get("Music", 2) is separator
+    assert registry.get(SignalType.Music, 4) is not separator
+
+    stats = registry.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["evictions"] == 0
+    assert stats["loaded"] == ["Music:2", "Music:4"]
+
+
+def test_registry_eviction():
+    registry = _registry(max_bytes=9)
+    two = registry.get(SignalType.Music, 2)
+    registry.get(SignalType.Music, 4)
+    # 2 is used most recently, hence 4 is evicted
+    registry.get(SignalType.Music, 2)
+    registry.get(SignalType.Music, 5)
+
+    assert registry.stats()["loaded"] == ["Music:2", "Music:5"]
+    assert registry.evictions == 1
+    assert registry.get(SignalType.Music, 2) is two
+
+    # a single model larger than the budget is still served
+    registry = _registry(max_bytes=1)
+    registry.get(SignalType.Music, 5)
+    assert registry.stats()["loaded"] == ["Music:5"]
+
+
+def test_registry_preload():
+    registry = _registry(max_bytes=100)
+    registry.preload("Music:2,Music:5")
+
+    assert registry.misses == 2
+    assert registry.get(SignalType.Music, 5).warm
+
+
+def test_registry_lease():
+    registry = _registry(max_bytes=8)
+    with registry.lease(SignalType.Music, 4) as four:
+        with registry.lease(SignalType.Music, 4):
+            registry.get(SignalType.Music, 5)
+        # evicted while held by a job
+        assert registry.stats()["loaded"] == ["Music:5"]
+        assert not four.closed
+    assert four.closed
+
+    # separators no job holds are closed on eviction
+    registry = _registry(max_bytes=1)
+    two = registry.get(SignalType.Music, 2)
+    registry.get(SignalType.Music, 4)
+    assert two.closed
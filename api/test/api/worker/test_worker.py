@@ -3,8 +3,10 @@ import pytest
 from unittest.mock import patch
 
 from api.test.constants import TEST_SIGNAL_FILE_NAME, TEST_USERNAME
+from api.config import grid_bucket_name
 from api.services import read_one_signal
 from api.separator import Separator as ABCSeparator
+from api.separator.base import FrameStream
 
 
 class TestSeparator(ABCSeparator):
@@ -16,11 +18,34 @@ class TestSeparator(ABCSeparator):
         return predictions
 
 
+class FailingStream(FrameStream):
+    """Fails on the second frame, after noise was written to the stems."""
+
+    def __init__(self, stems: int):
+        self.stems = stems
+        self.pushed = False
+
+    def push(self, frames: np.ndarray):
+        if self.pushed:
+            raise RuntimeError("Separation failed")
+        self.pushed = True
+        # longer than the frames, spans several GridFS chunks
+        noise = np.random.default_rng(0).uniform(
+            -1, 1, (len(frames) * 8, frames.shape[1])
+        )
+        return {f"{i}": noise.astype(np.float32) for i in range(self.stems)}
+
+
+class FailingSeparator(TestSeparator):
+    def stream(self, sample_rate=44_100):
+        return FailingStream(self.stems)
+
+
 @pytest.fixture
 def separator_mock(mocker, stems):
-    mocker.patch(
-        "api.worker.task.get_separator", return_value=TestSeparator(stems)
-    )
+    separator = mocker.MagicMock()
+    separator.__enter__.return_value = TestSeparator(stems)
+    mocker.patch("api.worker.task.lease_separator", return_value=separator)
 
 
 @pytest.fixture
@@ -83,3 +108,43 @@ async def test_perform_separation(
         db_client, signal_celery_setup["signal_id"], TEST_USERNAME
     )
     assert len(signal_actual.separated_stems) == stems
+
+
+@pytest.mark.asyncio
+async def test_perform_separation_failure(
+    mocker,
+    db_client,
+    client,
+    user,
+    signal_celery_setup,
+    celery_state_update_mock,
+    cleanup_db,
+):
+    from api.worker import perform_separation
+
+    separator = mocker.MagicMock()
+    separator.__enter__.return_value = FailingSeparator(2)
+    mocker.patch("api.worker.task.lease_separator", return_value=separator)
+    mocker.patch("api.worker.task.STREAM_FRAME_SECONDS", 5)
+
+    with pytest.raises(RuntimeError):
+        await perform_separation(
+            celery_state_update_mock,
+            signal_celery_setup,
+            user.dict(),
+            2,
+            db_client,
+        )
+    signal = await read_one_signal(
+        db_client, signal_celery_setup["signal_id"], TEST_USERNAME
+    )
+    assert not signal.separated_stem_id
+    db = db_client.get_default_database()
+    # only the uploaded file is left
+    files = await db.get_collection(f"{grid_bucket_name}.files").distinct(
+        "_id"
+    )
+    assert len(files) == 1
+    assert not await db.get_collection(
+        f"{grid_bucket_name}.chunks"
+    ).count_documents({"files_id": {"$nin": files}})
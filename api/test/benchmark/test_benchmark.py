@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from api.benchmark.separator import (
+    STAGES,
+    BenchmarkCase,
+    StubSeparator,
+    load_separator,
+    main,
+    run_case,
+    synthetic_signal,
+)
+
+
+def test_stub_separator():
+    waveform = synthetic_signal(3, 8_000)
+    separator = StubSeparator(4, chunk_size=1 / 60, overlap=0.25)
+    separated = separator.separate(waveform, 8_000)
+    assert len(separated) == 4
+    # masks sum up to one, the stems add up to the input
+    np.testing.assert_allclose(sum(separated.values()), waveform, atol=1e-5)
+
+
+def test_run_case():
+    case = BenchmarkCase("stub", 2, 7, 0.05, 1, 8_000, frame_seconds=1)
+    result = run_case(case, trace_allocations=True)
+    assert result["audio_seconds"] == 7
+    assert result["real_time_factor"] > 0
+    assert set(result["stages"]) == set(STAGES)
+    assert result["peak_rss_bytes"] >= result["baseline_rss_bytes"]
+    assert result["allocations"]["peak_bytes"] > 0
+    assert set(result["stem_bytes"]) == {"stem0", "stem1"}
+    assert all(result["stem_bytes"].values())
+
+
+def test_stub_chunk_size_zero():
+    with pytest.raises(ValueError):
+        load_separator(BenchmarkCase("stub", 2, 7, 0, 1))
+    with pytest.raises(SystemExit):
+        main(["--chunk-sizes", "0", "2"])
@@ -16,6 +16,9 @@ from api.config import (
     signal_state_collection_name,
     user_collection_name,
     grid_bucket_name,
+    content_collection_name,
+    rendition_collection_name,
+    peaks_collection_name,
 )
 from api.separator import SignalType
 from api.schemas import (
@@ -66,6 +69,9 @@ async def cleanup_db(db_client):
     await db.get_default_database().drop_collection(
         signal_state_collection_name
     )
+    await db.get_default_database().drop_collection(content_collection_name)
+    await db.get_default_database().drop_collection(rendition_collection_name)
+    await db.get_default_database().drop_collection(peaks_collection_name)
     await db.get_default_database().drop_collection(
         f"{grid_bucket_name}.files"
     )
@@ -135,7 +141,10 @@ def signal_file(signal_file_name):
 
 @pytest.fixture
 async def generate_stem(signal, signal_file, db_client):
+    from api.utils.codec import DEFAULT_STEM_CODEC
+    from api.utils.peaks import build_peaks
     from api.services import (
+        save_peaks,
         save_stem_file,
         update_signal,
         get_stem_id,
@@ -148,11 +157,14 @@ async def generate_stem(signal, signal_file, db_client):
     for stem_name in TEST_STEMS:
         stem_id = get_stem_id(stem_name, TEST_SIGNAL_ID)
         file_id = await save_stem_file(db_client, stem_id, test_stem, sr)
+        await save_peaks(db_client, file_id, sr, build_peaks(test_stem))
         separated_id.append(file_id)
         stem = SeparatedSignal(
             signal_id=file_id,
             signal_metadata=signal.signal_metadata,
             stem_name=stem_name,
+            parent_id=signal.signal_id,
+            codec=DEFAULT_STEM_CODEC,
         )
 
         await create_stem(db_client, stem, TEST_USERNAME)
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from api.separator.chunk import (
+    OverlapAdd,
+    StreamingOverlapAdd,
+    Window,
+    budget_chunk_length,
+    chunk_spans,
+    estimate_chunk_bytes,
+    predict_split,
+)
+
+
+@pytest.mark.parametrize(
+    "length, chunk_length, overlap",
+    ((1000, 100, 10), (1001, 100, 10), (50, 100, 10), (100, 100, 0)),
+)
+def test_chunk_spans(length, chunk_length, overlap):
+    spans = chunk_spans(length, chunk_length, overlap)
+
+    assert spans[0][0] == 0
+    assert spans[-1][1] == length
+    assert all(end - start <= chunk_length for start, end in spans)
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        assert end - start == overlap
+
+    with pytest.raises(ValueError):
+        chunk_spans(length, overlap, overlap)
+
+
+@pytest.mark.parametrize("window", (Window.Hann, Window.Linear))
+def test_overlap_add(window):
+    waveform = np.random.rand(1234, 2).astype(np.float32)
+    overlap = 16
+
+    merger = OverlapAdd(len(waveform), overlap, window)
+    for start, end in chunk_spans(len(waveform), 100, overlap):
+        chunk = waveform[start:end]
+        merger.add(start, end, {"one": chunk, "two": -chunk})
+
+    assert merger.buffers["one"].shape == waveform.shape
+    assert np.allclose(merger.buffers["one"], waveform, atol=1e-6)
+    assert np.allclose(merger.buffers["two"], -waveform, atol=1e-6)
+
+
+def _predict_batch(chunks):
+    return [{"one": chunk * 2, "two": -chunk} for chunk in chunks]
+
+
+@pytest.mark.parametrize("batch_size", (1, 3))
+@pytest.mark.parametrize("length", (0, 50, 100, 190, 1000, 1234))
+def test_streaming_overlap_add(length, batch_size):
+    waveform = np.random.rand(length, 2).astype(np.float32)
+    overlap, chunk_length = 10, 100
+
+    stream = StreamingOverlapAdd(
+        chunk_length, overlap, _predict_batch, batch_size=batch_size
+    )
+    separated = {"one": [], "two": []}
+    for start in range(0, length, 37):
+        for name, stem in stream.push(waveform[start : start + 37]).items():
+            separated[name].append(stem)
+    for name, stem in stream.close().items():
+        separated[name].append(stem)
+
+    if not length:
+        assert not any(separated.values())
+        return
+    one = np.concatenate(separated["one"])
+    two = np.concatenate(separated["two"])
+    assert np.allclose(one, waveform * 2, atol=1e-6)
+    assert np.allclose(two, -waveform, atol=1e-6)
+
+    merger = OverlapAdd(length, overlap)
+    for start, end in chunk_spans(length, chunk_length, overlap):
+        merger.add(start, end, _predict_batch([waveform[start:end]])[0])
+    assert np.allclose(merger.buffers["one"], one, atol=1e-6)
+
+
+@pytest.mark.parametrize("length", (10, 11, 1000, 1001))
+def test_predict_split(length):
+    waveform = np.random.rand(length, 2).astype(np.float32)
+    lengths = []
+
+    def predict(chunk):
+        lengths.append(len(chunk))
+        return _predict_batch([chunk])[0]
+
+    prediction = predict_split(predict, waveform, length // 4)
+    assert len(lengths) == 2
+    assert max(lengths) < length
+    assert np.allclose(prediction["one"], waveform * 2, atol=1e-6)
+    assert np.allclose(prediction["two"], -waveform, atol=1e-6)
+
+
+@pytest.mark.parametrize("stems", (2, 4, 5))
+def test_budget_chunk_length(stems):
+    budget = 4 * 1024 ** 3
+    samples = budget_chunk_length(budget, 2, stems)
+    assert estimate_chunk_bytes(samples, 2, stems) <= budget
+    assert estimate_chunk_bytes(samples + 1, 2, stems) > budget
+    assert budget_chunk_length(budget, 1, stems) > samples
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from api.utils.codec import StemCodec, StemEncoder, encode_stem, decode_stem
+from api.utils.signal import read_audio
+
+
+@pytest.mark.parametrize("codec", list(StemCodec))
+@pytest.mark.parametrize("sr, channels", ((44_100, 2), (22_050, 1)))
+def test_codec(codec, sr, channels):
+    signal = np.random.default_rng(0).uniform(-1, 1, (sr, channels))
+    signal = signal.astype(np.float32)
+
+    stream = encode_stem(signal, sr, codec)
+    decoded, decoded_sr = decode_stem(stream)
+    assert decoded_sr == sr
+    assert decoded.shape == signal.shape
+    tolerance = 0 if codec == StemCodec.Float32 else 1e-4
+    np.testing.assert_allclose(decoded, signal, atol=tolerance)
+    np.testing.assert_array_equal(read_audio(stream), decoded)
+
+
+def test_codec_size():
+    signal = np.zeros((44_100, 2), dtype=np.float32)
+    float32, int16, flac = (
+        len(encode_stem(signal, 44_100, codec)) for codec in StemCodec
+    )
+    assert float32 > int16 > flac
+
+
+@pytest.mark.parametrize("codec", list(StemCodec))
+@pytest.mark.parametrize("frames", (None, 30_000, 50_000))
+def test_stem_encoder(codec, frames):
+    sr = 22_050
+    signal = np.random.default_rng(0).uniform(-1, 1, (40_000, 2))
+    signal = signal.astype(np.float32)
+
+    encoder = StemEncoder(sr, 2, codec, frames)
+    stream = bytearray()
+    for start in range(0, len(signal), 7_000):
+        encoder.write(signal[start : start + 7_000])
+        stream += encoder.take(4096)
+    patches = encoder.close()
+    stream += encoder.take()
+    for offset, patch in patches:
+        assert offset + len(patch) <= len(stream)
+        stream[offset : offset + len(patch)] = patch
+
+    decoded, _ = decode_stem(bytes(stream))
+    assert len(decoded) == (frames or len(signal))
+    length = min(len(decoded), len(signal))
+    np.testing.assert_allclose(decoded[:length], signal[:length], atol=1e-4)
+    np.testing.assert_array_equal(decoded[length:], 0)
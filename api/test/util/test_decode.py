@@ -0,0 +1,42 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from api.utils.signal import (
+    pcm_to_np,
+    pydub_to_np,
+    read_segment,
+)
+
+
+@pytest.mark.parametrize("sample_width", (1, 2, 3, 4))
+def test_pcm_to_np(sample_width):
+    bits = 8 * sample_width
+    samples = [0, 1, -1, -(2 ** (bits - 1)), 2 ** (bits - 1) - 1, 0]
+    data = b"".join(
+        sample.to_bytes(sample_width, "little", signed=True)
+        for sample in samples
+    )
+
+    signal = pcm_to_np(data, sample_width, 2)
+    assert signal.shape == (3, 2)
+    assert signal.dtype == np.float32
+    expected = np.array(samples, dtype=np.float64) / 2 ** (bits - 1)
+    np.testing.assert_allclose(signal.ravel(), expected, atol=1e-7)
+    assert signal.min() == -1
+
+
+def test_read_segment():
+    samples = (np.arange(2000) - 1000).astype("<i2")
+    audio = AudioSegment(
+        data=samples.tobytes(), sample_width=2, frame_rate=8000, channels=2
+    )
+    stream = BytesIO()
+    audio.export(stream, format="wav")
+    audio = read_segment(stream.getvalue(), "wav")
+
+    np.testing.assert_array_equal(
+        pydub_to_np(audio), samples.reshape(-1, 2) / 2 ** 15
+    )
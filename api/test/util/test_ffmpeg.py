@@ -0,0 +1,103 @@
+import asyncio
+from io import BytesIO
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from api.utils.codec import RenditionFormat
+from api.utils.ffmpeg import (
+    ERROR_TAIL_SIZE,
+    _pipe,
+    decode_frames,
+    encode_rendition,
+)
+
+
+async def _chunks(stream: bytes, chunk_size: int = 1024):
+    for start in range(0, len(stream), chunk_size):
+        await asyncio.sleep(0)
+        yield stream[start : start + chunk_size]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("channels", (1, 2))
+async def test_decode_frames(channels):
+    samples = np.random.randint(-(2 ** 15), 2 ** 15, 8_000 * channels)
+    audio = AudioSegment(
+        data=samples.astype("<i2").tobytes(),
+        sample_width=2,
+        frame_rate=8_000,
+        channels=channels,
+    )
+    stream = BytesIO()
+    audio.export(stream, format="wav")
+
+    frames = [
+        frame
+        async for frame in decode_frames(
+            _chunks(stream.getvalue()), 8_000, channels, 3_000
+        )
+    ]
+    assert [len(frame) for frame in frames] == [3_000, 3_000, 2_000]
+    np.testing.assert_allclose(
+        np.concatenate(frames),
+        samples.reshape(-1, channels) / 2 ** 15,
+        atol=1e-6,
+    )
+
+
+@pytest.mark.asyncio
+async def test_decode_frames_error():
+    with pytest.raises(RuntimeError):
+        async for _ in decode_frames(
+            _chunks(b"not audio" * 100), 8_000, 2, 10
+        ):
+            pass
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "rendition_format, magic",
+    (
+        (RenditionFormat.Mp3, (b"ID3", b"\xff\xfb")),
+        (RenditionFormat.Opus, b"OggS"),
+    ),
+)
+async def test_encode_rendition(rendition_format, magic):
+    samples = np.random.randint(-(2 ** 15), 2 ** 15, 2 * 44_100 * 2)
+    audio = AudioSegment(
+        data=samples.astype("<i2").tobytes(),
+        sample_width=2,
+        frame_rate=44_100,
+        channels=2,
+    )
+    stream = BytesIO()
+    audio.export(stream, format="flac")
+
+    encoded = b"".join(
+        [
+            chunk
+            async for chunk in encode_rendition(
+                _chunks(stream.getvalue()), rendition_format, 64
+            )
+        ]
+    )
+    assert encoded.startswith(magic)
+    assert len(encoded) < len(stream.getvalue())
+    decoded = AudioSegment.from_file(BytesIO(encoded))
+    assert abs(len(decoded) - 2_000) < 100
+
+
+@pytest.mark.asyncio
+async def test_pipe_noisy_errors():
+    # more log than a pipe buffers, written before any output
+    noisy = "head -c 1000000 /dev/zero >&2; cat; exit 1"
+    output = b""
+    with pytest.raises(RuntimeError) as error:
+        async for data in _pipe(
+            ["sh", "-c", noisy], _chunks(b"x" * 10_000), 4096
+        ):
+            output += data
+    assert output == b"x" * 10_000
+    assert len(str(error.value)) < ERROR_TAIL_SIZE + 100
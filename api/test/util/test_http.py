@@ -0,0 +1,49 @@
+import pytest
+
+from api.utils.http import (
+    RangeNotSatisfiable,
+    etag_matches,
+    parse_range,
+    strong_etag,
+)
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=-2000", (0, 999)),
+        ("bytes=900-5000", (900, 999)),
+        ("bytes=0-0", (0, 0)),
+        ("bytes=500-100", None),
+        ("bytes=0-1,5-6", None),
+        ("items=0-1", None),
+        ("", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize(
+    "header", ["bytes=1000-", "bytes=2000-3000", "bytes=-0"]
+)
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 1000)
+
+
+def test_etag_matches():
+    etag = strong_etag("5f0000000000000000000000")
+    assert etag == strong_etag("5f0000000000000000000000")
+    assert etag != strong_etag("5f0000000000000000000001")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
+    # If-Range compares strongly
+    assert etag_matches(etag, etag, weak=False)
+    assert not etag_matches(f"W/{etag}", etag, weak=False)
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from api.utils.peaks import PeakBuilder, build_peaks
+
+
+@pytest.mark.parametrize("channels", (1, 2))
+def test_peak_builder(channels):
+    signal = np.random.uniform(-0.5, 0.5, (10_000, channels))
+    builder = PeakBuilder(frames_per_peak=100, levels=3, factor=4)
+    # blocks not aligned to peaks
+    for start in range(0, len(signal), 777):
+        builder.push(signal[start : start + 777])
+    levels = builder.close()
+
+    assert [len(level) for level in levels] == [100, 25, 7]
+    for level, frames in zip(levels, (100, 400, 1600)):
+        peak = signal[:frames]
+        rms = np.sqrt(np.square(peak).mean())
+        expected = np.round(np.array([peak.min(), peak.max(), rms]) * 127)
+        np.testing.assert_allclose(level[0], expected, atol=1)
+    # the last peak only spans the remaining frames
+    last = signal[6 * 1600 :]
+    rms = np.sqrt(np.square(last).mean())
+    assert abs(levels[2][-1][2] - np.round(rms * 127)) <= 1
+
+
+def test_build_peaks():
+    signal = np.random.uniform(-1, 1, (44_100, 2)).astype(np.float32)
+    builder = PeakBuilder()
+    builder.push(signal[:1_000])
+    builder.push(signal[1_000:])
+    for streamed, whole in zip(builder.close(), build_peaks(signal)):
+        assert streamed.dtype == np.int8
+        np.testing.assert_array_equal(streamed, whole)
+
+    assert all(not len(level) for level in build_peaks(np.zeros((0, 2))))
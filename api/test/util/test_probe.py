@@ -0,0 +1,46 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from api.benchmark.separator import wav_header
+from api.utils.probe import PROBE_HEAD_SIZE, probe_header
+
+
+@pytest.mark.parametrize(
+    "file_format, subtype, sample_width",
+    [
+        ("WAV", "FLOAT", 4),
+        ("WAV", "PCM_16", 2),
+        ("WAV", "PCM_24", 3),
+        ("FLAC", "PCM_16", 2),
+        ("FLAC", "PCM_24", 3),
+    ],
+)
+@pytest.mark.parametrize("channels", (1, 2))
+def test_probe_header(file_format, subtype, sample_width, channels):
+    sr = 22_050
+    signal = np.zeros((3 * sr, channels), dtype=np.float32)
+    stream = BytesIO()
+    sf.write(stream, signal, sr, format=file_format, subtype=subtype)
+    data = stream.getvalue()
+
+    info = probe_header(data[:PROBE_HEAD_SIZE], len(data))
+    assert info.sample_rate == sr
+    assert info.channels == channels
+    assert info.sample_width == sample_width
+    assert info.duration == 3
+
+
+def test_probe_streamed_wav():
+    # header written before the number of frames is known
+    sr = 8_000
+    data = wav_header(0, 2, sr) + bytes(sr * 2 * 4)
+    info = probe_header(data[:PROBE_HEAD_SIZE], len(data))
+    assert info.duration == 1
+
+
+def test_probe_header_error():
+    with pytest.raises(ValueError):
+        probe_header(b"", 0)
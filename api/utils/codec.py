@@ -0,0 +1,199 @@
+from enum import Enum
+from io import BytesIO
+from typing import List, Tuple
+
+import numpy as np
+import soundfile as sf
+
+from api.config import STEM_CODEC
+
+
+class StemCodec(str, Enum):
+    Float32: str = "wav_float32"
+    Int16: str = "wav_int16"
+    Flac: str = "flac"
+
+
+DEFAULT_STEM_CODEC = StemCodec(STEM_CODEC)
+
+
+class RenditionFormat(str, Enum):
+    Mp3: str = "mp3"
+    Opus: str = "opus"
+
+
+# bitrates (kbit/s) renditions are served at, bounds the cached variants
+RENDITION_BITRATES = (32, 48, 64, 96, 128, 160, 192, 256, 320)
+DEFAULT_RENDITION_BITRATES = {
+    RenditionFormat.Mp3: 192,
+    RenditionFormat.Opus: 96,
+}
+
+# soundfile (format, subtype) of every codec
+CODEC_FORMATS = {
+    StemCodec.Float32: ("WAV", "FLOAT"),
+    StemCodec.Int16: ("WAV", "PCM_16"),
+    StemCodec.Flac: ("FLAC", "PCM_16"),
+}
+
+
+def to_codec_samples(signal: np.ndarray, codec: StemCodec) -> np.ndarray:
+    """Samples as stored by the codec, integer codecs are clipped
+        instead of wrapping around on overflow.
+    """
+    if CODEC_FORMATS[codec][1] == "FLOAT":
+        return signal.astype("<f4", copy=False)
+    return np.clip(signal, -1, 1).astype(np.float32, copy=False)
+
+
+def encode_stem(
+    signal: np.ndarray, sample_rate: int, codec: StemCodec
+) -> bytes:
+    """Encode a (frames, channels) signal in memory.
+        Args:
+            signal (np.ndarray): float samples in [-1, 1].
+            sample_rate (int): sample rate of signal.
+            codec (StemCodec): storage codec.
+        Returns:
+            stream (bytes): encoded file.
+    """
+    file_format, subtype = CODEC_FORMATS[codec]
+    with BytesIO() as stream:
+        sf.write(
+            stream,
+            to_codec_samples(signal, codec),
+            sample_rate,
+            format=file_format,
+            subtype=subtype,
+        )
+        return stream.getvalue()
+
+
+def decode_stem(stream: bytes) -> Tuple[np.ndarray, int]:
+    """Decode a file encoded with any `StemCodec`, the codec is read
+        from the file header.
+        Returns:
+            signal (np.ndarray): (frames, channels) float32 samples.
+            sample_rate (int): sample rate of signal.
+    """
+    return sf.read(BytesIO(stream), dtype="float32", always_2d=True)
+
+
+class _PatchingSink:
+    """Write only file object for soundfile, bytes are kept until taken.
+    Writes to bytes already taken are recorded as patches instead.
+    """
+
+    def __init__(self):
+        self.taken = 0
+        self.pending = bytearray()
+        self.position = 0
+        self.patches: List[Tuple[int, bytes]] = []
+
+    def write(self, data: bytes) -> int:
+        data = bytes(data)
+        written = len(data)
+        position = self.position
+        if position < self.taken:
+            cut = min(written, self.taken - position)
+            self.patches.append((position, data[:cut]))
+            data = data[cut:]
+            position += cut
+        offset = position - self.taken
+        if offset > len(self.pending):
+            self.pending.extend(bytes(offset - len(self.pending)))
+        self.pending[offset : offset + len(data)] = data
+        self.position += written
+        return written
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        end = self.taken + len(self.pending)
+        self.position = (0, self.position, end)[whence] + offset
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        if self.position < self.taken:
+            raise OSError("Bytes were already taken")
+        offset = self.position - self.taken
+        end = len(self.pending) if size < 0 else offset + size
+        data = bytes(self.pending[offset:end])
+        self.position += len(data)
+        return data
+
+    def take(self) -> bytes:
+        data = bytes(self.pending)
+        self.taken += len(data)
+        self.pending.clear()
+        return data
+
+
+class StemEncoder:
+    """Encodes a stem a few frames at a time, the encoded file is never
+    held in memory. Encoded bytes are taken as soon as they are produced,
+    bytes which the encoder rewrites once taken, e.g. the header on
+    close, are returned by `close` as patches of the stored file.
+    Writing and closing are blocking, to be run in a thread pool.
+
+        Args:
+            frames (int): frames of the stem, written frames are cut or
+                padded to it. None if unknown.
+
+        Example use:
+        >>> encoder = StemEncoder(44_100, 2, StemCodec.Flac)
+        >>> encoder.write(frames)
+        >>> stream.write(encoder.take())
+        >>> patches = encoder.close()
+        >>> stream.write(encoder.take())
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        channels: int,
+        codec: StemCodec,
+        frames: int = None,
+    ):
+        self.codec = codec
+        self.channels = channels
+        self.frames = frames
+        self.written = 0
+        self._sink = _PatchingSink()
+        file_format, subtype = CODEC_FORMATS[codec]
+        self._file = sf.SoundFile(
+            self._sink,
+            "w",
+            samplerate=sample_rate,
+            channels=channels,
+            format=file_format,
+            subtype=subtype,
+        )
+
+    def write(self, signal: np.ndarray) -> None:
+        if self.frames is not None:
+            signal = signal[: self.frames - self.written]
+        self._file.write(to_codec_samples(signal, self.codec))
+        self.written += len(signal)
+
+    def take(self, min_size: int = 0) -> bytes:
+        """Encoded bytes not taken yet, none if fewer than `min_size`."""
+        if len(self._sink.pending) < min_size:
+            return b""
+        return self._sink.take()
+
+    def close(self) -> List[Tuple[int, bytes]]:
+        """Finish the file, the remaining bytes are to be taken.
+            Returns:
+                patches (list): (offset, bytes) to overwrite in the bytes
+                    taken so far, in order.
+        """
+        if self.frames is not None and self.written < self.frames:
+            self.write(
+                np.zeros(
+                    (self.frames - self.written, self.channels), np.float32
+                )
+            )
+        self._file.close()
+        return self._sink.patches
@@ -0,0 +1,192 @@
+import asyncio
+import subprocess
+from typing import AsyncIterator, List
+
+import numpy as np
+from pydub import AudioSegment
+
+from api.utils.codec import RenditionFormat
+
+# bytes of a float32 sample decoded by ffmpeg
+DECODED_SAMPLE_WIDTH = 4
+# end of the ffmpeg log kept for errors, the rest is discarded
+ERROR_TAIL_SIZE = 4 * 1024
+# ffmpeg (encoder, container) of every rendition format
+RENDITION_ENCODERS = {
+    RenditionFormat.Mp3: ("libmp3lame", "mp3"),
+    RenditionFormat.Opus: ("libopus", "ogg"),
+}
+
+
+def _decode_command(sample_rate: int, channels: int) -> List[str]:
+    return [
+        AudioSegment.converter,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        "pipe:0",
+        "-f",
+        "f32le",
+        "-acodec",
+        "pcm_f32le",
+        "-ar",
+        str(sample_rate),
+        "-ac",
+        str(channels),
+        "pipe:1",
+    ]
+
+
+def _close(stream) -> None:
+    try:
+        stream.close()
+    except BrokenPipeError:
+        pass
+
+
+async def _feed(process: subprocess.Popen, chunks: AsyncIterator[bytes]):
+    loop = asyncio.get_event_loop()
+    try:
+        async for chunk in chunks:
+            await loop.run_in_executor(None, process.stdin.write, chunk)
+    except BrokenPipeError:
+        # ffmpeg exited early, its error is raised by the reader
+        pass
+    finally:
+        await loop.run_in_executor(None, _close, process.stdin)
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+
+
+def _drain(stream, tail_size: int = ERROR_TAIL_SIZE) -> bytes:
+    # read until EOF, a full pipe would block ffmpeg
+    tail = b""
+    for data in iter(lambda: stream.read1(tail_size), b""):
+        tail = (tail + data)[-tail_size:]
+    return tail
+
+
+async def _pipe(
+    command: List[str], chunks: AsyncIterator[bytes], read_size: int
+) -> AsyncIterator[bytes]:
+    """Run ffmpeg with chunks piped into its input, yields its output
+    `read_size` bytes at a time (less at the end).
+    """
+    loop = asyncio.get_event_loop()
+    # blocking pipes are driven from the executor, asyncio subprocesses
+    # need a child watcher which is unavailable in worker threads
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    feeder = asyncio.ensure_future(_feed(process, chunks))
+    errors = loop.run_in_executor(None, _drain, process.stderr)
+    try:
+        while True:
+            data = await loop.run_in_executor(
+                None, process.stdout.read, read_size
+            )
+            if data:
+                yield data
+            if len(data) < read_size:
+                break
+        await feeder
+        error = await errors
+        if await loop.run_in_executor(None, process.wait):
+            raise RuntimeError(f"ffmpeg failed: {error.decode().strip()}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+        feeder.cancel()
+        await loop.run_in_executor(None, process.wait)
+        # at EOF once ffmpeg exited
+        await errors
+
+
+async def decode_frames(
+    chunks: AsyncIterator[bytes],
+    sample_rate: int,
+    channels: int,
+    frame_length: int,
+) -> AsyncIterator[np.ndarray]:
+    """Decode an encoded signal while it is being read, chunks are piped
+        into ffmpeg and the decoded samples are yielded `frame_length`
+        frames at a time. Only a frame is held in memory, the first
+        frames are yielded before the whole file is read.
+
+        Args:
+            chunks (async iterator): encoded file, e.g. `chunk_gen`.
+            sample_rate (int): sample rate of the frames.
+            channels (int): channels of the frames.
+            frame_length (int): frames yielded at once.
+        Returns:
+            frames (async iterator): (frames, channels) float32 arrays.
+        Raises:
+            RuntimeError: When ffmpeg fails to decode the signal.
+    """
+    frame_width = channels * DECODED_SAMPLE_WIDTH
+    decoded = _pipe(
+        _decode_command(sample_rate, channels),
+        chunks,
+        frame_length * frame_width,
+    )
+    try:
+        async for data in decoded:
+            # a partial frame is only read at the end of the stream
+            data = data[: len(data) - len(data) % frame_width]
+            if data:
+                yield np.frombuffer(data, dtype="<f4").reshape(-1, channels)
+    finally:
+        await decoded.aclose()
+
+
+async def encode_rendition(
+    chunks: AsyncIterator[bytes],
+    rendition_format: RenditionFormat,
+    bitrate: int,
+    read_size: int = 255 * 1024,
+) -> AsyncIterator[bytes]:
+    """Transcode a stored stem to a compressed rendition while it is
+        being read, the rendition is yielded as it is encoded.
+
+        Args:
+            chunks (async iterator): stem file, e.g. `chunk_gen`.
+            rendition_format (RenditionFormat): format of the rendition.
+            bitrate (int): bitrate of the rendition in kbit/s.
+        Returns:
+            chunks (async iterator): encoded rendition.
+        Raises:
+            RuntimeError: When ffmpeg fails to transcode the stem.
+    """
+    encoder, container = RENDITION_ENCODERS[rendition_format]
+    command = [
+        AudioSegment.converter,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        "pipe:0",
+        "-vn",
+        # the same bytes every time, renditions are served with a strong
+        # ETag before they are encoded again
+        "-fflags",
+        "+bitexact",
+        "-flags:a",
+        "+bitexact",
+        "-c:a",
+        encoder,
+        "-b:a",
+        f"{bitrate}k",
+        "-f",
+        container,
+        "pipe:1",
+    ]
+    encoded = _pipe(command, chunks, read_size)
+    try:
+        async for data in encoded:
+            yield data
+    finally:
+        await encoded.aclose()
@@ -0,0 +1,97 @@
+import hashlib
+import re
+from typing import Optional, Tuple
+
+from api.utils.codec import RenditionFormat, StemCodec
+
+# media type of the stem files of every codec
+CODEC_MEDIA_TYPES = {
+    StemCodec.Float32: "audio/wav",
+    StemCodec.Int16: "audio/wav",
+    StemCodec.Flac: "audio/flac",
+}
+RENDITION_MEDIA_TYPES = {
+    RenditionFormat.Mp3: "audio/mpeg",
+    RenditionFormat.Opus: "audio/ogg",
+}
+
+_BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Byte range requested by a `Range` header.
+        Only single ranges are served, the whole content is sent for
+        other (multiple or malformed) ranges as allowed by RFC 7233.
+
+        Args:
+            header (str): value of the `Range` header.
+            size (int): size of the content in bytes.
+        Returns:
+            byte_range (tuple): first and last byte included, None if
+                the whole content is to be sent.
+        Raises:
+            RangeNotSatisfiable: When the range starts after the content.
+
+        Example use:
+        >>> parse_range("bytes=0-99", 1000)
+        (0, 99)
+        >>> parse_range("bytes=-100", 1000)
+        (900, 999)
+    """
+    match = _BYTE_RANGE.match(header.strip().replace(" ", ""))
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range, the last bytes
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    last = size - 1 if not last else min(int(last), size - 1)
+    if last < first and last != size - 1:
+        # invalid range, e.g. bytes=500-100
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable(header)
+    return first, last
+
+
+def content_range(first: int, last: int, size: int) -> str:
+    return f"bytes {first}-{last}/{size}"
+
+
+def strong_etag(*parts) -> str:
+    """Strong entity tag of a representation identified by `parts`,
+        e.g. the id of an immutable file.
+
+        Example use:
+        >>> strong_etag(file_id)
+    """
+    digest = hashlib.sha1("/".join(map(str, parts)).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(header: Optional[str], etag: str, weak=True) -> bool:
+    """Whether the `If-None-Match` (weak comparison) or `If-Range`
+        (strong comparison, `weak=False`) header matches the entity tag.
+    """
+    if not header:
+        return False
+    if weak and header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            if not weak:
+                continue
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
@@ -0,0 +1,133 @@
+from typing import List
+
+import numpy as np
+
+# frames summarised by a peak at the finest level
+PEAK_FRAMES = 256
+# each level summarises this many peaks of the level below
+PEAK_LEVEL_FACTOR = 4
+# 256 frames (~6 ms at 44.1kHz) up to 262144 frames (~6 s) per peak
+PEAK_LEVELS = 6
+# min, max and RMS values of a peak
+PEAK_VALUES = 3
+
+
+def quantize_peaks(minimum, maximum, sum_squares, counts) -> np.ndarray:
+    """Peaks as stored, min, max and RMS of every peak scaled from
+    [-1, 1] to int8 values.
+    """
+    rms = np.sqrt(sum_squares / np.maximum(counts, 1))
+    peaks = np.stack([minimum, maximum, rms], axis=1)
+    return np.clip(np.round(peaks * 127), -127, 127).astype(np.int8)
+
+
+class PeakBuilder:
+    """Min/max/RMS peaks of a signal at several zoom levels, built while
+    the signal is written. Channels are mixed, the peak spans all of
+    them. Only the partial peak at the end of a block is buffered, the
+    coarser levels are reduced from the finest one on `close`.
+
+        Example use:
+        >>>builder = PeakBuilder()
+        >>>for frames in blocks:
+        >>>    builder.push(frames)
+        >>>levels = builder.close()
+    """
+
+    def __init__(
+        self,
+        frames_per_peak: int = PEAK_FRAMES,
+        levels: int = PEAK_LEVELS,
+        factor: int = PEAK_LEVEL_FACTOR,
+    ):
+        self.frames_per_peak = frames_per_peak
+        self.levels = levels
+        self.factor = factor
+        # per frame min, max and sum of squares of the partial peak
+        self._remainder = np.zeros((0, 3), dtype=np.float32)
+        self._blocks: List[np.ndarray] = []
+
+    def push(self, frames: np.ndarray) -> None:
+        """Add (frames, channels) or (frames,) samples."""
+        frames = np.asarray(frames, dtype=np.float32)
+        if frames.ndim == 1:
+            frames = frames[:, None]
+        if not len(frames):
+            return
+        mixed = np.stack(
+            [
+                frames.min(axis=1),
+                frames.max(axis=1),
+                np.square(frames).mean(axis=1),
+            ],
+            axis=1,
+        )
+        mixed = np.concatenate([self._remainder, mixed])
+        length = len(mixed) - len(mixed) % self.frames_per_peak
+        self._remainder = mixed[length:]
+        if length:
+            self._blocks.append(
+                self._reduce(
+                    mixed[:length].reshape(-1, self.frames_per_peak, 3),
+                    self.frames_per_peak,
+                )
+            )
+
+    @staticmethod
+    def _reduce(groups: np.ndarray, count: int) -> np.ndarray:
+        # (peaks, min, max, sum of squares, frames)
+        return np.stack(
+            [
+                groups[..., 0].min(axis=1),
+                groups[..., 1].max(axis=1),
+                groups[..., 2].astype(np.float64).sum(axis=1),
+                np.full(len(groups), count, dtype=np.float64),
+            ],
+            axis=1,
+        )
+
+    def _coarsen(self, level: np.ndarray) -> np.ndarray:
+        padding = -len(level) % self.factor
+        if padding:
+            # neutral peaks, they span no frame
+            empty = np.array([[np.inf, -np.inf, 0, 0]] * padding)
+            level = np.concatenate([level, empty])
+        groups = level.reshape(-1, self.factor, 4)
+        return np.stack(
+            [
+                groups[..., 0].min(axis=1),
+                groups[..., 1].max(axis=1),
+                groups[..., 2].sum(axis=1),
+                groups[..., 3].sum(axis=1),
+            ],
+            axis=1,
+        )
+
+    def close(self) -> List[np.ndarray]:
+        """Peaks of every level, finest first.
+            Returns:
+                levels (list): (peaks, 3) int8 arrays of min, max and RMS.
+        """
+        blocks = self._blocks
+        if len(self._remainder):
+            blocks.append(
+                self._reduce(self._remainder[None], len(self._remainder))
+            )
+        self._blocks, self._remainder = [], self._remainder[:0]
+        level = np.concatenate(blocks) if blocks else np.zeros((0, 4))
+        levels = []
+        for _ in range(self.levels):
+            levels.append(
+                quantize_peaks(
+                    level[:, 0], level[:, 1], level[:, 2], level[:, 3]
+                )
+            )
+            level = self._coarsen(level)
+        return levels
+
+
+def build_peaks(frames: np.ndarray) -> List[np.ndarray]:
+    """Peaks of every level of a whole signal, see `PeakBuilder`."""
+    builder = PeakBuilder()
+    builder.push(frames)
+    return builder.close()
@@ -0,0 +1,117 @@
+import struct
+from io import BytesIO
+from typing import BinaryIO, NamedTuple, Optional
+
+from pydub.utils import mediainfo_json
+
+# bytes read from the start of a file to find its format headers
+PROBE_HEAD_SIZE = 64 * 1024
+
+
+class SignalInfo(NamedTuple):
+    sample_rate: int
+    channels: int
+    sample_width: int
+    duration: float
+
+
+def _probe_wav(head: bytes, size: int) -> Optional[SignalInfo]:
+    if head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        return None
+    offset = 12
+    fmt = None
+    while offset + 8 <= len(head):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", head, offset)
+        body = offset + 8
+        if chunk_id == b"fmt " and body + 16 <= len(head):
+            fmt = struct.unpack_from("<HHIIHH", head, body)
+        elif chunk_id == b"data" and fmt is not None:
+            _, channels, sample_rate, _, block_align, bits = fmt
+            if not (channels and sample_rate and block_align):
+                return None
+            # streamed files declare no size, the data spans the file
+            if chunk_size in (0, 0xFFFFFFFF) or body + chunk_size > size:
+                chunk_size = size - body
+            frames = chunk_size // block_align
+            return SignalInfo(
+                sample_rate, channels, (bits + 7) // 8, frames / sample_rate
+            )
+        offset = body + chunk_size + chunk_size % 2
+    return None
+
+
+def _probe_flac(head: bytes) -> Optional[SignalInfo]:
+    # STREAMINFO is the first metadata block, right after the marker
+    if head[:4] != b"fLaC" or len(head) < 42 or head[4] & 0x7F != 0:
+        return None
+    # sample rate (20 bits), channels (3), bits per sample (5), frames (36)
+    info = int.from_bytes(head[18:26], "big")
+    sample_rate = info >> 44
+    channels = (info >> 41 & 0x7) + 1
+    bits = (info >> 36 & 0x1F) + 1
+    frames = info & (1 << 36) - 1
+    if not (sample_rate and frames):
+        return None
+    return SignalInfo(
+        sample_rate, channels, (bits + 7) // 8, frames / sample_rate
+    )
+
+
+def _probe_stream(info: dict, size: int) -> Optional[SignalInfo]:
+    streams = [
+        s for s in info.get("streams", []) if s["codec_type"] == "audio"
+    ]
+    if not streams:
+        return None
+    stream = streams[0]
+    file_format = info.get("format", {})
+    duration = stream.get("duration") or file_format.get("duration")
+    bit_rate = file_format.get("bit_rate") or stream.get("bit_rate")
+    if bit_rate:
+        # the head alone reports its own duration
+        duration = size * 8 / float(bit_rate)
+    if not duration:
+        return None
+    bits = int(stream.get("bits_per_sample") or 16)
+    return SignalInfo(
+        int(stream["sample_rate"]),
+        int(stream["channels"]),
+        min(max(bits // 8, 1), 4),
+        float(duration),
+    )
+
+
+def probe_header(
+    head: bytes, size: int, signal_file: BinaryIO = None
+) -> SignalInfo:
+    """Read the metadata of a signal from its format headers, no
+        sample is decoded. WAV and FLAC headers are parsed directly,
+        other formats are probed by ffprobe from the head of the file
+        and from the whole file if the head is not enough.
+
+        Args:
+            head (bytes): first `PROBE_HEAD_SIZE` bytes of the file.
+            size (int): size of the whole file in bytes.
+            signal_file (file): whole file, needed by formats whose
+                headers are at the end.
+        Returns:
+            info (SignalInfo): sample rate, channels, sample width and
+                duration in seconds.
+        Raises:
+            ValueError: When the file is not a supported signal.
+
+        Example use:
+        >>> with open("song.wav", "rb") as f:
+        ...     info = probe_header(f.read(PROBE_HEAD_SIZE), size)
+    """
+    info = _probe_wav(head, size) or _probe_flac(head)
+    if info is not None:
+        return info
+    if head:
+        info = _probe_stream(mediainfo_json(BytesIO(head)), size)
+        if info is None and signal_file is not None and size > len(head):
+            signal_file.seek(0)
+            info = _probe_stream(mediainfo_json(signal_file), size)
+    if info is None:
+        raise ValueError("Could not read signal metadata")
+    return info
@@ -1,53 +1,66 @@
-from typing import Dict, Tuple
+from io import BytesIO
+from typing import BinaryIO
 from pathlib import Path
-from tempfile import NamedTemporaryFile, TemporaryFile
 
-import librosa
 import numpy as np
 from pydub import AudioSegment
 from fastapi import UploadFile
 
 from api.schemas import SignalMetadata
-from api.separator import Separator, SignalType
-
-
-def pydub_to_np(audio: AudioSegment) -> Tuple[np.ndarray, int]:
-    array = np.array(audio.get_array_of_samples(), dtype=np.float32).reshape(
-        (-1, audio.channels)
-    ).T / (1 << (8 * audio.sample_width))
-    signal = np.transpose(array, (1, 0))
+from api.separator import SignalType
+from api.utils.codec import decode_stem
+from api.utils.probe import probe_header
+
+
+# little endian PCM sample types by sample width, 24 bit is widened
+PCM_DTYPES = {1: np.int8, 2: np.dtype("<i2"), 4: np.dtype("<i4")}
+
+
+def pcm_to_np(data: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """Convert signed PCM samples to float32 in [-1, 1).
+        The samples are viewed in place, only the float32 array
+        is allocated and it is scaled in place.
+
+        Args:
+            data (bytes, memoryview): interleaved PCM samples.
+            sample_width (int): bytes per sample (1, 2, 3 or 4).
+            channels (int): number of channels.
+        Returns:
+            signal (np.ndarray): (frames, channels) float32 samples.
+    """
+    if sample_width == 3:
+        # 24 bit samples as the most significant bytes of 32 bit ones
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        widened = np.zeros((len(raw), 4), dtype=np.uint8)
+        widened[:, 1:] = raw
+        samples = widened.view(PCM_DTYPES[4])
+        sample_width = 4
+    else:
+        samples = np.frombuffer(data, dtype=PCM_DTYPES[sample_width])
+    signal = samples.reshape(-1, channels).astype(np.float32)
+    signal *= 1 / (1 << (8 * sample_width - 1))
     return signal
 
 
-def read_audio(stream: bytes, extension: str = "") -> np.ndarray:
-    with TemporaryFile() as temp_file:
-        temp_file.write(stream)
-        temp_file.seek(0)
-        signal = AudioSegment.from_file(temp_file)
-
-    signal = pydub_to_np(signal)
-    return signal
+def pydub_to_np(audio: AudioSegment) -> np.ndarray:
+    return pcm_to_np(audio.raw_data, audio.sample_width, audio.channels)
 
 
-def np_to_stream(signal: np.ndarray, sample_rate=44_100) -> bytes:
-    with NamedTemporaryFile() as temp_file:
-        filename = temp_file.name
-        librosa.output.write_wav(
-            filename, np.asfortranarray(signal), sr=sample_rate
-        )
-        for signal_bytes in temp_file.readlines():
-            yield signal_bytes
+def read_segment(stream: bytes, extension: str = "") -> AudioSegment:
+    # WAV is read without ffmpeg, which probes any other format
+    file_format = "wav" if extension.lower() == "wav" else None
+    segment = AudioSegment.from_file(BytesIO(stream), format=file_format)
+    return segment
 
 
-def split_audio(
-    separator: Separator,
-    stream: bytes,
-    extension: str,
-    signal_type: SignalType,
-) -> Dict[str, np.ndarray]:
-    signal = read_audio(stream, extension)
-    stems = separator.separate(signal)
-    return stems
+def read_audio(stream: bytes, extension: str = "") -> np.ndarray:
+    try:
+        # stems and other WAV / FLAC files are decoded without ffmpeg
+        signal, _ = decode_stem(stream)
+    except RuntimeError:
+        signal = read_segment(stream, extension)
+        signal = pydub_to_np(signal)
+    return signal
 
 
 def process_signal(
@@ -76,6 +89,31 @@ def process_signal(
     return signal_metadata
 
 
+def probe_signal(
+    head: bytes,
+    size: int,
+    filename: str,
+    signal_type: SignalType,
+    project_name="",
+    signal_file: BinaryIO = None,
+) -> SignalMetadata:
+    """Metadata of an uploaded signal read from its headers only, the
+    signal is decoded and validated by the separation worker. Blocking,
+    to be run in a thread pool. See `probe_header`.
+    """
+    info = probe_header(head, size, signal_file)
+    return SignalMetadata(
+        extension=Path(filename).suffix.replace(".", ""),
+        sample_rate=info.sample_rate,
+        duration=info.duration,
+        channels=info.channels,
+        sample_width=info.sample_width,
+        signal_type=signal_type,
+        filename=filename,
+        projectname=project_name,
+    )
+
+
 def file_to_segment(signal_file: UploadFile):
     filename = signal_file.filename
     extension = Path(filename).suffix.replace(".", "")
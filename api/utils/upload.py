@@ -0,0 +1,102 @@
+from typing import AsyncIterator, List, Tuple
+
+from fastapi import Request
+from multipart.multipart import MultipartParser, parse_options_header
+
+
+class MultipartFileStream:
+    """Reads a file field of a multipart request while the request
+    body is received, without spooling the upload to disk first.
+    Parts before the field are skipped, the body is not read past
+    the end of the field.
+
+        Example use:
+        >>>upload = MultipartFileStream(request, "signal_file")
+        >>>if await upload.open():
+        >>>    async for chunk in upload:
+        >>>        ...
+    """
+
+    def __init__(self, request: Request, field_name: str):
+        self.request = request
+        self.field_name = field_name
+        self.filename: str = None
+        self.content_type: str = None
+        self._events = self._parse()
+
+    async def _parse(self) -> AsyncIterator[Tuple[str, bytes]]:
+        content_type, params = parse_options_header(
+            self.request.headers.get("Content-Type", "")
+        )
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            return
+        events: List[Tuple[str, bytes]] = []
+
+        def _data(kind):
+            def callback(data: bytes, start: int, end: int):
+                events.append((kind, data[start:end]))
+
+            return callback
+
+        def _notify(kind):
+            return lambda: events.append((kind, b""))
+
+        parser = MultipartParser(
+            params[b"boundary"],
+            {
+                "on_part_begin": _notify("part_begin"),
+                "on_part_data": _data("part_data"),
+                "on_part_end": _notify("part_end"),
+                "on_header_field": _data("header_field"),
+                "on_header_value": _data("header_value"),
+                "on_header_end": _notify("header_end"),
+                "on_headers_finished": _notify("headers_finished"),
+            },
+        )
+        async for chunk in self.request.stream():
+            if chunk:
+                parser.write(chunk)
+            for event in events:
+                yield event
+            events.clear()
+        parser.finalize()
+        for event in events:
+            yield event
+
+    async def open(self) -> bool:
+        """Skip to the data of the field.
+            Returns:
+                found (bool): False if the request has no such file field.
+        """
+        headers = {}
+        field, value = b"", b""
+        async for kind, data in self._events:
+            if kind == "part_begin":
+                headers = {}
+            elif kind == "header_field":
+                field += data
+            elif kind == "header_value":
+                value += data
+            elif kind == "header_end":
+                headers[field.lower()] = value
+                field, value = b"", b""
+            elif kind == "headers_finished":
+                _, options = parse_options_header(
+                    headers.get(b"content-disposition", b"")
+                )
+                name = options.get(b"name", b"").decode("latin-1")
+                if name == self.field_name and b"filename" in options:
+                    self.filename = options[b"filename"].decode("latin-1")
+                    self.content_type = headers.get(
+                        b"content-type", b""
+                    ).decode("latin-1")
+                    return True
+        return False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for kind, data in self._events:
+            if kind == "part_data":
+                yield data
+            elif kind == "part_end":
+                break
+        await self._events.aclose()
@@ -0,0 +1,143 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from api.separator import Separator
+
+
+class InferenceScheduler:
+    """Collects chunks submitted by concurrent jobs sharing a separator
+    and separates them with one batched forward pass. A batch is run
+    once `max_batch_size` chunks are pending or `max_wait` seconds
+    passed since the first pending chunk arrived.
+
+        Example use:
+        >>>scheduler = InferenceScheduler(separator, 8, 0.05)
+        >>>prediction = scheduler.predict(chunk)  # blocks until done
+    """
+
+    def __init__(
+        self, separator: Separator, max_batch_size: int, max_wait: float
+    ):
+        self.separator = separator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: "queue.Queue[Tuple[np.ndarray, Future]]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.chunks = 0
+
+    def _start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="inference-scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, chunk: np.ndarray) -> Future:
+        future = Future()
+        # chunks are never queued behind the sentinel of `close`
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Scheduler is closed")
+            self._start()
+            self._queue.put((chunk, future))
+        return future
+
+    def predict(self, chunk: np.ndarray) -> Dict[str, np.ndarray]:
+        return self.submit(chunk).result()
+
+    def _collect(self) -> List[Tuple[np.ndarray, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while batch[-1] is not None and len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is None
+            batch = [item for item in batch if item is not None]
+            if batch:
+                self._separate(batch)
+            if stop:
+                return
+
+    def _separate(self, batch: List[Tuple[np.ndarray, Future]]) -> None:
+        chunks, futures = zip(*batch)
+        try:
+            predictions = self.separator.separate_batch(list(chunks))
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.chunks += len(chunks)
+        for future, prediction in zip(futures, predictions):
+            future.set_result(prediction)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+        # chunks left over by a failed scheduler thread
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                item[1].set_exception(RuntimeError("Scheduler is closed"))
+
+
+class ScheduledSeparator(Separator):
+    """Separator routing every chunk of a job through a shared
+    `InferenceScheduler`, so chunks of concurrent jobs using the
+    same model are batched together.
+    """
+
+    def __init__(self, separator: Separator, scheduler: InferenceScheduler):
+        self._separator = separator
+        self.scheduler = scheduler
+
+    @property
+    def memory_footprint(self) -> int:
+        return self._separator.memory_footprint
+
+    def separate(
+        self, waveform: np.ndarray, sample_rate=44_100
+    ) -> Dict[str, np.ndarray]:
+        return self._separator.separate(
+            waveform, sample_rate, predict=self.scheduler.predict
+        )
+
+    def stream(self, sample_rate=44_100):
+        return self._separator.stream(
+            sample_rate, predict=self.scheduler.predict
+        )
+
+    def warm_up(self) -> None:
+        self._separator.warm_up()
+
+    def close(self) -> None:
+        self.scheduler.close()
+        self._separator.close()
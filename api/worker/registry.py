@@ -0,0 +1,153 @@
+import gc
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from api.config import (
+    SEPARATOR_CHUNK_MINUTES,
+    SEPARATOR_FILE_BATCH_SIZE,
+    SEPARATOR_MEMORY_BUDGET_MB,
+    SEPARATOR_PROCESSES,
+)
+from api.separator import Separator, SignalType, SpleeterSeparator
+
+
+def load_separator(signal_type: SignalType, stems: int) -> Separator:
+    if signal_type == SignalType.Music:
+        return SpleeterSeparator(
+            stems=stems,
+            chunk_size=SEPARATOR_CHUNK_MINUTES or None,
+            batch_size=SEPARATOR_FILE_BATCH_SIZE or None,
+            memory_budget=SEPARATOR_MEMORY_BUDGET_MB * 1024 ** 2,
+            processes=SEPARATOR_PROCESSES,
+        )
+    raise ValueError(f"No separator available for {signal_type}")
+
+
+def parse_models(models: str) -> List[Tuple[SignalType, int]]:
+    """Parse comma separated `signal_type:stems` pairs,
+        e.g. "Music:2,Music:4".
+    """
+    keys = []
+    for model in filter(None, map(str.strip, models.split(","))):
+        signal_type, stems = model.split(":")
+        keys.append((SignalType(signal_type), int(stems)))
+    return keys
+
+
+class SeparatorRegistry:
+    """Per process cache of loaded separators keyed by signal type
+    and stems. Least recently used separators are evicted once the
+    estimated memory of the loaded separators exceeds `max_bytes`.
+    The most recently requested separator is never evicted. Jobs hold
+    separators through `lease`, an evicted separator is only closed
+    once no job holds it anymore.
+
+        Example use:
+        >>>registry = SeparatorRegistry(max_bytes=2 * 1024 ** 3)
+        >>>registry.preload("Music:2,Music:4")
+        >>>with registry.lease(SignalType.Music, 2) as separator:
+        >>>    separator.separate(waveform)
+    """
+
+    def __init__(self, max_bytes: int, loader=load_separator):
+        self.max_bytes = max_bytes
+        self._loader = loader
+        self._separators: Dict[
+            Tuple[SignalType, int], Separator
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+        # jobs holding a separator, evicted separators still held
+        self._leases = Counter()
+        self._retired = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(s.memory_footprint for s in self._separators.values())
+
+    def _get(self, key: Tuple[SignalType, int]) -> Separator:
+        separator = self._separators.get(key)
+        if separator is not None:
+            self.hits += 1
+            self._separators.move_to_end(key)
+            return separator
+
+        self.misses += 1
+        separator = self._loader(*key)
+        self._separators[key] = separator
+        self._evict()
+        return separator
+
+    def get(self, signal_type: SignalType, stems: int) -> Separator:
+        """Separator of the signal type, it may be closed by a later
+        eviction while in use, jobs use `lease` instead.
+        """
+        with self._lock:
+            return self._get((SignalType(signal_type), stems))
+
+    @contextmanager
+    def lease(
+        self, signal_type: SignalType, stems: int
+    ) -> Iterator[Separator]:
+        """Separator of the signal type, held until the context exits."""
+        with self._lock:
+            separator = self._get((SignalType(signal_type), stems))
+            self._leases[separator] += 1
+        try:
+            yield separator
+        finally:
+            with self._lock:
+                self._leases[separator] -= 1
+                if not self._leases[separator]:
+                    del self._leases[separator]
+                retired = (
+                    separator not in self._leases
+                    and separator in self._retired
+                )
+                if retired:
+                    self._retired.remove(separator)
+                    separator.close()
+            if retired:
+                gc.collect()
+
+    def _evict(self) -> None:
+        evicted = False
+        while len(self._separators) > 1 and self.memory_bytes > self.max_bytes:
+            _, separator = self._separators.popitem(last=False)
+            if self._leases[separator]:
+                # closed by the last job holding it
+                self._retired.append(separator)
+            else:
+                separator.close()
+            self.evictions += 1
+            evicted = True
+        if evicted:
+            # release tensorflow graphs of evicted models
+            gc.collect()
+
+    def preload(self, models: str) -> None:
+        for signal_type, stems in parse_models(models):
+            self.get(signal_type, stems).warm_up()
+
+    def clear(self) -> None:
+        with self._lock:
+            for separator in self._separators.values():
+                separator.close()
+            self._separators.clear()
+        gc.collect()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_bytes": self.memory_bytes,
+            "loaded": [
+                f"{signal_type.value}:{stems}"
+                for signal_type, stems in self._separators
+            ],
+        }
@@ -1,45 +1,258 @@
 import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Coroutine, Dict, List
+
+import numpy as np
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from celery.signals import worker_init, worker_process_init, worker_ready
+from celery.utils.log import get_task_logger
 from motor.motor_asyncio import AsyncIOMotorClient
 
-from api.db import get_database, connect_to_mongo
+from api.db import get_database, connect_to_mongo, create_indexes
+from api.config import (
+    MONGODB_URL,
+    SEPARATOR_CACHE_SIZE_MB,
+    SEPARATOR_PRELOAD,
+    SEPARATOR_BATCH_SIZE,
+    SEPARATOR_BATCH_WAIT_MS,
+    RENDITION_PRESETS,
+    RENDITION_CACHE_SIZE_MB,
+)
 from api.worker import app, TaskState
-from api.schemas import Signal, SeparatedSignal, SignalState, User
-from api.utils.signal import split_audio
+from api.schemas import (
+    Signal,
+    SeparatedSignal,
+    SignalState,
+    SignalContentFollower,
+    User,
+)
+from api.utils.ffmpeg import decode_frames
+from api.utils.codec import DEFAULT_STEM_CODEC
+from api.utils.peaks import PeakBuilder
 from api.services import (
-    create_stem,
-    read_signal_file,
-    save_stem_file,
-    update_signal,
+    complete_signal,
+    read_signal_file_by_id,
     get_stem_id,
+    read_one_signal,
     update_signal_state,
+    StemWriter,
+    complete_content,
+    release_content,
+    link_content,
+    parse_renditions,
+    create_renditions,
+    evict_renditions,
+    save_peaks,
+    delete_peaks,
+    release_files,
+)
+from api.separator import SignalType
+from api.worker.registry import SeparatorRegistry, load_separator
+from api.worker.batching import InferenceScheduler, ScheduledSeparator
+
+logger = get_task_logger(__name__)
+
+# duration of the decoded frames pushed to the separator
+STREAM_FRAME_SECONDS = 10
+
+
+def load_scheduled_separator(signal_type: SignalType, stems: int):
+    """Jobs running concurrently in this process (threads pool) share
+    the model through a scheduler batching their chunks together.
+    """
+    separator = load_separator(signal_type, stems)
+    if SEPARATOR_BATCH_SIZE <= 1:
+        return separator
+    scheduler = InferenceScheduler(
+        separator, SEPARATOR_BATCH_SIZE, SEPARATOR_BATCH_WAIT_MS / 1000
+    )
+    return ScheduledSeparator(separator, scheduler)
+
+
+# loaded models stay resident for the lifetime of the worker process
+separator_registry = SeparatorRegistry(
+    SEPARATOR_CACHE_SIZE_MB * 1024 ** 2, loader=load_scheduled_separator
 )
-from api.separator import SignalType, SpleeterSeparator
+_thread_context = threading.local()
+
+
+@worker_process_init.connect
+def preload_separators(**kwargs):
+    separator_registry.preload(SEPARATOR_PRELOAD)
+
+
+@worker_ready.connect
+def preload_pool_separators(sender=None, **kwargs):
+    """Pools other than prefork (threads, solo) run the tasks in the
+    worker process itself, which gets no `worker_process_init`.
+    """
+    if not isinstance(getattr(sender, "pool", None), PreforkPool):
+        preload_separators()
 
 
-def get_separator(signal_type: SignalType, stems: int):
-    if signal_type == SignalType.Music:
-        separator = SpleeterSeparator(stems=stems)
-    return separator
+@worker_init.connect
+def init_indexes(**kwargs):
+    """Create the indexes once, before the worker processes start."""
+    loop = asyncio.new_event_loop()
+    client = AsyncIOMotorClient(MONGODB_URL, io_loop=loop)
+    try:
+        loop.run_until_complete(create_indexes(client))
+    except Exception:
+        logger.exception("Could not create indexes")
+    finally:
+        client.close()
+        loop.close()
+
+
+@contextmanager
+def lease_separator(signal_type: SignalType, stems: int):
+    with separator_registry.lease(signal_type, stems) as separator:
+        logger.info("Separator cache: %s", separator_registry.stats())
+        yield separator
 
 
 async def _update_state(
-    self,
-    db: AsyncIOMotorClient,
-    signal_id: str,
-    username: str,
-    state: TaskState,
+    db: AsyncIOMotorClient, signal_id: str, username: str, state: TaskState,
 ):
-    self.update_state(state="PROGRESS", meta={"state": state})
     signal_state = SignalState(signal_id=signal_id, signal_state=state)
     await update_signal_state(db, signal_state, username)
 
 
+def _worker_context():
+    """Event loop and mongo client of the current worker thread.
+    Tasks of a threads pool run concurrently, each thread needs its
+    own loop and a client bound to it.
+    """
+    if not hasattr(_thread_context, "loop"):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        _thread_context.loop = loop
+        _thread_context.db = AsyncIOMotorClient(MONGODB_URL, io_loop=loop)
+    return _thread_context.loop, _thread_context.db
+
+
 @app.task(bind=True)
 def separate(self, signal: dict, user: dict, stems: int = 2):
-    loop = asyncio.get_event_loop()
+    loop, db = _worker_context()
     return loop.run_until_complete(
-        perform_separation(self, signal, user, stems)
+        perform_separation(self, signal, user, stems, db)
+    )
+
+
+@app.task(bind=True)
+def render(self, stem_file_ids: List[str]):
+    loop, db = _worker_context()
+    return loop.run_until_complete(perform_rendition(stem_file_ids, db))
+
+
+async def perform_rendition(stem_file_ids: List[str], db=None):
+    """Cache the compressed renditions of separated stems, so that their
+    first play is not delayed by transcoding, then evict the renditions
+    served least recently beyond the cache size.
+    """
+    if db is None:
+        await connect_to_mongo()
+        db = await get_database()
+    await create_renditions(
+        db, stem_file_ids, parse_renditions(RENDITION_PRESETS)
+    )
+    evicted = await evict_renditions(db, RENDITION_CACHE_SIZE_MB * 1024 ** 2)
+    logger.info("Evicted %d renditions", evicted)
+
+
+async def _gather_all(*aws) -> Coroutine[list, None, None]:
+    """Like `asyncio.gather` but the first error is raised once every
+    awaitable is done, no write is pending when the stems are discarded.
+    """
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+async def _write_stems(
+    db: AsyncIOMotorClient,
+    writers: Dict[str, StemWriter],
+    peaks: Dict[str, PeakBuilder],
+    separated: Dict[str, np.ndarray],
+    signal: Signal,
+):
+    loop = asyncio.get_event_loop()
+    for stem_name in separated:
+        if stem_name not in writers:
+            # frames are counted while decoding
+            writers[stem_name] = StemWriter(
+                db,
+                get_stem_id(stem_name, signal.signal_id),
+                None,
+                signal.signal_metadata.sample_rate,
+                DEFAULT_STEM_CODEC,
+            )
+            peaks[stem_name] = PeakBuilder()
+    # stems are encoded in the thread pool and uploaded concurrently,
+    # their waveform peaks are built on the way
+    await _gather_all(
+        *(
+            writers[stem_name].write(frames)
+            for stem_name, frames in separated.items()
+        ),
+        *(
+            loop.run_in_executor(None, peaks[stem_name].push, frames)
+            for stem_name, frames in separated.items()
+        ),
+    )
+
+
+async def _complete_followers(
+    db: AsyncIOMotorClient,
+    signal: Signal,
+    stems: int,
+    stem_ids: Dict[str, str],
+):
+    """Copy the stems to the identical signals posted while separating."""
+    followers = await complete_content(
+        db, signal.content_hash, stems, stem_ids, DEFAULT_STEM_CODEC
+    )
+    for follower in followers:
+        follower_signal = await read_one_signal(
+            db, follower.signal_id, follower.username
+        )
+        if follower_signal is None:
+            continue
+        linked = await link_content(
+            db,
+            stem_ids,
+            follower_signal,
+            follower.username,
+            DEFAULT_STEM_CODEC,
+            signal_state=TaskState.Complete,
+        )
+        if not linked:
+            await _update_state(
+                db, follower.signal_id, follower.username, TaskState.Aborted
+            )
+
+
+async def _abort_followers(
+    db: AsyncIOMotorClient, followers: List[SignalContentFollower]
+):
+    for follower in followers:
+        signal_state = SignalState(
+            signal_id=follower.signal_id, signal_state=TaskState.Aborted
+        )
+        await update_signal_state(db, signal_state, follower.username)
+
+
+async def _release_content(db: AsyncIOMotorClient, signal: Signal, stems: int):
+    """Release the claim of the signal on its content, the signals
+    waiting for its separation are aborted.
+    """
+    followers = await release_content(
+        db, signal.content_hash, stems, signal.signal_id
     )
+    await _abort_followers(db, followers)
 
 
 async def perform_separation(
@@ -51,57 +264,136 @@ async def perform_separation(
         db = await get_database()
 
     signal = Signal(**signal)
-    signal_id = signal.signal_id
-
     user = User(**user)
 
-    signal_type = signal.signal_metadata.signal_type
-    separator = get_separator(signal_type, stems)
+    try:
+        stem_ids = await _separate_signal(db, signal, user, stems)
+    except Exception:
+        # e.g. uploads whose headers were fine but which fail to decode
+        await _update_state(
+            db, signal.signal_id, user.username, TaskState.Aborted
+        )
+        if signal.content_hash:
+            # the same content would fail the same way
+            await _release_content(db, signal, stems)
+        raise
+    if stem_ids is None:
+        # the signal was deleted, it has no stems to share
+        if signal.content_hash:
+            await _release_content(db, signal, stems)
+        return
+    if RENDITION_PRESETS:
+        render.delay(list(stem_ids.values()))
+    if signal.content_hash:
+        await _complete_followers(db, signal, stems, stem_ids)
 
-    # TODO: use generators, mem expensive
-    stream = await read_signal_file(
-        db, signal.signal_metadata.filename, stream=False
-    )
-    await _update_state(
-        self, db, signal_id, user.username, TaskState.Separating
-    )
 
-    separated_signals = split_audio(
-        separator, stream, signal.signal_metadata.extension, signal_type,
+async def _stream_stems(
+    db: AsyncIOMotorClient,
+    separator,
+    chunks,
+    signal: Signal,
+    writers: Dict[str, StemWriter],
+    peaks: Dict[str, PeakBuilder],
+):
+    """The file is decoded while downloaded and separated while decoded,
+    stems are written to GridFS as soon as their samples are final.
+    """
+    metadata = signal.signal_metadata
+    loop = asyncio.get_event_loop()
+    separation = separator.stream(metadata.sample_rate)
+    decoded = 0
+    frame_length = STREAM_FRAME_SECONDS * metadata.sample_rate
+    async for frames in decode_frames(
+        chunks, metadata.sample_rate, metadata.channels, frame_length
+    ):
+        decoded += len(frames)
+        separated = await loop.run_in_executor(None, separation.push, frames)
+        await _write_stems(db, writers, peaks, separated, signal)
+    if not decoded:
+        raise ValueError(f"Signal file {metadata.filename} has no samples")
+    separated = await loop.run_in_executor(None, separation.close)
+    await _write_stems(db, writers, peaks, separated, signal)
+
+
+async def _discard_stems(
+    db: AsyncIOMotorClient, writers: Dict[str, StemWriter]
+):
+    """Delete the stems of a separation which failed, no signal
+    references them.
+    """
+    # the other stems are discarded even if an abort fails
+    await asyncio.gather(
+        *(writer.abort() for writer in writers.values()),
+        return_exceptions=True,
     )
-    await _update_state(
-        self, db, signal_id, user.username, TaskState.Separated
+    deleted = await release_files(
+        db, [writer.file_id for writer in writers.values() if writer.file_id]
     )
+    await asyncio.gather(*(delete_peaks(db, file_id) for file_id in deleted))
 
-    separated_stems = []
-    separated_stem_id = []
-    for stem_name, separate_signal in separated_signals.items():
-        stem_file_id = get_stem_id(stem_name, signal.signal_id)
-        stem_id = await save_stem_file(
-            db,
-            stem_file_id,
-            separate_signal,
-            signal.signal_metadata.sample_rate,
+
+async def _separate_signal(
+    db: AsyncIOMotorClient, signal: Signal, user: User, stems: int
+) -> Coroutine[Dict[str, str], None, None]:
+    signal_id = signal.signal_id
+
+    signal_type = signal.signal_metadata.signal_type
+    metadata = signal.signal_metadata
+    # by id, file names are chosen by clients and not unique
+    chunks = await read_signal_file_by_id(db, signal.file_id or signal_id)
+    if chunks is None:
+        raise ValueError(f"Signal file {signal_id} not found")
+    await _update_state(db, signal_id, user.username, TaskState.Separating)
+
+    loop = asyncio.get_event_loop()
+    writers = {}
+    peaks = {}
+    try:
+        with lease_separator(signal_type, stems) as separator:
+            await _stream_stems(db, separator, chunks, signal, writers, peaks)
+        await _update_state(db, signal_id, user.username, TaskState.Separated)
+
+        separated_stems = list(writers)
+        separated_stem_id = await _gather_all(
+            *(writer.close() for writer in writers.values())
+        )
+        separated_peaks = await asyncio.gather(
+            *(
+                loop.run_in_executor(None, peaks[stem_name].close)
+                for stem_name in separated_stems
+            )
         )
+        await _gather_all(
+            *(
+                save_peaks(db, stem_id, metadata.sample_rate, levels)
+                for stem_id, levels in zip(separated_stem_id, separated_peaks)
+            )
+        )
+    except BaseException:
+        # e.g. decoding errors, worker shutdown
+        await _discard_stems(db, writers)
+        raise
 
-        separated_stems.append(stem_name)
-        separated_stem_id.append(stem_id)
-        stem = SeparatedSignal(
+    # stem documents, stem ids of the signal and its state in one write
+    stem_docs = [
+        SeparatedSignal(
             signal_id=stem_id,
             signal_metadata=signal.signal_metadata,
             stem_name=stem_name,
+            parent_id=signal_id,
             augmented=False,
+            codec=writers[stem_name].codec,
         )
-
-        await create_stem(db, stem, user.username)
-    await _update_state(self, db, signal_id, user.username, TaskState.Saving)
-
-    # store signal stem ids in original signal
-    await update_signal(
-        db,
-        signal.signal_id,
-        user.username,
-        separated_stems=separated_stems,
-        separated_stem_id=separated_stem_id,
+        for stem_name, stem_id in zip(separated_stems, separated_stem_id)
+    ]
+    completed = await complete_signal(
+        db, signal_id, user.username, stem_docs, TaskState.Complete
     )
-    await _update_state(self, db, signal_id, user.username, TaskState.Complete)
+    if completed is None:
+        # deleted while separating, the stem files went with it
+        await asyncio.gather(
+            *(delete_peaks(db, stem_id) for stem_id in separated_stem_id)
+        )
+        return None
+    return dict(zip(separated_stems, separated_stem_id))